@@ -0,0 +1,391 @@
+"""
+Mackup benchmarks.
+
+Generate synthetic home and storage folders, then time the mackup commands
+on them, end to end and per phase (config parsing, catalog loading and the
+work done for each application).
+
+Usage:
+  bench.py [options] [<scenario>...]
+  bench.py --list
+  bench.py --compare <old> <new>
+  bench.py (-h | --help)
+
+Options:
+  -h --help             Show this screen.
+  --list                List the available scenarios.
+  --apps=<n>            Number of applications, overrides the scenario.
+  --files=<n>           Number of files per application, overrides the
+                        scenario.
+  --depth=<n>           Depth of the folders of each application, overrides
+                        the scenario.
+  --size=<bytes>        Size of each file, overrides the scenario.
+  --repeat=<n>          Number of runs of each scenario, the best is kept
+                        [default: 3].
+  --seed=<n>            Seed of the generated content [default: 42].
+  --output=<file>       Write the results to a JSON file.
+  --compare             Compare two JSON result files.
+
+The results are meant to be compared between commits:
+
+  python benchmarks/bench.py --output before.json
+  git checkout my-branch
+  python benchmarks/bench.py --output after.json
+  python benchmarks/bench.py --compare before.json after.json
+
+Mackup refuses to run as root, so run the benchmarks as a regular user.
+"""
+from __future__ import print_function
+
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from docopt import docopt
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from mackup import application  # noqa: E402
+from mackup import appsdb  # noqa: E402
+from mackup import config  # noqa: E402
+from mackup import main  # noqa: E402
+from mackup import utils  # noqa: E402
+
+
+# Prefix of the generated applications, to not clash with the stock ones
+APP_PREFIX = 'bench-app-'
+
+# Name of the storage folder, relative to the generated home
+STORAGE_DIR = 'storage'
+
+# Available scenarios: number of apps, files per app, folder depth, file size
+SCENARIOS = OrderedDict([
+    ('small', dict(apps=20, files=5, depth=0, size=1024)),
+    ('many-files', dict(apps=20, files=200, depth=2, size=512)),
+    ('deep', dict(apps=20, files=20, depth=8, size=512)),
+    ('large-files', dict(apps=5, files=5, depth=0, size=4 * 1024 * 1024)),
+    ('catalog-10k', dict(apps=10000, files=1, depth=0, size=128)),
+])
+
+# Commands timed for each scenario, in this order
+COMMANDS = ['list', 'backup --dry-run', 'backup', 'restore --dry-run',
+            'restore', 'uninstall']
+
+
+def generate_home(params, seed):
+    """
+    Create a home folder with a catalog of applications and their files.
+
+    Args:
+        params (dict): apps, files, depth and size of the scenario
+        seed (int): Seed of the generated content
+
+    Returns:
+        str: Path of the home folder
+    """
+    rand = random.Random(seed)
+    home = tempfile.mkdtemp(prefix='mackup_bench_')
+    catalog = os.path.join(home, '.mackup')
+    os.makedirs(catalog)
+    os.makedirs(os.path.join(home, STORAGE_DIR))
+
+    app_names = []
+    for app_index in range(params['apps']):
+        app_name = '{}{}'.format(APP_PREFIX, app_index)
+        app_names.append(app_name)
+
+        # Each app has a single folder holding all its files, or a single
+        # file when it only has one
+        if params['files'] == 1 and params['depth'] == 0:
+            paths = ['.{}rc'.format(app_name)]
+            entries = paths
+        else:
+            paths = ['.{}'.format(app_name)]
+            folder = os.path.join(*(['.{}'.format(app_name)] +
+                                    ['level{}'.format(level)
+                                     for level in range(params['depth'])]))
+            entries = [os.path.join(folder, 'file{}'.format(index))
+                       for index in range(params['files'])]
+
+        for entry in entries:
+            filepath = os.path.join(home, entry)
+            if not os.path.isdir(os.path.dirname(filepath)):
+                os.makedirs(os.path.dirname(filepath))
+            with open(filepath, 'wb') as f_entry:
+                f_entry.write(bytearray(rand.getrandbits(8)
+                                        for _ in range(min(params['size'],
+                                                           4096))) *
+                              max(params['size'] // 4096, 1))
+
+        with open(os.path.join(catalog, app_name + '.cfg'), 'w') as f_cfg:
+            f_cfg.write('[application]\nname = {}\n\n'
+                        '[configuration_files]\n{}\n'
+                        .format(app_name, '\n'.join(paths)))
+
+    with open(os.path.join(home, '.mackup.cfg'), 'w') as f_cfg:
+        f_cfg.write('[storage]\nengine = file_system\npath = {}\n\n'
+                    '[applications_to_sync]\n{}\n'
+                    .format(STORAGE_DIR, '\n'.join(app_names)))
+
+    return home
+
+
+def new_home_for(home):
+    """
+    Create an empty home sharing the storage and the catalog of another one.
+
+    Args:
+        home (str): Home folder holding the storage
+
+    Returns:
+        str: Path of the new home folder
+    """
+    new_home = tempfile.mkdtemp(prefix='mackup_bench_')
+    os.symlink(os.path.join(home, STORAGE_DIR),
+               os.path.join(new_home, STORAGE_DIR))
+    shutil.copytree(os.path.join(home, '.mackup'),
+                    os.path.join(new_home, '.mackup'))
+    shutil.copy(os.path.join(home, '.mackup.cfg'), new_home)
+
+    return new_home
+
+
+class PhaseTimer(object):
+
+    """Time the phases of a run by wrapping the functions doing them."""
+
+    # (owner, attribute, phase) of each wrapped function
+    PHASES = [(config.Config, '__init__', 'config parse'),
+              (appsdb.ApplicationsDatabase, '__init__', 'catalog load'),
+              (application.ApplicationProfile, 'backup', 'apps'),
+              (application.ApplicationProfile, 'restore', 'apps'),
+              (application.ApplicationProfile, 'uninstall', 'apps')]
+
+    def __init__(self):
+        """Create a PhaseTimer instance."""
+        self.phases = OrderedDict()
+        self.apps = dict()
+        self._originals = []
+
+    def __enter__(self):
+        """Start timing the phases."""
+        for owner, attribute, phase in self.PHASES:
+            original = getattr(owner, attribute)
+            self._originals.append((owner, attribute, original))
+            setattr(owner, attribute, self._wrap(original, phase))
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop timing the phases."""
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals = []
+
+    def _wrap(self, function, phase):
+        """
+        Wrap a function to add its duration to a phase.
+
+        Args:
+            function (function)
+            phase (str)
+
+        Returns:
+            function
+        """
+        timer = self
+
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.time() - start
+                timer.phases[phase] = timer.phases.get(phase, 0) + duration
+                app_name = getattr(args[0], 'app_name', None)
+                if phase == 'apps' and app_name:
+                    timer.apps[app_name] = (timer.apps.get(app_name, 0) +
+                                            duration)
+
+        return wrapper
+
+
+def run_command(home, command):
+    """
+    Run a mackup command in this process.
+
+    Args:
+        home (str): Home folder to run the command in
+        command (str): e.g. 'backup --dry-run'
+
+    Returns:
+        dict: total duration, duration of each phase and of the slowest apps
+    """
+    os.environ['HOME'] = home
+    os.environ.pop('XDG_CONFIG_HOME', None)
+    sys.argv = ['mackup', '--force'] + command.split()
+    if command == 'list':
+        sys.argv.remove('--force')
+
+    # Each run starts from scratch
+    utils.FORCE_YES = False
+    utils._trash = None
+    utils._executor = None
+
+    stdout = sys.stdout
+    with PhaseTimer() as timer, open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        start = time.time()
+        try:
+            main.main()
+        finally:
+            total = time.time() - start
+            sys.stdout = stdout
+
+    slowest_apps = sorted(timer.apps.items(), key=lambda item: -item[1])[:5]
+
+    return OrderedDict([('total', total),
+                        ('phases', timer.phases),
+                        ('slowest_apps', OrderedDict(slowest_apps))])
+
+
+def run_scenario(params, seed):
+    """
+    Time every command on freshly generated folders.
+
+    backup runs on the generated home, restore and uninstall on a new home
+    sharing its storage, like on a new workstation.
+
+    Args:
+        params (dict): apps, files, depth and size of the scenario
+        seed (int): Seed of the generated content
+
+    Returns:
+        dict: Results of each command
+    """
+    home = generate_home(params, seed)
+    new_home = None
+    results = OrderedDict()
+    try:
+        for command in COMMANDS:
+            if command.startswith('backup') or command == 'list':
+                results[command] = run_command(home, command)
+            else:
+                if new_home is None:
+                    new_home = new_home_for(home)
+                results[command] = run_command(new_home, command)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+        if new_home:
+            shutil.rmtree(new_home, ignore_errors=True)
+
+    return results
+
+
+def best_of(runs):
+    """
+    Keep the fastest run of each command.
+
+    Args:
+        runs (list): Results of run_scenario()
+
+    Returns:
+        dict
+    """
+    return OrderedDict((command, min((run[command] for run in runs),
+                                     key=lambda result: result['total']))
+                       for command in runs[0])
+
+
+def get_commit():
+    """
+    Return the current git commit of Mackup, if any.
+
+    Returns:
+        str or None
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=ROOT_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """
+    Print the evolution of each timing between two result files.
+
+    Args:
+        old_path (str)
+        new_path (str)
+    """
+    with open(old_path) as f_old, open(new_path) as f_new:
+        old = json.load(f_old)
+        new = json.load(f_new)
+
+    print('{:<14} {:<18} {:>10} {:>10} {:>8}'
+          .format('scenario', 'command', 'old (s)', 'new (s)', 'ratio'))
+    for scenario, results in new['scenarios'].items():
+        for command, result in results['commands'].items():
+            try:
+                old_total = (old['scenarios'][scenario]['commands']
+                             [command]['total'])
+            except KeyError:
+                continue
+            print('{:<14} {:<18} {:>10.4f} {:>10.4f} {:>7.2f}x'
+                  .format(scenario, command, old_total, result['total'],
+                          result['total'] / old_total if old_total else 0))
+
+
+def main_bench():
+    """Run the benchmarks."""
+    args = docopt(__doc__)
+
+    if args['--list']:
+        for name, params in SCENARIOS.items():
+            print('{:<14} {}'.format(name, params))
+        return
+
+    if args['--compare']:
+        compare(args['<old>'], args['<new>'])
+        return
+
+    if os.geteuid() == 0:
+        sys.exit("Mackup refuses to run as root, run the benchmarks as a"
+                 " regular user.")
+
+    scenarios = args['<scenario>'] or list(SCENARIOS)
+    results = OrderedDict([('commit', get_commit()),
+                           ('python', platform.python_version()),
+                           ('platform', platform.platform()),
+                           ('scenarios', OrderedDict())])
+
+    for name in scenarios:
+        params = dict(SCENARIOS[name])
+        for param in ['apps', 'files', 'depth', 'size']:
+            if args['--' + param] is not None:
+                params[param] = int(args['--' + param])
+
+        runs = [run_scenario(params, int(args['--seed']))
+                for _ in range(int(args['--repeat']))]
+        results['scenarios'][name] = OrderedDict([('params', params),
+                                                  ('commands', best_of(runs))])
+
+        for command, result in results['scenarios'][name]['commands'].items():
+            print('{:<14} {:<18} {:>8.4f}s'
+                  .format(name, command, result['total']))
+
+    if args['--output']:
+        with open(args['--output'], 'w') as f_output:
+            json.dump(results, f_output, indent=2)
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,215 @@
+"""
+Syscall accounting.
+
+Count the filesystem calls and the processes spawned while Mackup runs,
+per application and per utils function, so tests can check that a run
+stays within a budget.
+
+    with SyscallCounter() as counter:
+        app.restore()
+    assert counter.total('spawn') == 0
+"""
+import os
+import subprocess
+import threading
+from collections import Counter
+
+from six.moves import builtins
+
+
+# Calls counted, with the functions counted for each of them
+CALLS = [('stat', os, 'stat'),
+         ('lstat', os, 'lstat'),
+         ('symlink', os, 'symlink'),
+         ('chmod', os, 'chmod'),
+         ('rename', os, 'rename'),
+         ('unlink', os, 'unlink'),
+         ('unlink', os, 'remove'),
+         ('open', os, 'open'),
+         ('open', builtins, 'open')]
+
+# Counted for each process spawned, e.g. by subprocess.call
+SPAWN = 'spawn'
+
+# Methods of ApplicationProfile working on a single app
+APP_METHODS = ['backup', 'restore', 'uninstall', 'get_conflicts']
+
+# Functions of utils, the innermost one running gets the calls
+UTILS_FUNCTIONS = ['delete',
+                   'copy',
+                   'link',
+                   'replace_with_link',
+                   'chmod',
+                   'is_identical',
+                   'remove_acl',
+                   'remove_immutable_attribute']
+
+
+class SyscallCounter(object):
+
+    """Count syscalls and spawned processes while in use."""
+
+    def __init__(self):
+        """Create a SyscallCounter instance."""
+        # Count of each call, keyed by (app name, utils function, call)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._context = threading.local()
+        self._originals = []
+
+    def __enter__(self):
+        """Start counting."""
+        from . import application
+        from . import utils
+
+        for call, owner, attribute in CALLS:
+            self._patch(owner, attribute, self._counting(call))
+
+        counter = self
+
+        class CountingPopen(subprocess.Popen):
+
+            """Popen counting the processes it spawns."""
+
+            def __init__(self, *args, **kwargs):
+                counter.add(SPAWN)
+                super(CountingPopen, self).__init__(*args, **kwargs)
+
+        self._patch(subprocess, 'Popen', lambda original: CountingPopen)
+
+        for method in APP_METHODS:
+            self._patch(application.ApplicationProfile, method,
+                        self._in_context('app'))
+        for function in UTILS_FUNCTIONS:
+            self._patch(utils, function, self._in_context('function'))
+
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop counting."""
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals = []
+
+    def add(self, call):
+        """
+        Count a call, for the current app and utils function.
+
+        Args:
+            call (str): e.g. 'stat' or SPAWN
+        """
+        key = (getattr(self._context, 'app', None),
+               getattr(self._context, 'function', None),
+               call)
+        with self._lock:
+            self.counts[key] += 1
+
+    def total(self, call, app=None, function=None):
+        """
+        Return how many times a call has been made.
+
+        Args:
+            call (str): e.g. 'stat' or SPAWN
+            app (str): Only count the calls made for this application
+            function (str): Only count the calls made by this utils function
+
+        Returns:
+            int
+        """
+        return sum(count for (cur_app, cur_function, cur_call), count
+                   in self.counts.items()
+                   if cur_call == call and
+                   app in (None, cur_app) and
+                   function in (None, cur_function))
+
+    def by_app(self):
+        """
+        Return the counts per application.
+
+        Returns:
+            dict: Counter of each call, per app name
+        """
+        return self._group(0)
+
+    def by_function(self):
+        """
+        Return the counts per utils function.
+
+        Returns:
+            dict: Counter of each call, per function name
+        """
+        return self._group(1)
+
+    def _group(self, index):
+        """
+        Group the counts by a part of their key.
+
+        Args:
+            index (int): Index of the key part
+
+        Returns:
+            dict of Counter
+        """
+        groups = dict()
+        for key, count in self.counts.items():
+            groups.setdefault(key[index], Counter())[key[2]] += count
+
+        return groups
+
+    def _patch(self, owner, attribute, make_replacement):
+        """
+        Replace an attribute, remembering the original one.
+
+        Args:
+            owner: Module or class holding the attribute
+            attribute (str)
+            make_replacement (function): Returns the replacement, given the
+                                         original
+        """
+        original = getattr(owner, attribute)
+        self._originals.append((owner, attribute, original))
+        setattr(owner, attribute, make_replacement(original))
+
+    def _counting(self, call):
+        """
+        Return a wrapper factory counting each call.
+
+        Args:
+            call (str)
+
+        Returns:
+            function
+        """
+        def make_replacement(original):
+            def counting(*args, **kwargs):
+                self.add(call)
+                return original(*args, **kwargs)
+            return counting
+
+        return make_replacement
+
+    def _in_context(self, context):
+        """
+        Return a wrapper factory recording the app or function running.
+
+        Args:
+            context (str): 'app' or 'function'
+
+        Returns:
+            function
+        """
+        def make_replacement(original):
+            def in_context(*args, **kwargs):
+                if context == 'app':
+                    value = args[0].app_name
+                else:
+                    value = original.__name__
+                previous = getattr(self._context, context, None)
+                setattr(self._context, context, value)
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    setattr(self._context, context, previous)
+            return in_context
+
+        return make_replacement
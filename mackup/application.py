@@ -5,22 +5,50 @@ An Application Profile contains all the information about an application in
 Mackup. Name, files, ...
 """
 import os
-
+import stat
+from collections import namedtuple
+
+from .constants import (MODE_BACKUP,
+                        MODE_UNINSTALL,
+                        OUTCOME_APP_RUNNING,
+                        OUTCOME_BACKED_UP,
+                        OUTCOME_BROKEN_LINK,
+                        OUTCOME_CONFLICT,
+                        OUTCOME_MISSING,
+                        OUTCOME_RESTORED,
+                        OUTCOME_REVERTED,
+                        OUTCOME_SKIPPED,
+                        OUTCOME_UP_TO_DATE)
 from .mackup import Mackup
+from . import engines
+from . import metrics
+from . import policy
 from . import utils
 
 
+# What a run did with a file of an application, status is an OUTCOME_*
+Outcome = namedtuple('Outcome', ['app_name', 'filename', 'home_filepath',
+                                 'mackup_filepath', 'status'])
+
+
 class ApplicationProfile(object):
 
     """Instantiate this class with application specific data."""
 
-    def __init__(self, mackup, files, dry_run, verbose):
+    def __init__(self, mackup, files, dry_run, verbose, app_name=None,
+                 quiet=False, home=None, check_running=True):
         """
         Create an ApplicationProfile instance.
 
         Args:
             mackup (Mackup)
             files (list)
+            app_name (str): Used to find the conflict policy of the app
+            quiet (bool): Only record the outcomes, don't print anything
+            home (str): Home folder to work on, defaults to the one of
+                        mackup, see Mackup.set_home()
+            check_running (bool): Leave the app alone while its processes
+                                  run, unless the user wants to go on
         """
         assert isinstance(mackup, Mackup)
         assert isinstance(files, set)
@@ -29,6 +57,12 @@ class ApplicationProfile(object):
         self.files = list(files)
         self.dry_run = dry_run
         self.verbose = verbose
+        self.app_name = app_name
+        self.quiet = quiet
+        self.home = home or mackup.home
+        self.excluded_files = mackup.get_excluded_files(app_name)
+        self.check_running = check_running
+        self.outcomes = []
 
     def getFilepaths(self, filename):
         """
@@ -40,9 +74,402 @@ class ApplicationProfile(object):
         Returns:
             home_filepath, mackup_filepath (str, str)
         """
-        return (os.path.join(os.environ['HOME'], filename),
+        return (os.path.join(self.home, filename),
                 os.path.join(self.mackup.mackup_folder, filename))
 
+    def getExcluded(self, root, filename):
+        """
+        Get the function telling if a path in a synced folder is excluded.
+
+        Args:
+            root (str): Full path of the folder, in the home or in the
+                        Mackup folder
+            filename (str): Path of the folder, relative to the home
+
+        Returns:
+            function, or None if the application excludes nothing
+        """
+        return utils.get_excluded(self.excluded_files, root, filename)
+
+    def copy(self, filename, src, dst):
+        """
+        Copy a file or a folder the fastest safe way the storage allows.
+
+        The copies share their blocks with the originals when the storage
+        engine allows reflinks and they are on the same device. The copies
+        made in the Mackup folder are renamed into place once complete when
+        the engine supports renames, so the sync client never uploads half
+        of a file.
+
+        Args:
+            filename (str): Path of the file, relative to the home
+            src (str): Full path of the file to copy
+            dst (str): Full path of the copy
+        """
+        capabilities = self.mackup.capabilities
+        utils.copy(src, dst, self.getExcluded(src, filename),
+                   clone=(engines.CAP_REFLINK in capabilities and
+                          self._is_same_device(src, dst)),
+                   atomic=(engines.CAP_RENAME in capabilities and
+                           dst.startswith(os.path.join(
+                               self.mackup.mackup_folder, ''))))
+
+    def _is_same_device(self, src, dst):
+        """
+        Check if a copy would be on the same device as its source.
+
+        Only checked on the filesystem when the engine can't tell.
+
+        Args:
+            src (str)
+            dst (str): Might not exist yet
+
+        Returns:
+            bool
+        """
+        if engines.CAP_SAME_DEVICE in self.mackup.capabilities:
+            return True
+
+        folder = os.path.dirname(dst)
+        while not os.path.isdir(folder):
+            folder = os.path.dirname(folder)
+
+        return os.stat(src).st_dev == os.stat(folder).st_dev
+
+    def get_conflicts(self, restore=False):
+        """
+        Get the files that exist both in the home and in the Mackup folder.
+
+        Args:
+            restore (bool): List the conflicts of a restore, of a backup
+                            otherwise
+
+        Returns:
+            list of (app_name, filename, home_filepath, mackup_filepath,
+            excluded), excluded telling if a path in the home_filepath
+            folder is excluded, see getExcluded()
+        """
+        conflicts = []
+        for filename in self.files:
+            (home_filepath, mackup_filepath) = self.getFilepaths(filename)
+
+            if restore:
+                conflict = (self._needs_restore(filename, home_filepath,
+                                                mackup_filepath) and
+                            os.path.exists(home_filepath))
+            else:
+                conflict = (self._needs_backup(filename, home_filepath,
+                                               mackup_filepath) and
+                            os.path.exists(mackup_filepath))
+            # Only its new entries are linked, see utils.link_entries()
+            conflict = conflict and not self._is_partly_linked(
+                filename, home_filepath, mackup_filepath)
+
+            if conflict:
+                conflicts.append((self.app_name, filename, home_filepath,
+                                  mackup_filepath,
+                                  self.getExcluded(home_filepath, filename)))
+
+        return conflicts
+
+    def get_copies(self, mode):
+        """
+        Get the files a run would copy, to estimate its cost.
+
+        A backup copies the files of the home to the Mackup folder, an
+        uninstall copies them back. A restore only creates links.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+
+        Returns:
+            list of (filename, src, dst)
+        """
+        copies = []
+        for filename in self.files:
+            (home_filepath, mackup_filepath) = self.getFilepaths(filename)
+
+            if mode == MODE_BACKUP:
+                if self._needs_backup(filename, home_filepath,
+                                      mackup_filepath):
+                    copies.append((filename, home_filepath, mackup_filepath))
+            elif mode == MODE_UNINSTALL:
+                if ((os.path.isfile(mackup_filepath) or
+                     os.path.isdir(mackup_filepath)) and
+                        os.path.exists(home_filepath)):
+                    copies.append((filename, mackup_filepath, home_filepath))
+
+        return copies
+
+    def _needs_backup(self, filename, home_filepath, mackup_filepath):
+        """
+        Check if a file exists and is not already a link pointing to Mackup.
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+
+        Returns:
+            bool
+        """
+        return self._get_backup_skip(filename, home_filepath,
+                                     mackup_filepath) is None
+
+    def _get_backup_skip(self, filename, home_filepath, mackup_filepath):
+        """
+        Tell why a file should not be backed up, if it should not.
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+
+        Returns:
+            str: An OUTCOME_* constant, None if the file needs a backup
+        """
+        # Each path is only looked up once, this runs for every file
+        try:
+            home_stat = os.stat(home_filepath)
+        except OSError:
+            if os.path.islink(home_filepath):
+                return OUTCOME_BROKEN_LINK
+            return OUTCOME_MISSING
+
+        if not (stat.S_ISREG(home_stat.st_mode) or
+                stat.S_ISDIR(home_stat.st_mode)):
+            return OUTCOME_SKIPPED
+
+        if not os.path.islink(home_filepath):
+            if (stat.S_ISDIR(home_stat.st_mode) and
+                    self._is_linked(filename, home_filepath,
+                                    mackup_filepath)):
+                return OUTCOME_UP_TO_DATE
+            return None
+
+        try:
+            mackup_stat = os.stat(mackup_filepath)
+        except OSError:
+            return None
+
+        if _is_same_file(home_stat, mackup_stat):
+            return OUTCOME_UP_TO_DATE
+
+        return None
+
+    def _needs_restore(self, filename, home_filepath, mackup_filepath):
+        """
+        Check if a backuped file should be linked in the home.
+
+        If the file exists and is not already pointing to the mackup file
+        and the folder makes sense on the current platform (Don't sync
+        any subfolder of ~/Library on GNU/Linux)
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+
+        Returns:
+            bool
+        """
+        return self._get_restore_skip(filename, home_filepath,
+                                      mackup_filepath) is None
+
+    def _get_restore_skip(self, filename, home_filepath, mackup_filepath):
+        """
+        Tell why a backuped file should not be linked, if it should not.
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+
+        Returns:
+            str: An OUTCOME_* constant, None if the file needs a restore
+        """
+        # Each path is only looked up once, this runs for every file
+        try:
+            mackup_stat = os.stat(mackup_filepath)
+        except OSError:
+            return OUTCOME_MISSING
+
+        if not (stat.S_ISREG(mackup_stat.st_mode) or
+                stat.S_ISDIR(mackup_stat.st_mode)):
+            return OUTCOME_SKIPPED
+
+        if not utils.can_file_be_synced_on_current_platform(filename,
+                                                            self.home):
+            return OUTCOME_SKIPPED
+
+        if not os.path.islink(home_filepath):
+            if (stat.S_ISDIR(mackup_stat.st_mode) and
+                    self._is_linked(filename, home_filepath,
+                                    mackup_filepath)):
+                return OUTCOME_UP_TO_DATE
+            return None
+
+        try:
+            home_stat = os.stat(home_filepath)
+        except OSError:
+            # A broken link
+            return None
+
+        if _is_same_file(home_stat, mackup_stat):
+            return OUTCOME_UP_TO_DATE
+
+        return None
+
+    def _is_linked(self, filename, home_filepath, mackup_filepath):
+        """
+        Check if a folder of the home holding excluded entries is linked.
+
+        Args:
+            filename (str)
+            home_filepath (str): A folder, not a link
+            mackup_filepath (str)
+
+        Returns:
+            bool
+        """
+        excluded = self.getExcluded(home_filepath, filename)
+        return (excluded is not None and
+                utils.is_linked(mackup_filepath, home_filepath, excluded))
+
+    def _is_partly_linked(self, filename, home_filepath, mackup_filepath):
+        """
+        Check if some entries of a folder of the home are linked to Mackup.
+
+        Such a folder holds excluded entries, the others are linked one by
+        one. Its entries created since are linked without any conflict.
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+
+        Returns:
+            bool
+        """
+        return (self.getExcluded(home_filepath, filename) is not None and
+                os.path.isdir(mackup_filepath) and
+                utils.has_links_to(home_filepath, mackup_filepath))
+
+    def _print(self, message):
+        """
+        Print a message, unless quiet.
+
+        Args:
+            message (str)
+        """
+        if not self.quiet:
+            print(message)
+
+    def _add_outcome(self, filename, home_filepath, mackup_filepath, status):
+        """
+        Record what has been done with a file.
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+            status (str): One of the OUTCOME_* constants
+        """
+        self.outcomes.append(Outcome(self.app_name, filename, home_filepath,
+                                     mackup_filepath, status))
+
+    def _print_skip(self, status, up_to_date_message, source_filepath):
+        """
+        Print why a file is skipped, if verbose.
+
+        Args:
+            status (str): An OUTCOME_* constant
+            up_to_date_message (str): Printed if the file is up to date
+            source_filepath (str): Path that must exist to do something
+        """
+        if not self.verbose:
+            return
+
+        if status == OUTCOME_UP_TO_DATE:
+            self._print(up_to_date_message)
+        elif status == OUTCOME_BROKEN_LINK:
+            self._print("Doing nothing\n  {}\n  "
+                        "is a broken link, you might want to fix it."
+                        .format(source_filepath))
+        elif status == OUTCOME_MISSING:
+            self._print("Doing nothing\n  {}\n  does not exist"
+                        .format(source_filepath))
+        else:
+            self._print("Doing nothing\n  {}\n  can't be synced here"
+                        .format(source_filepath))
+
+    def _is_running(self):
+        """
+        Check if the application runs, and should be left alone.
+
+        A running application can overwrite the files Mackup replaces, and
+        corrupt them. The user is asked if Mackup should go on, a run that
+        can't ask skips the application. A dry run only warns.
+
+        Returns:
+            bool: True if the application is skipped
+        """
+        if not self.check_running:
+            return False
+
+        running = self.mackup.get_running_processes(self.app_name)
+        if not running:
+            return False
+
+        message = ("{} is running ({}), it might overwrite its files while"
+                   " I work on them."
+                   .format(self.mackup.app_db.get_name(self.app_name),
+                           ', '.join(running)))
+        if self.dry_run:
+            self._print("Warning: " + message)
+            return False
+        if self.mackup.interactive and utils.confirm(
+                message + "\nDo you want to go on anyway ?"):
+            return False
+
+        self._print("Skipping {}, close it and run me again."
+                    .format(self.app_name))
+        for filename in self.files:
+            (home_filepath, mackup_filepath) = self.getFilepaths(filename)
+            self._add_outcome(filename, home_filepath, mackup_filepath,
+                              OUTCOME_APP_RUNNING)
+
+        return True
+
+    def _resolve_conflict(self, filename, home_filepath, mackup_filepath,
+                          question, replace_decision):
+        """
+        Decide what to do with a conflict, asking the user if needed.
+
+        Args:
+            filename (str)
+            home_filepath (str)
+            mackup_filepath (str)
+            question (str): What to ask if no policy solves the conflict
+            replace_decision (str): Decision taken if the user answers yes
+
+        Returns:
+            One of the policy.DECISION_* constants, DECISION_ASK only when
+            the conflict needs an answer but Mackup can't ask
+        """
+        metrics.add('conflicts')
+        decision = self.mackup.conflict_policy.resolve(
+            self.app_name, filename, home_filepath, mackup_filepath,
+            self.getExcluded(home_filepath, filename))
+
+        if decision == policy.DECISION_ASK and self.mackup.interactive:
+            if utils.confirm(question):
+                decision = replace_decision
+            else:
+                decision = policy.DECISION_SKIP
+
+        return decision
+
     def backup(self):
         """
         Backup the application config files.
@@ -51,83 +478,139 @@ class ApplicationProfile(object):
             if exists home/file
               if home/file is a real file
                 if exists mackup/file
-                  are you sure ?
+                  are you sure ? (unless a conflict policy decides)
                   if sure
                     rm mackup/file
-                    mv home/file mackup/file
-                    link mackup/file home/file
+                    cp home/file mackup/file
+                    replace home/file with a link to mackup/file
                 else
-                  mv home/file mackup/file
-                  link mackup/file home/file
+                  cp home/file mackup/file
+                  replace home/file with a link to mackup/file
+
+        When the backup is staged, home/file is copied in the staging folder
+        instead, the rest waits for the commit, see Mackup.start_staging().
         """
+        metrics.add('paths', len(self.files))
+
+        if self._is_running():
+            return
+
         # For each file used by the application
         for filename in self.files:
             (home_filepath, mackup_filepath) = self.getFilepaths(filename)
 
             # If the file exists and is not already a link pointing to Mackup
-            if ((os.path.isfile(home_filepath) or
-                 os.path.isdir(home_filepath)) and
-                not (os.path.islink(home_filepath) and
-                     (os.path.isfile(mackup_filepath) or
-                      os.path.isdir(mackup_filepath)) and
-                     os.path.samefile(home_filepath,
-                                      mackup_filepath))):
-
-                if self.verbose:
-                    print("Backing up\n  {}\n  to\n  {} ..."
-                          .format(home_filepath, mackup_filepath))
+            status = self._get_backup_skip(filename, home_filepath,
+                                           mackup_filepath)
+            if status is not None:
+                self._print_skip(
+                    status,
+                    "Doing nothing\n  {}\n  is already backed up to\n  {}"
+                    .format(home_filepath, mackup_filepath),
+                    home_filepath)
+                self._add_outcome(filename, home_filepath, mackup_filepath,
+                                  status)
+                continue
+
+            if self.verbose:
+                self._print("Backing up\n  {}\n  to\n  {} ..."
+                            .format(home_filepath, mackup_filepath))
+            else:
+                self._print("Backing up {} ...".format(filename))
+
+            if self.dry_run:
+                self._add_outcome(filename, home_filepath, mackup_filepath,
+                                  OUTCOME_BACKED_UP)
+                continue
+
+            if self._is_partly_linked(filename, home_filepath,
+                                      mackup_filepath):
+                # Link the new entries, see utils.link_entries()
+                utils.replace_with_link(
+                    mackup_filepath, home_filepath,
+                    self.getExcluded(home_filepath, filename))
+                status = OUTCOME_BACKED_UP
+            # Check if we already have a backup
+            elif os.path.exists(mackup_filepath):
+
+                # Name it right
+                if os.path.isfile(mackup_filepath):
+                    file_type = 'file'
+                elif os.path.isdir(mackup_filepath):
+                    file_type = 'folder'
+                elif os.path.islink(mackup_filepath):
+                    file_type = 'link'
                 else:
-                    print("Backing up {} ...".format(filename))
-
-                if self.dry_run:
-                    continue
-
-                # Check if we already have a backup
-                if os.path.exists(mackup_filepath):
-
-                    # Name it right
-                    if os.path.isfile(mackup_filepath):
-                        file_type = 'file'
-                    elif os.path.isdir(mackup_filepath):
-                        file_type = 'folder'
-                    elif os.path.islink(mackup_filepath):
-                        file_type = 'link'
+                    raise ValueError("Unsupported file: {}"
+                                     .format(mackup_filepath))
+
+                # Ask the user if he really want to replace it, unless a
+                # policy tells what to do
+                decision = self._resolve_conflict(
+                    filename, home_filepath, mackup_filepath,
+                    "A {} named {} already exists in the backup.\n"
+                    "Are you sure that you want to replace it ?"
+                    .format(file_type, mackup_filepath),
+                    policy.DECISION_KEEP_HOME)
+
+                if decision == policy.DECISION_KEEP_HOME:
+                    if self.mackup.staging is not None:
+                        # The backup is replaced on commit
+                        self._stage(filename, home_filepath, mackup_filepath)
                     else:
-                        raise ValueError("Unsupported file: {}"
-                                         .format(mackup_filepath))
-
-                    # Ask the user if he really want to replace it
-                    if utils.confirm("A {} named {} already exists in the"
-                                     " backup.\nAre you sure that you want to"
-                                     " replace it ?"
-                                     .format(file_type, mackup_filepath)):
                         # Delete the file in Mackup
                         utils.delete(mackup_filepath)
                         # Copy the file
-                        utils.copy(home_filepath, mackup_filepath)
-                        # Delete the file in the home
-                        utils.delete(home_filepath)
-                        # Link the backuped file to its original place
-                        utils.link(mackup_filepath, home_filepath)
+                        self.copy(filename, home_filepath, mackup_filepath)
+                        # Replace the file in the home by a link to the
+                        # backuped file
+                        utils.replace_with_link(
+                            mackup_filepath, home_filepath,
+                            self.getExcluded(home_filepath, filename))
+                    status = OUTCOME_BACKED_UP
+                elif decision == policy.DECISION_KEEP_BACKUP:
+                    # Drop the file in the home for the backuped one
+                    utils.replace_with_link(
+                        mackup_filepath, home_filepath,
+                        self.getExcluded(home_filepath, filename))
+                    status = OUTCOME_RESTORED
+                elif decision == policy.DECISION_ASK:
+                    status = OUTCOME_CONFLICT
                 else:
-                    # Copy the file
-                    utils.copy(home_filepath, mackup_filepath)
-                    # Delete the file in the home
-                    utils.delete(home_filepath)
-                    # Link the backuped file to its original place
-                    utils.link(mackup_filepath, home_filepath)
-            elif self.verbose:
-                if os.path.exists(home_filepath):
-                    print("Doing nothing\n  {}\n  "
-                          "is already backed up to\n  {}"
-                          .format(home_filepath, mackup_filepath))
-                elif os.path.islink(home_filepath):
-                    print("Doing nothing\n  {}\n  "
-                          "is a broken link, you might want to fix it."
-                          .format(home_filepath))
-                else:
-                    print("Doing nothing\n  {}\n  does not exist"
-                          .format(home_filepath))
+                    status = OUTCOME_SKIPPED
+            elif self.mackup.staging is not None:
+                self._stage(filename, home_filepath, mackup_filepath)
+                status = OUTCOME_BACKED_UP
+            else:
+                # Copy the file
+                self.copy(filename, home_filepath, mackup_filepath)
+                # Replace the file in the home by a link to the backuped file
+                utils.replace_with_link(
+                    mackup_filepath, home_filepath,
+                    self.getExcluded(home_filepath, filename))
+                status = OUTCOME_BACKED_UP
+
+            self._add_outcome(filename, home_filepath, mackup_filepath,
+                              status)
+
+    def _stage(self, filename, home_filepath, mackup_filepath):
+        """
+        Copy a file of the home in the staging folder of the run.
+
+        It is moved into the Mackup folder, and the file of the home replaced
+        with a link to it, when the staged backup is committed.
+
+        Args:
+            filename (str): Path relative to the home, e.g. '.bashrc'
+            home_filepath (str): File or folder of the home
+            mackup_filepath (str): Its backup in the Mackup folder
+        """
+        staged_filepath, to_copy = self.mackup.staging.add(
+            filename, home_filepath, mackup_filepath,
+            self.getExcluded(home_filepath, filename))
+        # Already copied by another application syncing it
+        if to_copy:
+            self.copy(filename, home_filepath, staged_filepath)
 
     def restore(self):
         """
@@ -136,13 +619,17 @@ class ApplicationProfile(object):
         Algorithm:
             if exists mackup/file
               if exists home/file
-                are you sure ?
+                are you sure ? (unless a conflict policy decides)
                 if sure
-                  rm home/file
-                  link mackup/file home/file
+                  replace home/file with a link to mackup/file
               else
                 link mackup/file home/file
         """
+        metrics.add('paths', len(self.files))
+
+        if self._is_running():
+            return
+
         # For each file used by the application
         for filename in self.files:
             (home_filepath, mackup_filepath) = self.getFilepaths(filename)
@@ -150,56 +637,75 @@ class ApplicationProfile(object):
             # If the file exists and is not already pointing to the mackup file
             # and the folder makes sense on the current platform (Don't sync
             # any subfolder of ~/Library on GNU/Linux)
-            file_or_dir_exists = (os.path.isfile(mackup_filepath) or
-                                  os.path.isdir(mackup_filepath))
-            pointing_to_mackup = (os.path.islink(home_filepath) and
-                                  os.path.exists(mackup_filepath) and
-                                  os.path.samefile(mackup_filepath,
-                                                   home_filepath))
-            supported = utils.can_file_be_synced_on_current_platform(filename)
-
-            if file_or_dir_exists and not pointing_to_mackup and supported:
-                if self.verbose:
-                    print("Restoring\n  linking {}\n  to      {} ..."
-                          .format(home_filepath, mackup_filepath))
+            status = self._get_restore_skip(filename, home_filepath,
+                                            mackup_filepath)
+            if status is not None:
+                self._print_skip(
+                    status,
+                    "Doing nothing\n  {}\n  already linked by\n  {}"
+                    .format(mackup_filepath, home_filepath),
+                    mackup_filepath)
+                self._add_outcome(filename, home_filepath, mackup_filepath,
+                                  status)
+                continue
+
+            if self.verbose:
+                self._print("Restoring\n  linking {}\n  to      {} ..."
+                            .format(home_filepath, mackup_filepath))
+            else:
+                self._print("Restoring {} ...".format(filename))
+
+            if self.dry_run:
+                self._add_outcome(filename, home_filepath, mackup_filepath,
+                                  OUTCOME_RESTORED)
+                continue
+
+            if self._is_partly_linked(filename, home_filepath,
+                                      mackup_filepath):
+                # Link the new entries, see utils.link_entries()
+                utils.replace_with_link(
+                    mackup_filepath, home_filepath,
+                    self.getExcluded(home_filepath, filename))
+                status = OUTCOME_RESTORED
+            # Check if there is already a file in the home folder
+            elif os.path.exists(home_filepath):
+                # Name it right
+                if os.path.isfile(home_filepath):
+                    file_type = 'file'
+                elif os.path.isdir(home_filepath):
+                    file_type = 'folder'
+                elif os.path.islink(home_filepath):
+                    file_type = 'link'
                 else:
-                    print("Restoring {} ...".format(filename))
+                    raise ValueError("Unsupported file: {}"
+                                     .format(mackup_filepath))
+
+                decision = self._resolve_conflict(
+                    filename, home_filepath, mackup_filepath,
+                    "You already have a {} named {} in your home.\n"
+                    "Do you want to replace it with your backup ?"
+                    .format(file_type, filename),
+                    policy.DECISION_KEEP_BACKUP)
+
+                if decision == policy.DECISION_KEEP_BACKUP:
+                    utils.replace_with_link(
+                        mackup_filepath, home_filepath,
+                        self.getExcluded(home_filepath, filename))
+                    status = OUTCOME_RESTORED
+                elif decision == policy.DECISION_ASK:
+                    status = OUTCOME_CONFLICT
+                else:
+                    status = OUTCOME_SKIPPED
+            else:
+                # Links are created in batch, once every file is checked
+                utils.link_later(mackup_filepath, home_filepath)
+                status = OUTCOME_RESTORED
 
-                if self.dry_run:
-                    continue
+            self._add_outcome(filename, home_filepath, mackup_filepath,
+                              status)
 
-                # Check if there is already a file in the home folder
-                if os.path.exists(home_filepath):
-                    # Name it right
-                    if os.path.isfile(home_filepath):
-                        file_type = 'file'
-                    elif os.path.isdir(home_filepath):
-                        file_type = 'folder'
-                    elif os.path.islink(home_filepath):
-                        file_type = 'link'
-                    else:
-                        raise ValueError("Unsupported file: {}"
-                                         .format(mackup_filepath))
-
-                    if utils.confirm("You already have a {} named {} in your"
-                                     " home.\nDo you want to replace it with"
-                                     " your backup ?"
-                                     .format(file_type, filename)):
-                        utils.delete(home_filepath)
-                        utils.link(mackup_filepath, home_filepath)
-                else:
-                    utils.link(mackup_filepath, home_filepath)
-            elif self.verbose:
-                if os.path.exists(home_filepath):
-                    print("Doing nothing\n  {}\n  already linked by\n  {}"
-                          .format(mackup_filepath, home_filepath))
-                elif os.path.islink(home_filepath):
-                    print("Doing nothing\n  {}\n  "
-                          "is a broken link, you might want to fix it."
-                          .format(home_filepath))
-                else:
-                    print("Doing nothing\n  {}\n  does not exist"
-                          .format(mackup_filepath))
+        # Create the links, grouped by folder
+        utils.get_executor().run()
 
     def uninstall(self):
         """
@@ -216,6 +722,11 @@ class ApplicationProfile(object):
             delete the mackup folder
             print how to delete mackup
         """
+        metrics.add('paths', len(self.files))
+
+        if self._is_running():
+            return
+
         # For each file used by the application
         for filename in self.files:
             (home_filepath, mackup_filepath) = self.getFilepaths(filename)
@@ -226,20 +737,48 @@ class ApplicationProfile(object):
                 # Check if there is a corresponding file in the home folder
                 if os.path.exists(home_filepath):
                     if self.verbose:
-                        print("Reverting {}\n  at {} ..."
-                              .format(mackup_filepath, home_filepath))
+                        self._print("Reverting {}\n  at {} ..."
+                                    .format(mackup_filepath, home_filepath))
                     else:
-                        print("Reverting {} ...".format(filename))
+                        self._print("Reverting {} ...".format(filename))
+
+                    if not self.dry_run:
+                        # If there is, delete it as we are gonna copy the
+                        # Dropbox one there
+                        trashed = utils.delete(home_filepath)
+
+                        # Copy the Dropbox file to the home folder
+                        self.copy(filename, mackup_filepath, home_filepath)
+
+                        # Excluded entries of a folder of the home were
+                        # never backed up
+                        excluded = self.getExcluded(home_filepath, filename)
+                        if excluded is not None and trashed is not None:
+                            utils.keep_excluded(trashed, home_filepath,
+                                                excluded)
+
+                    status = OUTCOME_REVERTED
+                else:
+                    status = OUTCOME_MISSING
+            else:
+                if self.verbose:
+                    self._print("Doing nothing, {} does not exist"
+                                .format(mackup_filepath))
+                status = OUTCOME_MISSING
+
+            self._add_outcome(filename, home_filepath, mackup_filepath,
+                              status)
+
 
-                    if self.dry_run:
-                        continue
+def _is_same_file(stat_a, stat_b):
+    """
+    Check if two stat results are about the same file.
 
-                    # If there is, delete it as we are gonna copy the Dropbox
-                    # one there
-                    utils.delete(home_filepath)
+    Args:
+        stat_a (os.stat_result)
+        stat_b (os.stat_result)
 
-                    # Copy the Dropbox file to the home folder
-                    utils.copy(mackup_filepath, home_filepath)
-            elif self.verbose:
-                print("Doing nothing, {} does not exist"
-                      .format(mackup_filepath))
+    Returns:
+        bool
+    """
+    return (stat_a.st_dev, stat_a.st_ino) == (stat_b.st_dev, stat_b.st_ino)
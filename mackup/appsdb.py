@@ -14,12 +14,14 @@ except ImportError:
 
 from .constants import APPS_DIR
 from .constants import CUSTOM_APPS_DIR
+from . import tracing
 
 
 class ApplicationsDatabase(object):
 
     """Database containing all the configured applications."""
 
+    @tracing.traced('phase', 'catalog load')
     def __init__(self):
         """Create a ApplicationsDatabase instance."""
         # Build the dict that will contain the properties of each application
@@ -44,6 +46,17 @@ class ApplicationsDatabase(object):
                 app_pretty_name = config.get('application', 'name')
                 self.apps[app_name]['name'] = app_pretty_name
 
+                # Add the priority, apps with a higher one run first when
+                # nothing else decides
+                self.apps[app_name]['priority'] = 0
+                if config.has_option('application', 'priority'):
+                    try:
+                        self.apps[app_name]['priority'] = config.getint(
+                            'application', 'priority')
+                    except ValueError:
+                        raise ValueError('Invalid priority in {}'
+                                         .format(config_file))
+
                 # Add the configuration files to sync
                 self.apps[app_name]['configuration_files'] = set()
                 if config.has_section('configuration_files'):
@@ -73,6 +86,24 @@ class ApplicationsDatabase(object):
                         (self.apps[app_name]['configuration_files']
                             .add(path))
 
+                # Add the patterns of the files to skip in the synced folders
+                self.apps[app_name]['excluded_files'] = set()
+                if config.has_section('excluded_files'):
+                    for pattern in config.options('excluded_files'):
+                        self.apps[app_name]['excluded_files'].add(pattern)
+
+                # Add the names of the processes of the app
+                self.apps[app_name]['processes'] = set()
+                if config.has_section('processes'):
+                    for process_name in config.options('processes'):
+                        self.apps[app_name]['processes'].add(process_name)
+
+                # Add the applications to run before this one
+                self.apps[app_name]['dependencies'] = set()
+                if config.has_section('dependencies'):
+                    for dependency in config.options('dependencies'):
+                        self.apps[app_name]['dependencies'].add(dependency)
+
     @staticmethod
     def get_config_files():
         """
@@ -141,6 +172,54 @@ class ApplicationsDatabase(object):
         """
         return self.apps[name]['configuration_files']
 
+    def get_excluded_files(self, name):
+        """
+        Return the patterns of the files excluded from an application.
+
+        Args:
+            name (str)
+
+        Returns:
+            set of str.
+        """
+        return self.apps[name]['excluded_files']
+
+    def get_processes(self, name):
+        """
+        Return the names of the processes of an application.
+
+        Args:
+            name (str)
+
+        Returns:
+            set of str.
+        """
+        return self.apps[name]['processes']
+
+    def get_priority(self, name):
+        """
+        Return the priority of an application, 0 by default.
+
+        Args:
+            name (str)
+
+        Returns:
+            int
+        """
+        return self.apps[name]['priority']
+
+    def get_dependencies(self, name):
+        """
+        Return the names of the applications to run before an application.
+
+        Args:
+            name (str)
+
+        Returns:
+            set of str.
+        """
+        return self.apps[name]['dependencies']
+
     def get_app_names(self):
         """
         Return application names.
@@ -6,18 +6,10 @@ import os.path
 from .constants import (MACKUP_BACKUP_PATH,
                         MACKUP_CONFIG_FILE,
                         ENGINE_DROPBOX,
-                        ENGINE_GDRIVE,
-                        ENGINE_COPY,
-                        ENGINE_ICLOUD,
-                        ENGINE_BOX,
-                        ENGINE_FS)
-
-from .utils import (error,
-                    get_dropbox_folder_location,
-                    get_copy_folder_location,
-                    get_google_drive_folder_location,
-                    get_icloud_folder_location,
-                    get_box_folder_location)
+                        POLICIES)
+from . import engines
+from .errors import MackupError
+from . import tracing
 try:
     import configparser
 except ImportError:
@@ -28,6 +20,7 @@ class Config(object):
 
     """The Mackup Config class."""
 
+    @tracing.traced('phase', 'config parse')
     def __init__(self, filename=None):
         """
         Create a Config instance.
@@ -50,28 +43,51 @@ class Config(object):
         # Get the path where the Mackup folder is
         self._path = self._parse_path()
 
+        # Get what the storage engine can do
+        self._capabilities = engines.get_engine(self._engine).CAPABILITIES
+
         # Get the directory replacing 'Mackup', if any
         self._directory = self._parse_directory()
 
+        # Do backups go through a staging folder ?
+        self._staging = self._parse_staging()
+
         # Get the list of apps to ignore
         self._apps_to_ignore = self._parse_apps_to_ignore()
 
         # Get the list of apps to allow
         self._apps_to_sync = self._parse_apps_to_sync()
 
+        # Get the policies used to solve conflicts
+        self._conflict_policies = self._parse_conflict_policies()
+
+        # Get the patterns of the files excluded from every application
+        self._excluded_files = self._parse_excluded_files()
+
     @property
     def engine(self):
         """
         The engine used by the storage.
 
-        ENGINE_DROPBOX, ENGINE_GDRIVE, ENGINE_COPY, ENGINE_ICLOUD, ENGINE_BOX
-        or ENGINE_FS.
+        ENGINE_DROPBOX, ENGINE_GDRIVE, ENGINE_COPY, ENGINE_ICLOUD, ENGINE_BOX,
+        ENGINE_FS, ENGINE_PACKED, ENGINE_DEDUP or an engine added with
+        engines.register().
 
         Returns:
             str
         """
         return str(self._engine)
 
+    @property
+    def capabilities(self):
+        """
+        What the storage engine can do.
+
+        Returns:
+            frozenset. engines.CAP_* flags
+        """
+        return frozenset(self._capabilities)
+
     @property
     def path(self):
         """
@@ -108,6 +124,16 @@ class Config(object):
         """
         return str(os.path.join(self.path, self.directory))
 
+    @property
+    def staging(self):
+        """
+        If backups are copied in a staging folder, then committed at once.
+
+        Returns:
+            bool
+        """
+        return bool(self._staging)
+
     @property
     def apps_to_ignore(self):
         """
@@ -128,6 +154,27 @@ class Config(object):
         """
         return set(self._apps_to_sync)
 
+    @property
+    def conflict_policies(self):
+        """
+        Get the conflict policies set in the config file.
+
+        Returns:
+            dict. Policy for each application name or file pattern, the
+                  'default' key holding the policy used for everything else
+        """
+        return dict(self._conflict_policies)
+
+    @property
+    def excluded_files(self):
+        """
+        Get the patterns of the files excluded from every application.
+
+        Returns:
+            set. Glob patterns, lowercase
+        """
+        return set(self._excluded_files)
+
     def _setup_parser(self, filename=None):
         """
         Configure the ConfigParser instance the way we want it.
@@ -155,18 +202,18 @@ class Config(object):
         old_sections = ['Allowed Applications', 'Ignored Applications']
         for old_section in old_sections:
             if self._parser.has_section(old_section):
-                error("Old config file detected. Aborting.\n"
-                      "\n"
-                      "An old section (e.g. [Allowed Applications]"
-                      " or [Ignored Applications] has been detected"
-                      " in your {} file.\n"
-                      "I'd rather do nothing than do something you"
-                      " do not want me to do.\n"
-                      "\n"
-                      "Please read the up to date documentation on"
-                      " <https://github.com/lra/mackup> and migrate"
-                      " your configuration file."
-                      .format(MACKUP_CONFIG_FILE))
+                raise ConfigError("Old config file detected. Aborting.\n"
+                                  "\n"
+                                  "An old section (e.g. [Allowed Applications]"
+                                  " or [Ignored Applications] has been"
+                                  " detected in your {} file.\n"
+                                  "I'd rather do nothing than do something you"
+                                  " do not want me to do.\n"
+                                  "\n"
+                                  "Please read the up to date documentation on"
+                                  " <https://github.com/lra/mackup> and"
+                                  " migrate your configuration file."
+                                  .format(MACKUP_CONFIG_FILE))
 
     def _parse_engine(self):
         """
@@ -182,12 +229,7 @@ class Config(object):
 
         assert isinstance(engine, str)
 
-        if engine not in [ENGINE_DROPBOX,
-                          ENGINE_GDRIVE,
-                          ENGINE_COPY,
-                          ENGINE_ICLOUD,
-                          ENGINE_BOX,
-                          ENGINE_FS]:
+        if engine not in engines.get_names():
             raise ConfigError('Unknown storage engine: {}'.format(engine))
 
         return str(engine)
@@ -199,23 +241,8 @@ class Config(object):
         Returns:
             str
         """
-        if self.engine == ENGINE_DROPBOX:
-            path = get_dropbox_folder_location()
-        elif self.engine == ENGINE_GDRIVE:
-            path = get_google_drive_folder_location()
-        elif self.engine == ENGINE_COPY:
-            path = get_copy_folder_location()
-        elif self.engine == ENGINE_ICLOUD:
-            path = get_icloud_folder_location()
-        elif self.engine == ENGINE_BOX:
-            path = get_box_folder_location()
-        elif self.engine == ENGINE_FS:
-            if self._parser.has_option('storage', 'path'):
-                cfg_path = self._parser.get('storage', 'path')
-                path = os.path.join(os.environ['HOME'], cfg_path)
-            else:
-                raise ConfigError("The required 'path' can't be found while"
-                                  " the 'file_system' engine is used.")
+        # Only the module of the engine used is imported
+        path = engines.get_engine(self.engine).get_path(self._parser)
 
         return str(path)
 
@@ -233,6 +260,22 @@ class Config(object):
 
         return str(directory)
 
+    def _parse_staging(self):
+        """
+        Parse if backups are staged in the config.
+
+        Returns:
+            bool
+        """
+        if not self._parser.has_option('storage', 'staging'):
+            return False
+
+        try:
+            return self._parser.getboolean('storage', 'staging')
+        except ValueError:
+            raise ConfigError('Invalid value for staging: {}'
+                              .format(self._parser.get('storage', 'staging')))
+
     def _parse_apps_to_ignore(self):
         """
         Parse the applications to ignore in the config.
@@ -267,8 +310,46 @@ class Config(object):
 
         return apps_to_sync
 
+    def _parse_conflict_policies(self):
+        """
+        Parse the policies used to solve conflicts in the config.
+
+        Returns:
+            dict
+        """
+        conflict_policies = dict()
+
+        # Is the "[conflict_policy]" section in the cfg file ?
+        section_title = 'conflict_policy'
+        if self._parser.has_section(section_title):
+            for option in self._parser.options(section_title):
+                policy = self._parser.get(section_title, option)
+                if policy not in POLICIES:
+                    raise ConfigError('Unknown conflict policy: {}'
+                                      .format(policy))
+                conflict_policies[option] = str(policy)
+
+        return conflict_policies
+
+    def _parse_excluded_files(self):
+        """
+        Parse the patterns of the files to exclude in the config.
+
+        Returns:
+            set
+        """
+        # We exclude nothing by default
+        excluded_files = set()
+
+        # Is the "[excluded_files]" section in the cfg file ?
+        section_title = 'excluded_files'
+        if self._parser.has_section(section_title):
+            excluded_files = set(self._parser.options(section_title))
+
+        return excluded_files
+
 
-class ConfigError(Exception):
+class ConfigError(MackupError):
 
     """Exception used for handle errors in the configuration."""
 
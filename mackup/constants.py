@@ -21,10 +21,71 @@ MACKUP_CONFIG_FILE = '.mackup.cfg'
 # Directory that can contains user defined app configs
 CUSTOM_APPS_DIR = '.mackup'
 
+# Directory where Mackup moves the files it deletes, to be able to undo a run
+MACKUP_TRASH_DIR = '.mackup-trash'
+
+# Number of runs kept in the trash
+TRASH_RUNS_TO_KEEP = 5
+
+# Age in seconds after which the temporary files of a run are removed, even
+# if a process with the pid of that run still exists
+LEFTOVER_MAX_AGE = 24 * 60 * 60
+
+# Directory where the packed engine materializes the files of its packs
+MACKUP_CACHE_DIR = '.mackup-cache'
+
+# Directory of the storage where the deduplicated engine stores its objects
+MACKUP_OBJECTS_DIR = '.mackup-objects'
+
+# File of the home listing what the backups of this computer wrote to the
+# storage, the only entries mackup gc deletes from it
+MACKUP_RECORD_FILE = '.mackup-record'
+
+# Prefix of the folders where a staged backup copies files before committing
+MACKUP_STAGING_DIR = '.mackup-staging'
+
 # Supported engines
 ENGINE_BOX = 'box'
 ENGINE_COPY = 'copy'
+ENGINE_DEDUP = 'deduplicated'
 ENGINE_DROPBOX = 'dropbox'
 ENGINE_FS = 'file_system'
 ENGINE_GDRIVE = 'google_drive'
 ENGINE_ICLOUD = 'icloud'
+ENGINE_PACKED = 'packed'
+
+# Policies used to solve the conflicts between the home and the backup
+POLICY_ASK = 'ask'
+POLICY_ASK_ONCE = 'ask-once'
+POLICY_IDENTICAL_SKIP = 'identical-skip'
+POLICY_KEEP_BACKUP = 'keep-backup'
+POLICY_KEEP_HOME = 'keep-home'
+POLICY_NEWER_WINS = 'newer-wins'
+POLICIES = [POLICY_ASK,
+            POLICY_ASK_ONCE,
+            POLICY_IDENTICAL_SKIP,
+            POLICY_KEEP_BACKUP,
+            POLICY_KEEP_HOME,
+            POLICY_NEWER_WINS]
+
+# Profilers that can wrap a run
+PROFILE_CPU = 'cpu'
+PROFILE_MEM = 'mem'
+PROFILES = [PROFILE_CPU, PROFILE_MEM]
+
+# Modes of a run
+MODE_BACKUP = 'backup'
+MODE_RESTORE = 'restore'
+MODE_UNINSTALL = 'uninstall'
+MODES = [MODE_BACKUP, MODE_RESTORE, MODE_UNINSTALL]
+
+# Outcome of a run for each file, or what it would be in a dry run
+OUTCOME_BACKED_UP = 'backed-up'
+OUTCOME_RESTORED = 'restored'
+OUTCOME_REVERTED = 'reverted'
+OUTCOME_SKIPPED = 'skipped'
+OUTCOME_CONFLICT = 'conflict'
+OUTCOME_UP_TO_DATE = 'up-to-date'
+OUTCOME_BROKEN_LINK = 'broken-link'
+OUTCOME_MISSING = 'missing'
+OUTCOME_APP_RUNNING = 'app-running'
@@ -0,0 +1,176 @@
+"""
+Storage engines.
+
+Each engine lives in a module of this package, only imported when the config
+uses it. An engine module provides:
+
+- get_path(parser): find the folder of the storage, from the config parser or
+  by looking for the install of the sync client, raising StorageNotFoundError
+  if it can't be found
+- CAPABILITIES: the CAP_* flags of the engine, used to pick the fastest safe
+  way to copy and compare files
+
+The engines finding their folder in a file of a sync client only read it
+again when it changes, see get_cached_path().
+
+Engines living out of Mackup can be added with register().
+"""
+import importlib
+import os
+import sys
+
+from ..constants import (ENGINE_BOX,
+                         ENGINE_COPY,
+                         ENGINE_DEDUP,
+                         ENGINE_DROPBOX,
+                         ENGINE_FS,
+                         ENGINE_GDRIVE,
+                         ENGINE_ICLOUD,
+                         ENGINE_PACKED)
+
+
+# The storage is on the same device as the home, without needing to check
+CAP_SAME_DEVICE = 'same-device'
+
+# Files can be written under a temporary name, then atomically renamed, so
+# the sync client never uploads half of a file
+CAP_RENAME = 'rename'
+
+# Files can share their blocks with the files of the home, when the
+# filesystem supports it, e.g. Btrfs or XFS
+CAP_REFLINK = 'reflink'
+
+# Each access to the storage is slow, e.g. a network filesystem
+CAP_HIGH_LATENCY = 'high-latency'
+
+# Files of the storage might only be downloaded when read
+CAP_LAZILY_HYDRATED = 'lazily-hydrated'
+
+# Module of each engine, relative to this package, or absolute
+_modules = {ENGINE_BOX: 'box',
+            ENGINE_COPY: 'copy_agent',
+            ENGINE_DEDUP: 'deduplicated',
+            ENGINE_DROPBOX: 'dropbox',
+            ENGINE_FS: 'file_system',
+            ENGINE_GDRIVE: 'google_drive',
+            ENGINE_ICLOUD: 'icloud',
+            ENGINE_PACKED: 'packed'}
+
+# Folders found in files of sync clients, with the modification time of the
+# file, by path of the file
+_paths = dict()
+
+
+def register(name, module_name):
+    """
+    Add an engine, or replace one.
+
+    Args:
+        name (str): Name of the engine, as used in the config
+        module_name (str): Absolute name of the module of the engine, e.g.
+                           'mypackage.myengine'
+    """
+    _modules[name] = module_name
+
+
+def get_names():
+    """
+    Get the names of the engines.
+
+    Returns:
+        list: Sorted names
+    """
+    return sorted(_modules)
+
+
+def get_engine(name):
+    """
+    Import the module of an engine.
+
+    Args:
+        name (str): Name of the engine
+
+    Returns:
+        module
+    """
+    module_name = _modules[name]
+    if '.' in module_name:
+        return importlib.import_module(module_name)
+
+    return importlib.import_module('.' + module_name, __name__)
+
+
+def get_path_option(parser, engine):
+    """
+    Get the path set in the config, for the engines needing one.
+
+    Args:
+        parser (configparser.SafeConfigParser)
+        engine (str): Name of the engine, for the error
+
+    Returns:
+        str: The path, relative to the home if not absolute
+
+    Raises:
+        ConfigError: If the path is not set
+    """
+    if not parser.has_option('storage', 'path'):
+        from ..config import ConfigError
+        raise ConfigError("The required 'path' can't be found while"
+                          " the '{}' engine is used.".format(engine))
+
+    return os.path.join(os.environ['HOME'], parser.get('storage', 'path'))
+
+
+def get_cached_path(source, find):
+    """
+    Get the folder found in a file of a sync client, cached until it changes.
+
+    Configs are built more than once by some runs, and reading the file of
+    the client might wait for the client.
+
+    Args:
+        source (str): Path of the file, e.g. ~/.dropbox/host.db
+        find (function): Reads the folder from the file, called with source
+
+    Returns:
+        str
+    """
+    try:
+        mtime = os.stat(source).st_mtime
+    except OSError:
+        # Let find() tell what is missing
+        return find(source)
+
+    cached = _paths.get(source)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    path = find(source)
+    _paths[source] = (mtime, path)
+
+    return path
+
+
+def connect_read_only(database_path):
+    """
+    Open an SQLite database of a sync client, without locking it.
+
+    The database is opened read-only and immutable, so Mackup never waits
+    for the client holding a lock on it. Python 2 can't, and opens it as
+    usual.
+
+    Args:
+        database_path (str)
+
+    Returns:
+        sqlite3.Connection
+    """
+    import sqlite3
+
+    if sys.version_info[0] < 3:
+        return sqlite3.connect(database_path)
+
+    from six.moves.urllib.request import pathname2url
+    return sqlite3.connect('file:{}?mode=ro&immutable=1'
+                           .format(pathname2url(database_path)), uri=True)
@@ -0,0 +1,48 @@
+"""Box, found from the preferences of its client."""
+import os
+
+from ..errors import StorageNotFoundError
+from . import CAP_REFLINK, CAP_RENAME, get_cached_path
+
+
+# The folder of the client can be on any device, e.g. an external drive
+CAPABILITIES = frozenset([CAP_RENAME, CAP_REFLINK])
+
+
+def get_path(parser):
+    """
+    Try to locate the Box folder.
+
+    Args:
+        parser (configparser.SafeConfigParser): Unused
+
+    Returns:
+        (str) Full path to the current Box folder
+
+    Raises:
+        (StorageNotFoundError): If the folder can't be found
+    """
+    box_prefs_path = ('Library/Application Support/Box/Box Sync/'
+                      'sync_root_folder.txt')
+    box_prefs = os.path.join(os.environ['HOME'], box_prefs_path)
+
+    return get_cached_path(box_prefs, _read_prefs)
+
+
+def _read_prefs(box_prefs):
+    """
+    Read the Box folder from the preferences of the client.
+
+    Args:
+        box_prefs (str)
+
+    Returns:
+        str
+    """
+    try:
+        with open(box_prefs, 'r') as sync_path:
+            box_home = sync_path.read()
+    except IOError:
+        raise StorageNotFoundError("Unable to find your Box prefs =(")
+
+    return box_home
@@ -0,0 +1,60 @@
+"""Copy, found from the database of the Copy Agent."""
+import os
+
+from ..errors import StorageNotFoundError
+from . import CAP_REFLINK, CAP_RENAME, connect_read_only, get_cached_path
+
+
+# The folder of the client can be on any device, e.g. an external drive
+CAPABILITIES = frozenset([CAP_RENAME, CAP_REFLINK])
+
+
+def get_path(parser):
+    """
+    Try to locate the Copy folder.
+
+    Args:
+        parser (configparser.SafeConfigParser): Unused
+
+    Returns:
+        (str) Full path to the current Copy folder
+
+    Raises:
+        (StorageNotFoundError): If the folder can't be found
+    """
+    copy_settings_path = 'Library/Application Support/Copy Agent/config.db'
+    copy_settings = os.path.join(os.environ['HOME'], copy_settings_path)
+
+    return get_cached_path(copy_settings, _read_config)
+
+
+def _read_config(copy_settings):
+    """
+    Read the Copy folder from the database of the Copy Agent.
+
+    Args:
+        copy_settings (str)
+
+    Returns:
+        str
+    """
+    copy_home = None
+
+    if os.path.isfile(copy_settings):
+        database = connect_read_only(copy_settings)
+        try:
+            cur = database.cursor()
+            query = ("SELECT value "
+                     "FROM config2 "
+                     "WHERE option = 'csmRootPath';")
+            cur.execute(query)
+            data = cur.fetchone()
+            if data:
+                copy_home = str(data[0])
+        finally:
+            database.close()
+
+    if not copy_home:
+        raise StorageNotFoundError("Unable to find your Copy install =(")
+
+    return copy_home
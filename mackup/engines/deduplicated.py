@@ -0,0 +1,23 @@
+"""Objects in a folder set in the config, see mackup/objects.py."""
+from ..constants import ENGINE_DEDUP
+from . import CAP_REFLINK, CAP_RENAME, CAP_SAME_DEVICE, get_path_option
+
+
+# Files are copied to the cache, in the home
+CAPABILITIES = frozenset([CAP_SAME_DEVICE, CAP_RENAME, CAP_REFLINK])
+
+
+def get_path(parser):
+    """
+    Get the folder set in the config.
+
+    Args:
+        parser (configparser.SafeConfigParser)
+
+    Returns:
+        str
+
+    Raises:
+        ConfigError: If the path is not set
+    """
+    return get_path_option(parser, ENGINE_DEDUP)
@@ -0,0 +1,49 @@
+"""Dropbox, found from the config of its client."""
+import os
+
+from ..errors import StorageNotFoundError
+from . import CAP_REFLINK, CAP_RENAME, get_cached_path
+
+
+# The folder of the client can be on any device, e.g. an external drive. Its
+# files are only online with Smart Sync, which most folders don't use
+CAPABILITIES = frozenset([CAP_RENAME, CAP_REFLINK])
+
+
+def get_path(parser):
+    """
+    Try to locate the Dropbox folder.
+
+    Args:
+        parser (configparser.SafeConfigParser): Unused
+
+    Returns:
+        (str) Full path to the current Dropbox folder
+
+    Raises:
+        (StorageNotFoundError): If the folder can't be found
+    """
+    host_db_path = os.path.join(os.environ['HOME'], '.dropbox/host.db')
+
+    return get_cached_path(host_db_path, _read_host_db)
+
+
+def _read_host_db(host_db_path):
+    """
+    Read the Dropbox folder from the host.db file of the client.
+
+    Args:
+        host_db_path (str)
+
+    Returns:
+        str
+    """
+    try:
+        with open(host_db_path, 'r') as f_hostdb:
+            data = f_hostdb.read().split()
+    except IOError:
+        raise StorageNotFoundError("Unable to find your Dropbox install =(")
+    import base64
+    dropbox_home = base64.b64decode(data[1]).decode()
+
+    return dropbox_home
@@ -0,0 +1,23 @@
+"""Any folder, set in the config."""
+from ..constants import ENGINE_FS
+from . import CAP_REFLINK, CAP_RENAME, get_path_option
+
+
+# The folder might be on another device, which is checked when needed
+CAPABILITIES = frozenset([CAP_RENAME, CAP_REFLINK])
+
+
+def get_path(parser):
+    """
+    Get the folder set in the config.
+
+    Args:
+        parser (configparser.SafeConfigParser)
+
+    Returns:
+        str
+
+    Raises:
+        ConfigError: If the path is not set
+    """
+    return get_path_option(parser, ENGINE_FS)
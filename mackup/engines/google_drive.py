@@ -0,0 +1,68 @@
+"""Google Drive, found from the database of its client."""
+import os
+
+from ..errors import StorageNotFoundError
+from . import CAP_REFLINK, CAP_RENAME, connect_read_only, get_cached_path
+
+
+# The folder of the client can be on any device, e.g. an external drive
+CAPABILITIES = frozenset([CAP_RENAME, CAP_REFLINK])
+
+
+def get_path(parser):
+    """
+    Try to locate the Google Drive folder.
+
+    Args:
+        parser (configparser.SafeConfigParser): Unused
+
+    Returns:
+        (str) Full path to the current Google Drive folder
+
+    Raises:
+        (StorageNotFoundError): If the folder can't be found
+    """
+    gdrive_db_path = 'Library/Application Support/Google/Drive/sync_config.db'
+    yosemite_gdrive_db_path = ('Library/Application Support/Google/Drive/'
+                               'user_default/sync_config.db')
+    yosemite_gdrive_db = os.path.join(os.environ['HOME'],
+                                      yosemite_gdrive_db_path)
+    if os.path.isfile(yosemite_gdrive_db):
+        gdrive_db_path = yosemite_gdrive_db
+
+    gdrive_db = os.path.join(os.environ['HOME'], gdrive_db_path)
+
+    return get_cached_path(gdrive_db, _read_sync_config)
+
+
+def _read_sync_config(gdrive_db):
+    """
+    Read the Google Drive folder from the database of the client.
+
+    Args:
+        gdrive_db (str)
+
+    Returns:
+        str
+    """
+    googledrive_home = None
+
+    if os.path.isfile(gdrive_db):
+        con = connect_read_only(gdrive_db)
+        try:
+            cur = con.cursor()
+            query = ("SELECT data_value "
+                     "FROM data "
+                     "WHERE entry_key = 'local_sync_root_path';")
+            cur.execute(query)
+            data = cur.fetchone()
+            if data:
+                googledrive_home = str(data[0])
+        finally:
+            con.close()
+
+    if not googledrive_home:
+        raise StorageNotFoundError(
+            "Unable to find your Google Drive install =(")
+
+    return googledrive_home
@@ -0,0 +1,36 @@
+"""iCloud Drive, in its usual folder."""
+import os
+
+from ..errors import StorageNotFoundError
+from . import (CAP_HIGH_LATENCY, CAP_LAZILY_HYDRATED, CAP_RENAME,
+               CAP_SAME_DEVICE)
+
+
+# Optimized storage evicts the files not used lately
+CAPABILITIES = frozenset([CAP_SAME_DEVICE,
+                          CAP_RENAME,
+                          CAP_HIGH_LATENCY,
+                          CAP_LAZILY_HYDRATED])
+
+
+def get_path(parser):
+    """
+    Try to locate the iCloud Drive folder.
+
+    Args:
+        parser (configparser.SafeConfigParser): Unused
+
+    Returns:
+        (str) Full path to the iCloud Drive folder.
+
+    Raises:
+        (StorageNotFoundError): If the folder can't be found
+    """
+    yosemite_icloud_path = '~/Library/Mobile Documents/com~apple~CloudDocs/'
+
+    icloud_home = os.path.expanduser(yosemite_icloud_path)
+
+    if not os.path.isdir(icloud_home):
+        raise StorageNotFoundError('Unable to find your iCloud Drive =(')
+
+    return str(icloud_home)
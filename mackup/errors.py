@@ -0,0 +1,62 @@
+"""
+The Mackup Errors.
+
+Mackup raises these instead of exiting, so it can be used as a library. The
+command line turns them into an error message and an exit code.
+"""
+
+
+class MackupError(Exception):
+
+    """Base class of the errors raised by Mackup."""
+
+    pass
+
+
+class StorageNotFoundError(MackupError):
+
+    """The storage, or the Mackup folder in it, can't be found."""
+
+    pass
+
+
+class UnusableEnvironmentError(MackupError):
+
+    """Mackup can't run in the current environment, e.g. as root."""
+
+    pass
+
+
+class UnknownApplicationError(MackupError):
+
+    """An application is not in the applications database."""
+
+    pass
+
+
+class CorruptStorageError(MackupError):
+
+    """A file of the storage can't be read, or is missing."""
+
+    pass
+
+
+class PackError(CorruptStorageError):
+
+    """A pack of the packed storage can't be read."""
+
+    pass
+
+
+class InsufficientSpaceError(MackupError):
+
+    """The files to copy don't fit in the free space of their filesystem."""
+
+    pass
+
+
+class DependencyError(MackupError):
+
+    """The dependencies of some applications form a cycle."""
+
+    pass
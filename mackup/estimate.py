@@ -0,0 +1,309 @@
+"""
+Run estimates.
+
+Before a backup or an uninstall, Mackup can tell how many files and bytes each
+application would copy, if the filesystem receiving them has enough free space
+and how long copying them should take, measured on that filesystem.
+
+The trees are walked by a pool of threads, walking them being mostly waiting
+for the filesystem.
+"""
+import os
+import time
+from collections import namedtuple
+
+
+# What an application would copy, allocated being the space used on disk
+AppEstimate = namedtuple('AppEstimate', ['app_name', 'files', 'bytes',
+                                         'allocated'])
+
+# Number of threads walking the trees
+WALKERS = 8
+
+# Size of the file written to measure the throughput of a filesystem
+SAMPLE_SIZE = 4 * 1024 * 1024
+
+# Number of empty files written to measure the time spent on each file
+SAMPLE_FILES = 32
+
+
+class Estimate(object):
+
+    """What a run would copy, and if it fits."""
+
+    def __init__(self, mode, target, apps, free_bytes, throughput=None):
+        """
+        Create an Estimate instance.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+            target (str): Folder receiving the copies
+            apps (list of AppEstimate)
+            free_bytes (int): Space left to the user on the filesystem of
+                              the target
+            throughput (tuple): Bytes per second and seconds per file
+                                measured on the target, None if not measured
+        """
+        self.mode = mode
+        self.target = target
+        self.apps = apps
+        self.free_bytes = free_bytes
+        self.throughput = throughput
+
+    @property
+    def files(self):
+        """
+        Number of files copied.
+
+        Returns:
+            int
+        """
+        return sum(app.files for app in self.apps)
+
+    @property
+    def bytes(self):
+        """
+        Number of bytes copied.
+
+        Returns:
+            int
+        """
+        return sum(app.bytes for app in self.apps)
+
+    @property
+    def allocated(self):
+        """
+        Space used by the copies on the filesystem of the target.
+
+        Returns:
+            int
+        """
+        return sum(app.allocated for app in self.apps)
+
+    @property
+    def duration(self):
+        """
+        Estimated time spent copying, in seconds.
+
+        Returns:
+            float, or None if the throughput was not measured
+        """
+        if self.throughput is None:
+            return None
+
+        bytes_per_second, seconds_per_file = self.throughput
+
+        return self.bytes / bytes_per_second + self.files * seconds_per_file
+
+    def has_enough_space(self):
+        """
+        Check if the copies fit in the free space of the target.
+
+        Returns:
+            bool
+        """
+        return self.allocated <= self.free_bytes
+
+    def to_table(self):
+        """
+        Return the estimate as a table, to be displayed.
+
+        Returns:
+            str
+        """
+        line = '{:<30} {:>9} {:>12}'
+        lines = [line.format('Application', 'Files', 'Bytes')]
+        for app in self.apps:
+            lines.append(line.format(app.app_name, app.files, app.bytes))
+        lines.append(line.format('Total', self.files, self.bytes))
+
+        lines.append('')
+        lines.append('Needs {} on {}, {} free'
+                     .format(format_size(self.allocated), self.target,
+                             format_size(self.free_bytes)))
+        if self.duration is not None:
+            lines.append('Estimated duration: {:.2f}s'.format(self.duration))
+
+        return '\n'.join(lines)
+
+
+def estimate(mode, apps, target, measure=True, sample_folder=None):
+    """
+    Estimate what a run would copy.
+
+    Args:
+        mode (str): 'backup', 'restore' or 'uninstall', see MODES
+        apps (list of ApplicationProfile)
+        target (str): Folder receiving the copies, the Mackup folder for a
+                      backup, the home for an uninstall
+        measure (bool): Measure the throughput of the target, to estimate
+                        the duration
+        sample_folder (str): Folder on the device of the target to measure
+                             it in, the target by default. Must not be
+                             synced, the samples would be uploaded
+
+    Returns:
+        Estimate
+    """
+    block_size, free_bytes = get_free_space(target)
+
+    tasks = []
+    for app in apps:
+        for filename, src, _ in app.get_copies(mode):
+            tasks.append((app.app_name, src, app.getExcluded(src, filename),
+                          block_size))
+
+    if len(tasks) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(WALKERS, len(tasks)))
+        try:
+            sizes = pool.map(_walk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        sizes = [_walk(task) for task in tasks]
+
+    by_app = dict()
+    for (app_name, _, _, _), size in zip(tasks, sizes):
+        by_app[app_name] = [total + value for total, value
+                            in zip(by_app.get(app_name, [0, 0, 0]), size)]
+    app_estimates = [AppEstimate(app.app_name, *by_app[app.app_name])
+                     for app in apps if app.app_name in by_app]
+
+    throughput = None
+    if measure and tasks:
+        throughput = measure_throughput(sample_folder or target)
+
+    return Estimate(mode, target, app_estimates, free_bytes, throughput)
+
+
+def get_free_space(folder):
+    """
+    Get the free space of the filesystem of a folder, which might not exist.
+
+    Args:
+        folder (str)
+
+    Returns:
+        (int, int): Size of the blocks, free space left to the user in bytes
+    """
+    folder = _get_existing_folder(folder)
+    stat = os.statvfs(folder)
+
+    return stat.f_frsize, stat.f_bavail * stat.f_frsize
+
+
+def measure_throughput(folder):
+    """
+    Measure how fast files can be written in a folder, which might not exist.
+
+    Args:
+        folder (str)
+
+    Returns:
+        (float, float): Bytes per second, seconds per file
+    """
+    import shutil
+    import tempfile
+
+    sample_folder = tempfile.mkdtemp(prefix='.mackup-estimate-',
+                                     dir=_get_existing_folder(folder))
+    try:
+        start = time.time()
+        for index in range(SAMPLE_FILES):
+            open(os.path.join(sample_folder, str(index)), 'w').close()
+        seconds_per_file = (time.time() - start) / SAMPLE_FILES
+
+        data = os.urandom(SAMPLE_SIZE)
+        start = time.time()
+        with open(os.path.join(sample_folder, 'sample'), 'wb') as f_sample:
+            f_sample.write(data)
+            f_sample.flush()
+            os.fsync(f_sample.fileno())
+        elapsed = max(time.time() - start - seconds_per_file, 1e-6)
+    finally:
+        shutil.rmtree(sample_folder)
+
+    return SAMPLE_SIZE / elapsed, seconds_per_file
+
+
+def format_size(size):
+    """
+    Format a number of bytes to be read by a human.
+
+    Args:
+        size (int)
+
+    Returns:
+        str: e.g. '1.5 MiB'
+    """
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'TiB'
+
+    if unit == 'B':
+        return '{} B'.format(size)
+
+    return '{:.1f} {}'.format(size, unit)
+
+
+def _walk(task):
+    """
+    Count the files and bytes of a file or folder to copy.
+
+    Args:
+        task (tuple): Application name, path, function telling if a path is
+                      excluded or None, size of the blocks of the target
+
+    Returns:
+        (int, int, int): Files, bytes, space used on the target
+    """
+    _, path, excluded, block_size = task
+
+    def allocated(size):
+        return -(-size // block_size) * block_size
+
+    if not os.path.isdir(path):
+        size = os.path.getsize(path)
+        return 1, size, allocated(size)
+
+    files = size = used = 0
+    # Links are followed, like the copy does
+    for root, dirs, filenames in os.walk(path, followlinks=True):
+        if excluded is not None:
+            dirs[:] = [name for name in dirs
+                       if not excluded(os.path.join(root, name))]
+            filenames = [name for name in filenames
+                         if not excluded(os.path.join(root, name))]
+        used += block_size
+        for filename in filenames:
+            try:
+                file_size = os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                # Broken link
+                continue
+            files += 1
+            size += file_size
+            used += allocated(file_size)
+
+    return files, size, used
+
+
+def _get_existing_folder(folder):
+    """
+    Get a folder, or its closest existing parent.
+
+    Args:
+        folder (str)
+
+    Returns:
+        str
+    """
+    while not os.path.isdir(folder):
+        folder = os.path.dirname(folder)
+
+    return folder
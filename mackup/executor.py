@@ -0,0 +1,286 @@
+"""
+The Mackup Executor.
+
+The executor runs the link and chmod operations of a run grouped by parent
+folder. Each folder is opened once and the operations are done relative to
+its file descriptor, instead of resolving the full path from / every time.
+This also keeps a batch working on the same folder even if it gets renamed
+meanwhile.
+"""
+import errno
+import os
+import stat
+import threading
+from collections import OrderedDict
+
+from . import tracing
+
+
+# Modes set on the files and folders managed by Mackup
+FILE_MODE = stat.S_IRUSR | stat.S_IWUSR
+FOLDER_MODE = stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR
+
+# Python 2 and some platforms can't work relative to a folder descriptor
+DIR_FD_SUPPORTED = (hasattr(os, 'fwalk') and
+                    hasattr(os, 'O_DIRECTORY') and
+                    os.symlink in os.supports_dir_fd and
+                    os.chmod in os.supports_dir_fd and
+                    os.stat in os.supports_dir_fd and
+                    os.unlink in os.supports_dir_fd)
+
+# Operations supported by the executor
+OP_CHMOD = 'chmod'
+OP_SYMLINK = 'symlink'
+OP_UNLINK = 'unlink'
+
+
+class Executor(object):
+
+    """Queue of filesystem operations, run grouped by parent folder."""
+
+    def __init__(self, unlock=None):
+        """
+        Create an Executor instance.
+
+        Args:
+            unlock (function): Called with the full path of a file or folder
+                               when a chmod is not permitted on it, e.g. to
+                               remove an immutable attribute, before trying
+                               again.
+        """
+        self.unlock = unlock
+        self._known_dirs = set()
+        # Applications can run in threads, see scheduler.py, each thread
+        # runs the operations it queued
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def makedirs(self, path):
+        """
+        Create a folder and its parents if needed, once per executor.
+
+        Args:
+            path (str): Absolute path of the folder
+        """
+        with self._lock:
+            if path in self._known_dirs:
+                return
+
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:
+                    # Created meanwhile, e.g. by another process
+                    if not os.path.isdir(path):
+                        raise
+            self._known_dirs.add(path)
+
+    def forget(self, path):
+        """
+        Forget the folders created under a path that is going away.
+
+        Args:
+            path (str): Absolute path of a deleted file or folder
+        """
+        prefix = os.path.join(path, '')
+        with self._lock:
+            self._known_dirs = set(known for known in self._known_dirs
+                                   if known != path and
+                                   not known.startswith(prefix))
+
+    def chmod(self, target, excluded=None):
+        """
+        Queue a recursive chmod to 0600 for files and 0700 for folders.
+
+        Args:
+            target (str): Root file or folder
+            excluded (function): Tells if a path in the target folder is
+                                 excluded, and left as it is
+        """
+        self._queue(OP_CHMOD, target, excluded)
+
+    def symlink(self, target, link_to):
+        """
+        Queue the creation of a link, creating its parent folder if needed.
+
+        Args:
+            target (str): file or folder the link will point to
+            link_to (str): Link to create
+        """
+        self._queue(OP_SYMLINK, link_to, target)
+
+    def unlink(self, path):
+        """
+        Queue the removal of a file or link.
+
+        Args:
+            path (str): File or link to remove
+        """
+        self._queue(OP_UNLINK, path)
+
+    @tracing.traced('executor')
+    def run(self):
+        """Run the queued operations, one parent folder at a time."""
+        operations = self._get_operations()
+        self._local.operations = []
+
+        by_parent = OrderedDict()
+        for operation, path, arg in operations:
+            parent, name = os.path.split(os.path.abspath(path))
+            by_parent.setdefault(parent, []).append((operation, name, arg))
+
+        for parent, operations in by_parent.items():
+            self.makedirs(parent)
+
+            if not DIR_FD_SUPPORTED:
+                for operation, name, arg in operations:
+                    self._run_one(operation, parent, name, arg, None)
+                continue
+
+            dir_fd = os.open(parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                for operation, name, arg in operations:
+                    self._run_one(operation, parent, name, arg, dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _get_operations(self):
+        """
+        Get the operations queued by the current thread.
+
+        Returns:
+            list of (operation, path, arg)
+        """
+        if not hasattr(self._local, 'operations'):
+            self._local.operations = []
+
+        return self._local.operations
+
+    def _queue(self, operation, path, arg=None):
+        """
+        Add an operation to the queue.
+
+        Args:
+            operation (str): One of the OP_* constants
+            path (str): Path the operation works on
+            arg: Argument of the operation, if any
+        """
+        assert isinstance(path, str)
+        self._get_operations().append((operation, path, arg))
+
+    def _run_one(self, operation, parent, name, arg, dir_fd):
+        """
+        Run a single operation.
+
+        Args:
+            operation (str): One of the OP_* constants
+            parent (str): Absolute path of the parent folder
+            name (str): Name of the file in the parent folder
+            arg: Argument of the operation, if any
+            dir_fd (int): Descriptor of the parent folder, None to work with
+                          full paths
+        """
+        if dir_fd is None:
+            name = os.path.join(parent, name)
+
+        if operation == OP_SYMLINK:
+            if dir_fd is None:
+                os.symlink(arg, name)
+            else:
+                os.symlink(arg, name, dir_fd=dir_fd)
+        elif operation == OP_UNLINK:
+            if dir_fd is None:
+                os.unlink(name)
+            else:
+                os.unlink(name, dir_fd=dir_fd)
+        elif operation == OP_CHMOD:
+            path = os.path.join(parent, os.path.basename(name))
+            try:
+                _chmod_tree(name, dir_fd, path, arg)
+            except OSError as err:
+                if err.errno != errno.EPERM or self.unlock is None:
+                    raise
+                self.unlock(path)
+                _chmod_tree(name, dir_fd, path, arg)
+        else:
+            raise ValueError("Unsupported operation: {}".format(operation))
+
+
+def _chmod_tree(name, dir_fd, path, excluded=None):
+    """
+    Recursively set the chmod for files to 0600 and 0700 for folders.
+
+    Args:
+        name (str): Root file or folder, relative to dir_fd if given
+        dir_fd (int): Descriptor of the parent folder, or None
+        path (str): Full path of the root file or folder
+        excluded (function): Tells if a full path in the folder is excluded,
+                             excluded folders are not walked through
+    """
+    if dir_fd is None:
+        mode = os.stat(name).st_mode
+    else:
+        mode = os.stat(name, dir_fd=dir_fd).st_mode
+
+    if stat.S_ISREG(mode):
+        _chmod(name, FILE_MODE, dir_fd)
+
+    elif stat.S_ISDIR(mode):
+        # chmod the root item
+        _chmod(name, FOLDER_MODE, dir_fd)
+
+        # chmod recursively in the folder, every folder being opened once
+        if dir_fd is None:
+            for root, dirs, files in os.walk(name):
+                _skip_excluded(excluded, path, os.path.relpath(root, name),
+                               dirs, files)
+                for cur_dir in dirs:
+                    os.chmod(os.path.join(root, cur_dir), FOLDER_MODE)
+                for cur_file in files:
+                    os.chmod(os.path.join(root, cur_file), FILE_MODE)
+        else:
+            for root, dirs, files, root_fd in os.fwalk(name, dir_fd=dir_fd):
+                _skip_excluded(excluded, path, os.path.relpath(root, name),
+                               dirs, files)
+                for cur_dir in dirs:
+                    os.chmod(cur_dir, FOLDER_MODE, dir_fd=root_fd)
+                for cur_file in files:
+                    os.chmod(cur_file, FILE_MODE, dir_fd=root_fd)
+
+    else:
+        raise ValueError("Unsupported file type: {}".format(path))
+
+
+def _skip_excluded(excluded, path, relpath, dirs, files):
+    """
+    Remove the excluded entries of a folder being walked through, in place.
+
+    Args:
+        excluded (function): Tells if a full path is excluded, or None
+        path (str): Full path of the root of the walk
+        relpath (str): Path of the folder, relative to the root
+        dirs (list): Folders of the folder, not walked through if removed
+        files (list): Files of the folder
+    """
+    if excluded is None:
+        return
+
+    folder = os.path.normpath(os.path.join(path, relpath))
+    for names in (dirs, files):
+        names[:] = [name for name in names
+                    if not excluded(os.path.join(folder, name))]
+
+
+def _chmod(name, mode, dir_fd):
+    """
+    Chmod a file or folder, relative to dir_fd if given.
+
+    Args:
+        name (str)
+        mode (int)
+        dir_fd (int) or None
+    """
+    if dir_fd is None:
+        os.chmod(name, mode)
+    else:
+        os.chmod(name, mode, dir_fd=dir_fd)
@@ -3,77 +3,435 @@ The Mackup Class.
 
 The Mackup class is keeping all the state that Mackup needs to keep during its
 runtime. It also provides easy to use interface that is used by the Mackup UI.
-The only UI for now is the command line.
+The only UI for now is the command line, other programs can use run().
 """
 import os
 import os.path
-import shutil
-import tempfile
+from collections import OrderedDict
 
 from . import utils
 from . import config
-from . import appsdb
+from . import engines
+from . import policy
+from .constants import (ENGINE_DEDUP,
+                        ENGINE_PACKED,
+                        MACKUP_APP_NAME,
+                        MACKUP_CACHE_DIR,
+                        MACKUP_RECORD_FILE,
+                        MODE_BACKUP,
+                        OUTCOME_BACKED_UP,
+                        OUTCOME_RESTORED,
+                        OUTCOME_REVERTED,
+                        MODE_RESTORE,
+                        MODE_UNINSTALL,
+                        MODES,
+                        POLICIES,
+                        POLICY_ASK)
+from .errors import (InsufficientSpaceError,
+                     StorageNotFoundError,
+                     UnknownApplicationError,
+                     UnusableEnvironmentError)
 
 
 class Mackup(object):
 
     """Main Mackup class."""
 
-    def __init__(self):
-        """Mackup Constructor."""
-        self._config = config.Config()
+    def __init__(self, cfg=None, app_db=None):
+        """
+        Mackup Constructor.
+
+        Args:
+            cfg (config.Config): Parsed from the config file if not given
+            app_db (appsdb.ApplicationsDatabase): Loaded when first used if
+                                                  not given
+        """
+        self._config = cfg or config.Config()
+        self._app_db = app_db
+
+        # With the packed and deduplicated engines, the storage only holds
+        # packs or trees, and the files linked from the home are materialized
+        # in a local cache
+        if self._config.engine in [ENGINE_PACKED, ENGINE_DEDUP]:
+            self.store_folder = self._config.fullpath
+        else:
+            self.store_folder = None
+            self.mackup_folder = self._config.fullpath
+        self.set_home(os.environ['HOME'])
+
+        # What the storage engine can do, to pick the fastest safe ways to
+        # copy and compare files
+        self.capabilities = self._config.capabilities
+
+        rules = self._config.conflict_policies
+        self.conflict_policy = policy.ConflictPolicy(
+            rules, rules.pop('default', POLICY_ASK),
+            quick=bool(self.capabilities & set([engines.CAP_HIGH_LATENCY,
+                                                engines.CAP_LAZILY_HYDRATED])))
+
+        # If False, conflicts needing an answer are left as they are
+        self.interactive = True
+
+        self._temp_folder = None
+
+        # Processes running, listed when first needed in a run
+        self._running_processes = None
+
+        # Copies of the backup being run, if staged, see start_staging()
+        self.staging = None
+
+    def set_home(self, home):
+        """
+        Set the home folder the next runs work on.
+
+        With the packed and deduplicated engines, the cache linked from the
+        home is in the home.
+
+        Args:
+            home (str)
+        """
+        self.home = home
+        if self.store_folder is not None:
+            self.mackup_folder = os.path.join(home, MACKUP_CACHE_DIR)
+
+    @property
+    def app_db(self):
+        """
+        Database of the applications supported by Mackup.
+
+        It is only loaded when first used.
+
+        Returns:
+            appsdb.ApplicationsDatabase
+        """
+        if self._app_db is None:
+            from . import appsdb
+            self._app_db = appsdb.ApplicationsDatabase()
+
+        return self._app_db
+
+    @property
+    def temp_folder(self):
+        """
+        Temp folder for the files created while running.
+
+        It is only created when first used.
+
+        Returns:
+            str
+        """
+        if self._temp_folder is None:
+            import tempfile
+            self._temp_folder = tempfile.mkdtemp(prefix="mackup_tmp_")
 
-        self.mackup_folder = self._config.fullpath
-        self.temp_folder = tempfile.mkdtemp(prefix="mackup_tmp_")
+        return self._temp_folder
 
-    def check_for_usable_environment(self):
-        """Check if the current env is usable and has everything's required."""
+    def check_for_usable_environment(self, allow_root=False):
+        """
+        Check if the current env is usable and has everything's required.
+
+        Args:
+            allow_root (bool): Let root run Mackup, to work on the home of
+                               other users
+        """
         # Do not let the user run Mackup as root
-        if os.geteuid() == 0:
-            utils.error("Running Mackup as a superuser is useless and"
-                        " dangerous. Don't do it!")
+        if os.geteuid() == 0 and not allow_root:
+            raise UnusableEnvironmentError("Running Mackup as a superuser is"
+                                           " useless and dangerous. Don't do"
+                                           " it!")
 
         # Do we have a folder to put the Mackup folder ?
         if not os.path.isdir(self._config.path):
-            utils.error("Unable to find the storage folder: {}"
-                        .format(self._config.path))
-
-        # Is Sublime Text running ?
-        # if is_process_running('Sublime Text'):
-        #    error("Sublime Text is running. It is known to cause problems"
-        #          " when Sublime Text is running while I backup or restore"
-        #          " its configuration files. Please close Sublime Text and"
-        #          " run me again.")
-
-    def check_for_usable_backup_env(self):
-        """Check if the current env can be used to back up files."""
-        self.check_for_usable_environment()
+            raise StorageNotFoundError("Unable to find the storage folder: {}"
+                                       .format(self._config.path))
+
+    def check_for_usable_backup_env(self, allow_root=False):
+        """
+        Check if the current env can be used to back up files.
+
+        Args:
+            allow_root (bool): See check_for_usable_environment()
+        """
+        self.check_for_usable_environment(allow_root)
         self.create_mackup_home()
 
-    def check_for_usable_restore_env(self):
-        """Check if the current env can be used to restore files."""
-        self.check_for_usable_environment()
+        # Not to back up files of the cache older than the storage
+        self.load_store()
 
-        if not os.path.isdir(self.mackup_folder):
-            utils.error("Unable to find the Mackup folder: {}\n"
-                        "You might want to back up some files or get your"
-                        " storage directory synced first."
-                        .format(self.mackup_folder))
+    def check_for_usable_restore_env(self, allow_root=False):
+        """
+        Check if the current env can be used to restore files.
+
+        Args:
+            allow_root (bool): See check_for_usable_environment()
+        """
+        self.check_for_usable_environment(allow_root)
+
+        storage_folder = self.store_folder or self.mackup_folder
+        if not os.path.isdir(storage_folder):
+            raise StorageNotFoundError(
+                "Unable to find the Mackup folder: {}\n"
+                "You might want to back up some files or get your storage"
+                " directory synced first."
+                .format(storage_folder))
+
+        # Even in a dry run, as only the cache is written
+        self.load_store()
 
     def clean_temp_folder(self):
         """Delete the temp folder and files created while running."""
-        shutil.rmtree(self.temp_folder)
+        if self._temp_folder is not None:
+            import shutil
+            shutil.rmtree(self._temp_folder)
+            self._temp_folder = None
 
     def create_mackup_home(self):
         """If the Mackup home folder does not exist, create it."""
+        storage_folder = self.store_folder or self.mackup_folder
+        if not os.path.isdir(storage_folder):
+            # Without a prompt, asking for a backup is enough of a yes
+            if not self.interactive or utils.confirm(
+                    "Mackup needs a directory to store your configuration"
+                    " files\n"
+                    "Do you want to create it now? <{}>"
+                    .format(storage_folder)):
+                os.makedirs(storage_folder)
+            else:
+                raise UnusableEnvironmentError("Mackup can't do anything"
+                                               " without a home =(")
+
         if not os.path.isdir(self.mackup_folder):
-            if utils.confirm("Mackup needs a directory to store your"
-                             " configuration files\n"
-                             "Do you want to create it now? <{}>"
-                             .format(self.mackup_folder)):
+            os.makedirs(self.mackup_folder)
+
+    def load_store(self):
+        """
+        Materialize the packs or the trees of the storage in the cache.
+
+        Only the files that changed in the storage are written. Does nothing
+        unless the packed or the deduplicated engine is used.
+        """
+        if self.store_folder is None:
+            return
+
+        from . import tracing
+
+        with tracing.span('load store', 'phase'):
+            if not os.path.isdir(self.mackup_folder):
                 os.makedirs(self.mackup_folder)
+
+            if self._config.engine == ENGINE_PACKED:
+                from . import packs
+                for pack_path in packs.get_pack_paths(self.store_folder):
+                    packs.load(pack_path, self.mackup_folder)
+            else:
+                from . import objects
+                objects_folder = objects.get_objects_folder(self._config.path)
+                for tree_path in objects.get_tree_paths(self.store_folder):
+                    objects.load(tree_path, objects_folder,
+                                 self.mackup_folder)
+
+    def save_store(self, app_names):
+        """
+        Store the files of applications from the cache into the storage.
+
+        Only the packs whose content changed, or the objects missing from the
+        storage, are written. Does nothing unless the packed or the
+        deduplicated engine is used.
+
+        Args:
+            app_names (iterable): Applications backed up
+        """
+        if self.store_folder is None:
+            return
+
+        from . import tracing
+
+        def get_excluded(app_name):
+            patterns = self.get_excluded_files(app_name)
+            if patterns:
+                return lambda name: utils.is_excluded(name, patterns)
+
+        with tracing.span('save store', 'phase'):
+            if self._config.engine == ENGINE_PACKED:
+                from . import packs
+                for app_name in sorted(app_names):
+                    packs.save(packs.get_pack_path(self.store_folder,
+                                                   app_name),
+                               self.mackup_folder,
+                               self.app_db.get_files(app_name),
+                               get_excluded(app_name))
             else:
-                utils.error("Mackup can't do anything without a home =(")
+                from . import objects
+                objects_folder = objects.get_objects_folder(self._config.path)
+                for app_name in sorted(app_names):
+                    objects.save(objects.get_tree_path(self.store_folder,
+                                                       app_name),
+                                 objects_folder,
+                                 self.mackup_folder,
+                                 self.app_db.get_files(app_name),
+                                 get_excluded(app_name))
+
+    def start_staging(self):
+        """
+        Start a staged backup, if the config asks for one.
+
+        Until commit_staging(), the backups copy the files of the home in a
+        staging folder, leaving the Mackup folder and the home as they are.
+        Does nothing with the packed and the deduplicated engines, which
+        already write the storage once the backup is done.
+        """
+        if not self._config.staging or self.store_folder is not None:
+            return
+
+        from .staging import Staging, get_staging_folder
+
+        self.staging = Staging(get_staging_folder(self._config.path))
+
+    def commit_staging(self):
+        """Commit the staged backup into the Mackup folder, if any."""
+        if self.staging is None:
+            return
+
+        from . import tracing
+
+        staging, self.staging = self.staging, None
+        with tracing.span('commit staging', 'phase'):
+            staging.commit()
+
+    def discard_staging(self):
+        """Drop the staged backup, if any, e.g. once a run failed."""
+        if self.staging is not None:
+            staging, self.staging = self.staging, None
+            staging.discard()
+
+    def collect_garbage(self, dry_run=False):
+        """
+        Delete the objects of the storage no tree refers to anymore.
+
+        Does nothing unless the deduplicated engine is used.
+
+        Args:
+            dry_run (bool): Only return what would be deleted
+
+        Returns:
+            list of (str, int): Path and size of each deleted object
+        """
+        if self._config.engine != ENGINE_DEDUP:
+            return []
+
+        from . import objects
+
+        return objects.collect_garbage(self._config.path, self.store_folder,
+                                       dry_run)
+
+    def get_recorded(self):
+        """
+        Get what the backups of this computer wrote to the storage.
+
+        Returns:
+            set: Paths relative to the Mackup folder, and names of the packs
+                 or trees of the storage folder
+        """
+        try:
+            with open(os.path.join(self.home,
+                                   MACKUP_RECORD_FILE)) as f_record:
+                return set(line.rstrip('\n') for line in f_record
+                           if line.strip())
+        except (IOError, OSError):
+            return set()
+
+    def record_backups(self, app_names):
+        """
+        Record what the backups of applications wrote to the storage.
+
+        Other computers syncing the same storage might know applications this
+        one doesn't, sweep() only deletes what is recorded here.
+
+        Args:
+            app_names (iterable): Applications backed up
+        """
+        recorded = self.get_recorded()
+        for app_name in app_names:
+            recorded.update(
+                filename for filename in self.app_db.get_files(app_name)
+                if os.path.lexists(os.path.join(self.mackup_folder,
+                                                filename)))
+
+        if self.store_folder is not None:
+            if self._config.engine == ENGINE_PACKED:
+                from .packs import get_pack_path as get_path
+            else:
+                from .objects import get_tree_path as get_path
+            for app_name in app_names:
+                path = get_path(self.store_folder, app_name)
+                if os.path.exists(path):
+                    recorded.add(os.path.basename(path))
+
+        record_path = os.path.join(self.home, MACKUP_RECORD_FILE)
+        tmp_path = '{}.{}'.format(record_path, os.getpid())
+        with open(tmp_path, 'w') as f_record:
+            for filename in sorted(recorded):
+                f_record.write(filename + '\n')
+        os.rename(tmp_path, record_path)
+
+    def sweep(self, dry_run=False):
+        """
+        Delete the broken links to the Mackup folder, and what no app syncs.
+
+        The links are looked for in the parent folders of the files of the
+        applications, in the home. Every application of the database counts,
+        synced on this computer or not. Only the entries of the storage the
+        backups of this computer wrote are deleted, see record_backups(), as
+        other computers might still sync the others. The deleted files are
+        put in the trash, see `mackup undo`.
+
+        Args:
+            dry_run (bool): Only return what would be deleted
+
+        Returns:
+            (list, list): Full paths of the broken links, and of the entries
+                          of the Mackup folder, or of the storage with the
+                          packed and deduplicated engines, no app syncs
+        """
+        from . import sweep
+
+        home = self.home
+        app_names = self.app_db.get_app_names()
+        filenames = set()
+        for app_name in app_names:
+            filenames.update(self.app_db.get_files(app_name))
+
+        broken_links = sweep.find_broken_links(
+            [os.path.dirname(os.path.join(home, filename))
+             for filename in filenames],
+            self.mackup_folder)
+
+        # The cache of the packed and deduplicated engines is not synced
+        recorded = self.get_recorded()
+        orphans = []
+        if os.path.isdir(self.mackup_folder):
+            orphans = sweep.find_orphans(
+                self.mackup_folder, filenames,
+                recorded if self.store_folder is None else None)
+
+        # Packs or trees of applications gone from the database
+        if self.store_folder is not None and os.path.isdir(self.store_folder):
+            if self._config.engine == ENGINE_PACKED:
+                from .packs import PACK_EXTENSION as extension
+            else:
+                from .objects import TREE_EXTENSION as extension
+            orphans.extend(
+                os.path.join(self.store_folder, filename)
+                for filename in sorted(os.listdir(self.store_folder))
+                if (filename.endswith(extension) and
+                    filename[:-len(extension)] not in app_names and
+                    filename in recorded))
+
+        if not dry_run:
+            for path in broken_links + orphans:
+                utils.delete(path)
+
+        return broken_links, orphans
 
     def get_apps_to_backup(self):
         """
@@ -84,15 +442,429 @@ class Mackup(object):
         Returns:
             (set) List of application names to back up
         """
-        # Instantiate the app db
-        app_db = appsdb.ApplicationsDatabase()
-
         # If a list of apps to sync is specify, we only allow those
         # Or we allow every supported app by default
-        apps_to_backup = self._config.apps_to_sync or app_db.get_app_names()
+        apps_to_backup = (self._config.apps_to_sync or
+                          self.app_db.get_app_names())
 
         # Remove the specified apps to ignore
         for app_name in self._config.apps_to_ignore:
             apps_to_backup.discard(app_name)
 
         return apps_to_backup
+
+    def get_excluded_files(self, app_name):
+        """
+        Get the patterns of the files not synced in the folders of an app.
+
+        The patterns of the application are used along with the ones of the
+        config, which apply to every application.
+
+        Args:
+            app_name (str)
+
+        Returns:
+            set. Glob patterns, see utils.is_excluded()
+        """
+        excluded_files = self._config.excluded_files
+        if app_name in self.app_db.apps:
+            excluded_files.update(self.app_db.get_excluded_files(app_name))
+
+        return excluded_files
+
+    def get_running_processes(self, app_name):
+        """
+        Get the running processes of an application.
+
+        They might change its files while Mackup works on them. The running
+        processes are listed once per run, when first needed.
+
+        Args:
+            app_name (str)
+
+        Returns:
+            list: Sorted names of the processes
+        """
+        if app_name not in self.app_db.apps:
+            return []
+
+        process_names = self.app_db.get_processes(app_name)
+        if not process_names:
+            return []
+
+        if self._running_processes is None:
+            from .processes import RunningProcesses
+            self._running_processes = RunningProcesses()
+
+        return self._running_processes.get_running(process_names)
+
+    def get_scheduler(self, app_names, mode):
+        """
+        Get the order in which applications run, see scheduler.py.
+
+        Applications run after the ones they depend on, and after the Mackup
+        config, which might change the others. Applications syncing the same
+        files never run at the same time. An uninstall runs in the reverse
+        order.
+
+        Args:
+            app_names (iterable)
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+
+        Returns:
+            scheduler.Scheduler
+
+        Raises:
+            DependencyError: If the dependencies form a cycle
+        """
+        from . import scheduler
+
+        dependencies = dict()
+        priorities = dict()
+        files = dict()
+        for app_name in app_names:
+            dependencies[app_name] = set(
+                self.app_db.get_dependencies(app_name))
+            if app_name != MACKUP_APP_NAME:
+                dependencies[app_name].add(MACKUP_APP_NAME)
+            priorities[app_name] = self.app_db.get_priority(app_name)
+            files[app_name] = self.app_db.get_files(app_name)
+
+        return scheduler.Scheduler(dependencies, priorities,
+                                   scheduler.get_exclusions(files),
+                                   reverse=mode == MODE_UNINSTALL)
+
+    def get_estimate(self, mode, apps, home=None, measure=True):
+        """
+        Estimate what a run would copy, without doing anything.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+            apps (list of ApplicationProfile)
+            home (str): Home folder of the apps, see set_home() by default
+            measure (bool): Measure the throughput of the filesystem
+                            receiving the copies, to estimate the duration.
+                            Never in the storage, a backup is measured next
+                            to the storage folder, or not at all
+
+        Returns:
+            estimate.Estimate
+        """
+        from . import estimate
+
+        sample_folder = None
+        if mode == MODE_BACKUP:
+            target = self.mackup_folder
+            # The sync client would upload the samples, not the cache
+            if self.store_folder is None and measure:
+                sample_folder = utils.get_unsynced_folder(self._config.path)
+                measure = sample_folder is not None
+        else:
+            target = home or self.home
+
+        return estimate.estimate(mode, apps, target, measure, sample_folder)
+
+    def check_free_space(self, mode, apps, home=None):
+        """
+        Check that the files a run would copy fit in the free space.
+
+        Meant to run before anything is deleted.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+            apps (list of ApplicationProfile)
+            home (str): Home folder of the apps, see set_home() by default
+
+        Raises:
+            InsufficientSpaceError
+        """
+        if mode == MODE_RESTORE:
+            return
+
+        from . import estimate
+
+        run_estimate = self.get_estimate(mode, apps, home, measure=False)
+        if not run_estimate.has_enough_space():
+            raise InsufficientSpaceError(
+                "Not enough free space on {}: {} needed, {} free"
+                .format(run_estimate.target,
+                        estimate.format_size(run_estimate.allocated),
+                        estimate.format_size(run_estimate.free_bytes)))
+
+    def run(self, mode, apps=None, options=None):
+        """
+        Back up, restore or uninstall applications, without any prompt.
+
+        Nothing is printed, what has been done with each file is returned
+        instead. The conflicts no policy solves are left as they are. Each
+        call is a run of its own, with its own trash, so a single process can
+        do many runs.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+            apps (iterable): Names of the applications, every application to
+                             sync by default
+            options (dict): 'dry_run' (bool), 'conflicts' (str), the
+                            policy used when no rule of the config applies,
+                            'home' (str), the home folder to work on
+                            instead of $HOME, which root can do, and 'jobs'
+                            (int), the number of applications run at the
+                            same time, see scheduler.JOBS
+
+        Returns:
+            Result
+
+        Raises:
+            MackupError: e.g. StorageNotFoundError if there is no Mackup
+                         folder to restore from
+        """
+        from .application import ApplicationProfile
+        from . import metrics
+        from . import scheduler
+        from . import trash
+
+        options = dict(options or {})
+        dry_run = options.get('dry_run', False)
+        conflicts = options.get('conflicts')
+        home = options.get('home')
+
+        if mode not in MODES:
+            raise ValueError("Unknown mode: {}".format(mode))
+        if conflicts is not None and conflicts not in POLICIES:
+            raise config.ConfigError("Unknown conflict policy: {}"
+                                     .format(conflicts))
+
+        interactive = self.interactive
+        default_policy = self.conflict_policy.default
+        previous_home = self.home
+        self.interactive = False
+        if conflicts is not None:
+            self.conflict_policy.default = conflicts
+        if home is not None:
+            self.set_home(home)
+
+        try:
+            if home is not None and not os.path.isdir(home):
+                raise UnusableEnvironmentError(
+                    "Unable to find the home folder: {}".format(home))
+
+            # Root can fill the home of other users, e.g. in an image
+            if mode == MODE_BACKUP:
+                self.check_for_usable_backup_env(home is not None)
+            else:
+                self.check_for_usable_restore_env(home is not None)
+
+            if apps is None:
+                app_names = self.get_apps_to_backup()
+            else:
+                app_names = set(apps)
+                unknown = app_names - self.app_db.get_app_names()
+                if unknown:
+                    raise UnknownApplicationError(
+                        "Unknown applications: {}"
+                        .format(', '.join(sorted(unknown))))
+
+            # Like on the command line, the Mackup config is restored first
+            # and uninstalled last
+            app_scheduler = self.get_scheduler(app_names, mode)
+            app_names = app_scheduler.get_order()
+
+            utils.new_run(home)
+            self._running_processes = None
+            purge_thread = trash.purge_in_background(utils.get_trash().root)
+
+            app_profiles = [ApplicationProfile(self,
+                                               self.app_db.get_files(app_name),
+                                               dry_run,
+                                               False,
+                                               app_name,
+                                               quiet=True,
+                                               home=home)
+                            for app_name in app_names]
+            if not dry_run:
+                self.check_free_space(mode, app_profiles, home)
+
+            profiles = dict((app.app_name, app) for app in app_profiles)
+
+            def run_app(app_name):
+                with metrics.app(app_name):
+                    getattr(profiles[app_name], mode)()
+
+            if mode == MODE_BACKUP and not dry_run:
+                self.start_staging()
+            app_scheduler.run(run_app, options.get('jobs', scheduler.JOBS))
+            self.commit_staging()
+
+            result = Result(mode, dry_run)
+            for app in app_profiles:
+                result.outcomes.extend(app.outcomes)
+
+            # Root working on the home of another user
+            if home is not None and not dry_run and os.geteuid() == 0:
+                self.give_to_owner(home, result)
+
+            if mode == MODE_BACKUP and not dry_run:
+                self.save_store(app_names)
+                self.record_backups(app_names)
+
+            purge_thread.join()
+        finally:
+            self.discard_staging()
+            self.interactive = interactive
+            self.conflict_policy.default = default_policy
+            self.set_home(previous_home)
+            self.clean_temp_folder()
+
+        return result
+
+    def give_to_owner(self, home, result):
+        """
+        Give what a run created in a home to the owner of the home.
+
+        The links, the copies and the folders created for them, and the
+        trash of the run.
+
+        Args:
+            home (str)
+            result (Result): What the run did in the home
+        """
+        home_stat = os.stat(home)
+        owner = (home_stat.st_uid, home_stat.st_gid)
+
+        paths = set()
+        for outcome in result.outcomes:
+            if (outcome.status in [OUTCOME_BACKED_UP, OUTCOME_RESTORED,
+                                   OUTCOME_REVERTED] and
+                    os.path.lexists(outcome.home_filepath)):
+                paths.add(outcome.home_filepath)
+        trash_root = utils.get_trash().root
+        if os.path.isdir(trash_root):
+            paths.add(trash_root)
+
+        for path in sorted(paths):
+            utils.chown_tree(path, *owner)
+            # The folders created to hold it
+            parent = os.path.dirname(path)
+            while (parent.startswith(os.path.join(home, '')) and
+                   os.lstat(parent).st_uid == os.geteuid()):
+                os.lchown(parent, *owner)
+                parent = os.path.dirname(parent)
+
+    def run_roots(self, mode, roots, apps=None, options=None,
+                  processes=None):
+        """
+        Run the same backup, restore or uninstall in many home folders.
+
+        The config and the catalog are loaded once, then the homes are
+        processed in parallel, by a pool of processes.
+
+        A single home can be backed up at a time, as every home would be
+        backed up to the same files of the Mackup folder.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+            roots (list): Home folders to work on
+            apps (iterable): See run()
+            options (dict): See run(), but 'home'
+            processes (int): Number of processes, one per CPU by default, 1
+                             to process the homes in this process
+
+        Returns:
+            OrderedDict: Result of each home, or the error raised while
+                         processing it
+
+        Raises:
+            ValueError: Backing up many homes
+        """
+        if mode == MODE_BACKUP and len(roots) > 1:
+            raise ValueError("A single home can be backed up at a time")
+
+        # Loaded before forking, so it's loaded once
+        self.app_db
+
+        tasks = [(root, mode, apps, options or {}) for root in roots]
+        results = OrderedDict((root, None) for root in roots)
+
+        if processes == 1 or len(roots) <= 1:
+            _init_worker(self)
+            outcomes = [_run_root(task) for task in tasks]
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes, _init_worker, (self,))
+            try:
+                outcomes = pool.map(_run_root, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        for root, result in outcomes:
+            results[root] = result
+
+        return results
+
+
+# Mackup instance used by the processes of Mackup.run_roots()
+_worker_mackup = None
+
+
+def _init_worker(mckp):
+    """
+    Set the Mackup instance of a process of Mackup.run_roots().
+
+    Args:
+        mckp (Mackup)
+    """
+    global _worker_mackup
+    _worker_mackup = mckp
+
+
+def _run_root(task):
+    """
+    Run a backup, restore or uninstall in a home folder.
+
+    Args:
+        task (tuple): root, mode, apps, options
+
+    Returns:
+        (str, Result or Exception)
+    """
+    root, mode, apps, options = task
+    options = dict(options, home=root)
+    try:
+        return root, _worker_mackup.run(mode, apps, options)
+    except Exception as exc:
+        # A home failing must not lose the results of the others
+        return root, exc
+
+
+class Result(object):
+
+    """What a run did with each file of each application."""
+
+    def __init__(self, mode, dry_run):
+        """
+        Create a Result instance.
+
+        Args:
+            mode (str): 'backup', 'restore' or 'uninstall', see MODES
+            dry_run (bool): If True, the outcomes are what would have been
+                            done
+        """
+        self.mode = mode
+        self.dry_run = dry_run
+        self.outcomes = []
+
+    def get_outcomes(self, status=None, app_name=None):
+        """
+        Return the outcomes of the run, optionally filtered.
+
+        Args:
+            status (str): Only return the outcomes with this OUTCOME_*
+            app_name (str): Only return the outcomes of this application
+
+        Returns:
+            list of application.Outcome
+        """
+        return [outcome for outcome in self.outcomes
+                if status in (None, outcome.status) and
+                app_name in (None, outcome.app_name)]
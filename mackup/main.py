@@ -5,9 +5,13 @@ Copyright (C) 2013-2015 Laurent Raufaste <http://glop.org/>
 
 Usage:
   mackup list
-  mackup [options] backup
-  mackup [options] restore
+  mackup [options] backup [<home>...]
+  mackup [options] restore [<home>...]
   mackup [options] uninstall
+  mackup [options] undo
+  mackup [--socket=<path>] serve
+  mackup [options] watch
+  mackup [options] gc
   mackup (-h | --help)
   mackup --version
 
@@ -16,6 +20,27 @@ Options:
   -f --force    Force every question asked to be answered with "Yes".
   -n --dry-run  Show steps without executing.
   -v --verbose  Show additional details.
+  --conflicts=<policy>
+                How to solve the conflicts no rule of the config file
+                applies to: ask, ask-once, keep-home, keep-backup,
+                newer-wins or identical-skip.
+  --estimate    Show the files and bytes each application would copy, the
+                free space and the expected duration, without doing anything.
+  --stats       Show the time spent and the work done for each application.
+  --metrics-file=<file>
+                Write the metrics of the run to a file, in the Prometheus
+                textfile format if it ends with .prom, in JSON otherwise.
+  --trace=<file>
+                Write a timeline of the run to a file, in the Chrome trace
+                event format.
+  --profile=<profiler>
+                Profile the run with cpu (cProfile), running one application
+                at a time, or mem (tracemalloc), and write a report in the
+                current folder.
+  -j --jobs=<n>  Number of processes working on the homes given, one per CPU
+                by default.
+  --socket=<path>
+                Unix socket to listen on [default: ~/.mackup.sock].
   --version     Show version.
 
 Modes of action:
@@ -25,7 +50,18 @@ Modes of action:
     GnuPG.)
  3. restore: link the conf files already in your synced storage on your system,
     use it on any new system you use.
+    Both can work on the home folders given instead of yours, e.g. to
+    provision images or shared hosts, without asking anything. A single
+    home can be backed up at a time.
  4. uninstall: reset everything as it was before using Mackup.
+ 5. undo: put back every file deleted or replaced by the last run.
+ 6. serve: keep the config and the applications in memory, and run the
+    requests received on a Unix socket, see mackup/server.py.
+ 7. watch: back up the files replaced by their application as it happens,
+    on GNU/Linux. Conflicts default to newer-wins.
+ 8. gc: delete the links of your home to files gone from your synced storage,
+    the files this computer backed up that no application syncs anymore, and
+    the objects of the deduplicated storage no application refers to anymore.
 
 By default, Mackup syncs all application data (except for private keys) via
 Dropbox, but may be configured to exclude applications or use a different
@@ -34,12 +70,19 @@ backend with a .mackup.cfg file.
 See https://github.com/lra/mackup/tree/master/doc for more information.
 
 """
+import os
+import sys
+
 from docopt import docopt
-from .appsdb import ApplicationsDatabase
-from .application import ApplicationProfile
-from .constants import MACKUP_APP_NAME, VERSION
-from .mackup import Mackup
-from . import utils
+from .constants import (MACKUP_APP_NAME,
+                        OUTCOME_CONFLICT,
+                        POLICIES,
+                        POLICY_ASK_ONCE,
+                        POLICY_NEWER_WINS,
+                        PROFILE_CPU,
+                        PROFILE_MEM,
+                        PROFILES,
+                        VERSION)
 
 
 class ColorFormatCodes:
@@ -61,8 +104,54 @@ def main():
     # Get the command line arg
     args = docopt(__doc__, version="Mackup {}".format(VERSION))
 
-    mckp = Mackup()
-    app_db = ApplicationsDatabase()
+    profiler = None
+    if args['--profile'] is not None:
+        from . import utils
+        if args['--profile'] not in PROFILES:
+            utils.error("Unknown profiler: {}".format(args['--profile']))
+        if args['--profile'] == PROFILE_MEM and sys.version_info < (3, 4):
+            utils.error("Profiling the memory needs Python 3.4 or later")
+
+        from .profiling import Profiler
+        profiler = Profiler(args['--profile'])
+        profiler.start()
+
+    if args['--trace']:
+        from . import tracing
+        tracing.start()
+
+    from .errors import MackupError
+
+    # Also write what we have when a command fails, e.g. through utils.error()
+    try:
+        execute(args)
+    except MackupError as exc:
+        from . import utils
+        utils.error(str(exc))
+    finally:
+        if args['--trace']:
+            tracing.stop().write(args['--trace'])
+
+        if profiler is not None:
+            profiler.stop()
+            paths = profiler.write('mackup-{}'.format(profiler.mode))
+            print("Profile written to {} and {}".format(*paths))
+
+
+def execute(args):
+    """
+    Execute the command given on the command line.
+
+    Args:
+        args (dict): Command line arguments, as parsed by docopt
+    """
+    # The modules are imported by each command, only when needed, to start
+    # as fast as possible
+    from . import utils
+
+    conflicts = args['--conflicts']
+    if conflicts is not None and conflicts not in POLICIES:
+        utils.error("Unknown conflict policy: {}".format(conflicts))
 
     def printAppHeader(app_name):
         if verbose:
@@ -76,18 +165,187 @@ def main():
 
     verbose = args['--verbose']
 
+    if args['undo']:
+        from . import trash
+        run_id = trash.undo(utils.get_trash(), dry_run, verbose)
+        if run_id is None:
+            print("Nothing to undo.")
+        return
+
+    if args['serve']:
+        from . import server
+        server.serve(os.path.expanduser(args['--socket']))
+        return
+
+    from .mackup import Mackup
+
+    def new_mackup():
+        mckp = Mackup()
+        if conflicts is not None:
+            mckp.conflict_policy.default = conflicts
+        return mckp
+
+    mckp = new_mackup()
+    app_db = mckp.app_db
+
+    if args['list']:
+        # Display the list of supported applications
+        mckp.check_for_usable_environment()
+        output = "Supported applications:\n"
+        for app_name in sorted(app_db.get_app_names()):
+            output += " - {}\n".format(app_name)
+        output += "\n"
+        output += ("{} applications supported in Mackup v{}"
+                   .format(len(app_db.get_app_names()), VERSION))
+        print(output)
+        return
+
+    if args['gc']:
+        mckp.check_for_usable_environment()
+        # Before the objects, which the trees deleted might refer to
+        broken_links, orphans = mckp.sweep(dry_run=True)
+        if (broken_links or orphans) and not dry_run:
+            question = "The following files will be deleted:\n"
+            for path in broken_links:
+                question += " - {} (broken link)\n".format(path)
+            for path in orphans:
+                question += " - {} (no application syncs it)\n".format(path)
+            question += "Do you want to delete them ?"
+            if utils.confirm(question):
+                for path in broken_links + orphans:
+                    utils.delete(path)
+            else:
+                broken_links = orphans = []
+        elif verbose:
+            for path in broken_links:
+                print("Would delete the broken link {}".format(path))
+            for path in orphans:
+                print("Would delete {}, no application syncs it"
+                      .format(path))
+
+        deleted = mckp.collect_garbage(dry_run)
+        if verbose:
+            for object_path, _ in deleted:
+                print("{} {}".format("Would delete" if dry_run else "Deleting",
+                                     object_path))
+
+        would = "would be " if dry_run else ""
+        print("{} broken links and {} orphaned files {}deleted"
+              .format(len(broken_links), len(orphans), would))
+        print("{} objects {}deleted, {} bytes {}freed"
+              .format(len(deleted), would, sum(size for _, size in deleted),
+                      would))
+        return
+
+    if args['<home>']:
+        jobs = args['--jobs']
+        if jobs is not None and not jobs.isdigit():
+            utils.error("Invalid number of jobs: {}".format(jobs))
+
+        if args['backup'] and len(args['<home>']) > 1:
+            utils.error("A single home can be backed up at a time, they "
+                        "would all be backed up to the same files")
+
+        results = mckp.run_roots('backup' if args['backup'] else 'restore',
+                                 [os.path.abspath(home)
+                                  for home in args['<home>']],
+                                 options={'dry_run': dry_run},
+                                 processes=int(jobs) if jobs else None)
+        print_results(results, verbose)
+        return
+
+    from .application import ApplicationProfile
+    from . import metrics
+    from . import policy
+    from . import scheduler
+    from . import tracing
+    from . import trash
+
+    def run_app(app, operation):
+        """Run an operation of an app, recording its metrics and its span."""
+        with metrics.app(app.app_name):
+            with tracing.span(operation, 'app', dict(app=app.app_name)):
+                getattr(app, operation)()
+
+    def run_apps(apps, operation):
+        """Run an operation of apps, each after the ones it depends on."""
+        profiles = dict((app.app_name, app) for app in apps)
+        app_scheduler = mckp.get_scheduler(profiles, operation)
+
+        def run_one(app_name):
+            printAppHeader(app_name)
+            run_app(profiles[app_name], operation)
+
+        # Questions and verbose output of apps run together would get mixed,
+        # and cProfile only sees the thread it is started in
+        if ((dry_run or utils.FORCE_YES) and not verbose and
+                args['--profile'] != PROFILE_CPU):
+            jobs = scheduler.JOBS
+        else:
+            jobs = 1
+        app_scheduler.run(run_one, jobs)
+
+    if args['--estimate']:
+        mckp.check_for_usable_environment()
+        mode = ('backup' if args['backup'] else
+                'uninstall' if args['uninstall'] else 'restore')
+        apps = [ApplicationProfile(mckp,
+                                   app_db.get_files(app_name),
+                                   dry_run,
+                                   verbose,
+                                   app_name)
+                for app_name in sorted(mckp.get_apps_to_backup())]
+        run_estimate = mckp.get_estimate(mode, apps)
+        print(run_estimate.to_table())
+        if not run_estimate.has_enough_space():
+            utils.error("Not enough free space on {}"
+                        .format(run_estimate.target))
+        return
+
+    if args['--stats'] or args['--metrics-file']:
+        metrics.start('backup' if args['backup'] else
+                      'restore' if args['restore'] else
+                      'watch' if args['watch'] else 'uninstall')
+
+    # Purge the old runs from the trash while we work
+    purge_thread = trash.purge_in_background(utils.get_trash().root)
+
     if args['backup']:
         # Check the env where the command is being run
         mckp.check_for_usable_backup_env()
 
-        # Backup each application
-        for app_name in sorted(mckp.get_apps_to_backup()):
-            app = ApplicationProfile(mckp,
-                                     app_db.get_files(app_name),
-                                     dry_run,
-                                     verbose)
-            printAppHeader(app_name)
-            app.backup()
+        apps = [ApplicationProfile(mckp,
+                                   app_db.get_files(app_name),
+                                   dry_run,
+                                   verbose,
+                                   app_name)
+                for app_name in sorted(mckp.get_apps_to_backup())]
+
+        # Before anything gets deleted
+        if not dry_run:
+            mckp.check_free_space('backup', apps)
+
+        # Ask once for the conflicts that should be asked together
+        if (not dry_run and
+                mckp.conflict_policy.has_policy(POLICY_ASK_ONCE)):
+            with tracing.span('ask once', 'phase'):
+                mckp.conflict_policy.ask_once(
+                    [conflict for app in apps
+                     for conflict in app.get_conflicts()],
+                    policy.DECISION_KEEP_HOME)
+
+        # Backup each application, committed at once if staged
+        if not dry_run:
+            mckp.start_staging()
+        try:
+            run_apps(apps, 'backup')
+            mckp.commit_staging()
+        finally:
+            mckp.discard_staging()
+
+        if not dry_run:
+            mckp.save_store([app.app_name for app in apps])
+            mckp.record_backups([app.app_name for app in apps])
 
     elif args['restore']:
         # Check the env where the command is being run
@@ -98,27 +356,55 @@ def main():
         mackup_app = ApplicationProfile(mckp,
                                         app_db.get_files(MACKUP_APP_NAME),
                                         dry_run,
-                                        verbose)
+                                        verbose,
+                                        MACKUP_APP_NAME)
         printAppHeader(MACKUP_APP_NAME)
-        mackup_app.restore()
+        run_app(mackup_app, 'restore')
 
         # Initialize again the apps db, as the Mackup config might have changed
         # it
-        mckp = Mackup()
-        app_db = ApplicationsDatabase()
+        mckp = new_mackup()
+        app_db = mckp.app_db
 
         # Restore the rest of the app configs, using the restored Mackup config
         app_names = mckp.get_apps_to_backup()
         # Mackup has already been done
         app_names.discard(MACKUP_APP_NAME)
 
-        for app_name in sorted(app_names):
-            app = ApplicationProfile(mckp,
-                                     app_db.get_files(app_name),
-                                     dry_run,
-                                     verbose)
-            printAppHeader(app_name)
-            app.restore()
+        apps = [ApplicationProfile(mckp,
+                                   app_db.get_files(app_name),
+                                   dry_run,
+                                   verbose,
+                                   app_name)
+                for app_name in sorted(app_names)]
+
+        # Ask once for the conflicts that should be asked together
+        if (not dry_run and
+                mckp.conflict_policy.has_policy(POLICY_ASK_ONCE)):
+            with tracing.span('ask once', 'phase'):
+                mckp.conflict_policy.ask_once(
+                    [conflict for app in apps
+                     for conflict in app.get_conflicts(restore=True)],
+                    policy.DECISION_KEEP_BACKUP)
+
+        run_apps(apps, 'restore')
+
+    elif args['watch']:
+        # Check the env where the command is being run
+        mckp.check_for_usable_backup_env()
+
+        # Nobody is there to answer, and the file just written is usually
+        # the one to keep
+        if conflicts is None:
+            mckp.conflict_policy.default = POLICY_NEWER_WINS
+        mckp.interactive = False
+
+        from .watcher import Watcher
+        watcher = Watcher(mckp, mckp.get_apps_to_backup(), dry_run, verbose)
+        print("Watching the files of {} applications, press Ctrl+C to stop"
+              .format(len(set(app_name for app_name, _
+                              in watcher.paths.values()))))
+        watcher.run()
 
     elif args['uninstall']:
         # Check the env where the command is being run
@@ -131,26 +417,21 @@ def main():
                          " to their original place, in your home folder.\n"
                          "Are you sure ?")):
 
-            # Uninstall the apps except Mackup, which we'll uninstall last, to
-            # keep the settings as long as possible
-            app_names = mckp.get_apps_to_backup()
-            app_names.discard(MACKUP_APP_NAME)
-
-            for app_name in sorted(app_names):
-                app = ApplicationProfile(mckp,
-                                         app_db.get_files(app_name),
-                                         dry_run,
-                                         verbose)
-                printAppHeader(app_name)
-                app.uninstall()
-
-            # Restore the Mackup config before any other config, as we might
-            # need it to know about custom settings
-            mackup_app = ApplicationProfile(mckp,
-                                            app_db.get_files(MACKUP_APP_NAME),
-                                            dry_run,
-                                            verbose)
-            mackup_app.uninstall()
+            # Mackup is uninstalled last, to keep the settings as long as
+            # possible, and each app before the ones it depends on
+            apps = [ApplicationProfile(mckp,
+                                       app_db.get_files(app_name),
+                                       dry_run,
+                                       verbose,
+                                       app_name)
+                    for app_name in sorted(mckp.get_apps_to_backup() |
+                                           set([MACKUP_APP_NAME]))]
+
+            # Before anything gets deleted
+            if not dry_run:
+                mckp.check_free_space('uninstall', apps)
+
+            run_apps(apps, 'uninstall')
 
             # Delete the Mackup folder in Dropbox
             # Don't delete this as there might be other Macs that aren't
@@ -163,16 +444,48 @@ def main():
                   "\n"
                   "Thanks for using Mackup !")
 
-    elif args['list']:
-        # Display the list of supported applications
-        mckp.check_for_usable_environment()
-        output = "Supported applications:\n"
-        for app_name in sorted(app_db.get_app_names()):
-            output += " - {}\n".format(app_name)
-        output += "\n"
-        output += ("{} applications supported in Mackup v{}"
-                   .format(len(app_db.get_app_names()), VERSION))
-        print(output)
-
     # Delete the tmp folder
     mckp.clean_temp_folder()
+
+    # Let the purge of the trash finish
+    purge_thread.join()
+
+    run_metrics = metrics.stop()
+    if run_metrics is not None:
+        if args['--stats']:
+            print("\n" + run_metrics.to_table())
+        if args['--metrics-file']:
+            run_metrics.write(args['--metrics-file'])
+
+
+def print_results(results, verbose):
+    """
+    Print what has been done in each home, exiting on errors.
+
+    Args:
+        results (OrderedDict): As returned by Mackup.run_roots()
+        verbose (bool): Also print the conflicts left as they are
+    """
+    from . import utils
+
+    failures = 0
+    for home, result in results.items():
+        if isinstance(result, Exception):
+            failures += 1
+            print("{}: {}".format(home, result))
+            continue
+
+        statuses = dict()
+        for outcome in result.outcomes:
+            statuses[outcome.status] = statuses.get(outcome.status, 0) + 1
+        print("{}: {}".format(home, ", ".join(
+            "{} {}".format(count, status)
+            for status, count in sorted(statuses.items()))))
+
+        if verbose:
+            for outcome in result.get_outcomes(OUTCOME_CONFLICT):
+                print("  Conflict left as is: {}"
+                      .format(outcome.home_filepath))
+
+    if failures:
+        utils.error("{} of {} homes failed".format(failures, len(results)))
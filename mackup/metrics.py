@@ -0,0 +1,298 @@
+"""
+Run metrics.
+
+When enabled, Mackup records for each application it processes: the time
+spent on it, the number of paths examined, the operations done by type, the
+bytes copied, the conflicts hit and the time spent waiting for the user to
+answer a prompt. They can be printed at the end of the run, or written to a
+file, as JSON or in the Prometheus textfile format.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# Metrics of the current run, None when they are not collected
+_run = None
+
+# Application being processed, per thread
+_local = threading.local()
+
+# Counters recorded for each application
+APP_COUNTERS = ['duration', 'paths', 'bytes_copied', 'conflicts',
+                'prompt_wait']
+
+# Description and unit of each counter, for the Prometheus format
+PROMETHEUS_METRICS = OrderedDict([
+    ('duration', ('mackup_app_duration_seconds',
+                  'Time spent processing the application.')),
+    ('paths', ('mackup_app_paths_examined',
+               'Number of paths examined for the application.')),
+    ('operations', ('mackup_app_operations',
+                    'Number of operations done for the application.')),
+    ('bytes_copied', ('mackup_app_bytes_copied',
+                      'Number of bytes copied for the application.')),
+    ('conflicts', ('mackup_app_conflicts',
+                   'Number of conflicts hit for the application.')),
+    ('prompt_wait', ('mackup_app_prompt_wait_seconds',
+                     'Time spent waiting for the user to answer.')),
+])
+
+
+class RunMetrics(object):
+
+    """Metrics of a run, per application."""
+
+    def __init__(self, command):
+        """
+        Create a RunMetrics instance.
+
+        Args:
+            command (str): e.g. 'backup'
+        """
+        self.command = command
+        self.start = time.time()
+        self.duration = None
+        self.apps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, app_name, counter, value=1):
+        """
+        Add a value to a counter of an application.
+
+        Args:
+            app_name (str): None for the work not done for a single
+                            application
+            counter (str): One of APP_COUNTERS, or 'operations.<type>'
+            value (int or float)
+        """
+        with self._lock:
+            if app_name not in self.apps:
+                self.apps[app_name] = OrderedDict(
+                    [(name, 0) for name in APP_COUNTERS] +
+                    [('operations', OrderedDict())])
+            app = self.apps[app_name]
+
+            if counter.startswith('operations.'):
+                operation = counter[len('operations.'):]
+                app['operations'][operation] = (
+                    app['operations'].get(operation, 0) + value)
+            else:
+                app[counter] += value
+
+    def to_dict(self):
+        """
+        Return the metrics as a dict, ready to be dumped as JSON.
+
+        Returns:
+            dict
+        """
+        return OrderedDict([('command', self.command),
+                            ('start', self.start),
+                            ('duration', self.duration),
+                            ('apps', OrderedDict(
+                                (app_name, app)
+                                for app_name, app in self.apps.items()
+                                if app_name is not None)),
+                            # e.g. the prompt of the ask-once policy, asked
+                            # for every app
+                            ('unattributed', self.apps.get(None))])
+
+    def to_prometheus(self):
+        """
+        Return the metrics in the Prometheus textfile format.
+
+        Returns:
+            str
+        """
+        lines = []
+        for counter, (name, description) in PROMETHEUS_METRICS.items():
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} gauge'.format(name))
+            for app_name, app in self.apps.items():
+                if app_name is None:
+                    continue
+                labels = 'app="{}",command="{}"'.format(
+                    _escape_label(app_name), _escape_label(self.command))
+                if counter == 'operations':
+                    for operation, value in app['operations'].items():
+                        lines.append('{}{{{},operation="{}"}} {}'
+                                     .format(name, labels,
+                                             _escape_label(operation), value))
+                else:
+                    lines.append('{}{{{}}} {}'
+                                 .format(name, labels, app[counter]))
+
+        lines.append('# HELP mackup_run_duration_seconds'
+                     ' Time spent on the whole run.')
+        lines.append('# TYPE mackup_run_duration_seconds gauge')
+        lines.append('mackup_run_duration_seconds{{command="{}"}} {}'
+                     .format(_escape_label(self.command), self.duration))
+        lines.append('# HELP mackup_run_timestamp_seconds'
+                     ' When the last run started.')
+        lines.append('# TYPE mackup_run_timestamp_seconds gauge')
+        lines.append('mackup_run_timestamp_seconds{{command="{}"}} {}'
+                     .format(_escape_label(self.command), self.start))
+
+        return '\n'.join(lines) + '\n'
+
+    def to_table(self):
+        """
+        Return the metrics as a table, to be displayed.
+
+        Returns:
+            str
+        """
+        line = '{:<30} {:>9} {:>6} {:>5} {:>12} {:>9} {:>11}'
+        lines = [line.format('Application', 'Time (s)', 'Paths', 'Ops',
+                             'Bytes', 'Conflicts', 'Prompt (s)')]
+        for app_name, app in self.apps.items():
+            if app_name is None:
+                continue
+            lines.append(line.format(app_name,
+                                     '{:.3f}'.format(app['duration']),
+                                     app['paths'],
+                                     sum(app['operations'].values()),
+                                     app['bytes_copied'],
+                                     app['conflicts'],
+                                     '{:.1f}'.format(app['prompt_wait'])))
+        lines.append('Total: {:.3f}s'.format(self.duration or 0))
+
+        return '\n'.join(lines)
+
+    def write(self, filepath):
+        """
+        Write the metrics to a file, atomically.
+
+        Files ending with .prom get the Prometheus textfile format, as read by
+        the node exporter, other files get JSON.
+
+        Args:
+            filepath (str)
+        """
+        if filepath.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            import json
+            content = json.dumps(self.to_dict(), indent=2) + '\n'
+
+        # Never let a collector read a half written file
+        tmp_filepath = '{}.{}.tmp'.format(filepath, os.getpid())
+        with open(tmp_filepath, 'w') as f_metrics:
+            f_metrics.write(content)
+        os.rename(tmp_filepath, filepath)
+
+
+def start(command):
+    """
+    Start collecting the metrics of a run.
+
+    Args:
+        command (str): e.g. 'backup'
+
+    Returns:
+        RunMetrics
+    """
+    global _run
+    _run = RunMetrics(command)
+
+    return _run
+
+
+def stop():
+    """
+    Stop collecting the metrics.
+
+    Returns:
+        RunMetrics, or None if they were not collected
+    """
+    global _run
+    run, _run = _run, None
+    if run is not None:
+        run.duration = time.time() - run.start
+
+    return run
+
+
+def is_enabled():
+    """
+    Check if the metrics are collected.
+
+    Returns:
+        bool
+    """
+    return _run is not None
+
+
+def add(counter, value=1):
+    """
+    Add a value to a counter of the application being processed.
+
+    Does nothing when the metrics are not collected.
+
+    Args:
+        counter (str): One of APP_COUNTERS
+        value (int or float)
+    """
+    if _run is not None:
+        _run.add(getattr(_local, 'app_name', None), counter, value)
+
+
+def add_operation(operation):
+    """
+    Count an operation done for the application being processed.
+
+    Args:
+        operation (str): e.g. 'copy'
+    """
+    add('operations.' + operation)
+
+
+@contextmanager
+def app(app_name):
+    """
+    Attribute the metrics recorded in this context to an application.
+
+    Args:
+        app_name (str)
+    """
+    previous = getattr(_local, 'app_name', None)
+    _local.app_name = app_name
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        add('duration', time.time() - start_time)
+        _local.app_name = previous
+
+
+@contextmanager
+def timer(counter):
+    """
+    Add the time spent in this context to a counter.
+
+    Args:
+        counter (str): e.g. 'prompt_wait'
+    """
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        add(counter, time.time() - start_time)
+
+
+def _escape_label(value):
+    """
+    Escape a label value of the Prometheus textfile format.
+
+    Args:
+        value (str): e.g. an application name, taken from its config file
+
+    Returns:
+        str
+    """
+    return (value.replace('\\', '\\\\')
+            .replace('"', '\\"')
+            .replace('\n', '\\n'))
@@ -0,0 +1,408 @@
+"""
+Content-addressed storage.
+
+With the deduplicated engine, the content of each file is stored once, as an
+object named after its SHA-256 hash, in an objects folder shared by every
+Mackup directory of the storage path. The files of each application are
+listed in a tree, a JSON file in the Mackup folder, with the hash of each of
+them.
+
+A backup only writes the objects missing from the storage, so the same plugin
+or theme used by many applications, or by many users of a shared storage, is
+stored and synced once. The objects no tree refers to anymore are deleted by
+collect_garbage().
+
+Like with the packed engine, the files are materialized in a local cache
+folder, where the links of the home point to.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from . import utils
+from .constants import MACKUP_OBJECTS_DIR
+from .errors import CorruptStorageError
+
+
+# Extension of the trees
+TREE_EXTENSION = '.json'
+
+# Version of the format of the trees, also telling them from other JSON files
+TREE_FORMAT = 1
+
+# Seconds during which an object newly referenced is not collected, as the
+# tree referring to it might be written, or synced, after it
+GC_GRACE_PERIOD = 24 * 60 * 60
+
+# Folder of the objects folder listing the Mackup folders whose trees refer to
+# its objects, a file holding the path of each, relative to the storage
+FOLDERS_DIR = '.folders'
+
+
+def get_objects_folder(storage_path):
+    """
+    Get the folder of the objects shared by the Mackup folders of a storage.
+
+    Args:
+        storage_path (str): Path of the storage, e.g. ~/Dropbox
+
+    Returns:
+        str
+    """
+    return os.path.join(storage_path, MACKUP_OBJECTS_DIR)
+
+
+def get_tree_path(mackup_folder, app_name):
+    """
+    Get the path of the tree of an application.
+
+    Args:
+        mackup_folder (str): Folder storing the trees
+        app_name (str)
+
+    Returns:
+        str
+    """
+    return os.path.join(mackup_folder, app_name + TREE_EXTENSION)
+
+
+def get_tree_paths(mackup_folder):
+    """
+    Get the paths of the trees of a Mackup folder.
+
+    Args:
+        mackup_folder (str)
+
+    Returns:
+        list: Sorted paths
+    """
+    return [os.path.join(mackup_folder, filename)
+            for filename in sorted(os.listdir(mackup_folder))
+            if filename.endswith(TREE_EXTENSION)]
+
+
+def read_tree(tree_path):
+    """
+    Read a tree.
+
+    Args:
+        tree_path (str)
+
+    Returns:
+        dict: [hash, size, mtime] of each file, None for folders, by name,
+              empty if there is no tree
+
+    Raises:
+        CorruptStorageError: If the file is not a tree
+    """
+    if not os.path.exists(tree_path):
+        return {}
+
+    try:
+        with open(tree_path) as f_tree:
+            tree = json.load(f_tree)
+        if tree.get('format') != TREE_FORMAT:
+            raise ValueError(tree_path)
+    except (ValueError, AttributeError):
+        raise CorruptStorageError("Unable to read the tree: {}"
+                                  .format(tree_path))
+
+    return tree['entries']
+
+
+def save(tree_path, objects_folder, folder, filenames, excluded=None):
+    """
+    Store files of a folder.
+
+    Only the objects missing from the storage are written. The hash of a file
+    whose size and modification time match its entry in the previous tree is
+    not computed again. Entries of the previous tree missing from the folder
+    are kept, as Mackup never deletes backups.
+
+    Args:
+        tree_path (str)
+        objects_folder (str)
+        folder (str): Folder holding the files, the cache
+        filenames (iterable): Files or folders to store, relative to folder
+        excluded (function): Tells if a path relative to folder is excluded
+
+    Returns:
+        int: Number of objects written
+    """
+    old_entries = read_tree(tree_path)
+    entries = dict(old_entries)
+    written = 0
+
+    for name in utils.walk_synced(folder, filenames, excluded):
+        path = os.path.join(folder, name)
+        if name.endswith('/'):
+            entries[name] = None
+            continue
+
+        stat = os.stat(path)
+        old_entry = old_entries.get(name)
+        if (old_entry is not None and
+                old_entry[1] == stat.st_size and
+                old_entry[2] == stat.st_mtime):
+            continue
+
+        digest = _get_hash(path)
+        if _put_object(objects_folder, digest, path):
+            written += 1
+        elif old_entry is None or old_entry[0] != digest:
+            # Referenced again, restart its grace period
+            os.utime(_get_object_path(objects_folder, digest), None)
+        entries[name] = [digest, stat.st_size, stat.st_mtime]
+
+    if entries != old_entries:
+        _register_folder(objects_folder, os.path.dirname(tree_path))
+        _write_json(tree_path, dict(format=TREE_FORMAT, entries=entries))
+
+    return written
+
+
+def load(tree_path, objects_folder, folder):
+    """
+    Copy the files of a tree that changed into a folder.
+
+    Files of the folder newer than their entry have been changed locally,
+    and are not replaced, the next backup stores them.
+
+    Args:
+        tree_path (str)
+        objects_folder (str)
+        folder (str): The cache
+
+    Returns:
+        list: Names of the copied files
+
+    Raises:
+        CorruptStorageError: If an object is missing, e.g. not synced yet
+    """
+    copied = []
+    for name, entry in sorted(read_tree(tree_path).items()):
+        target = os.path.normpath(os.path.join(folder, name))
+        # Never write out of the folder
+        if not target.startswith(os.path.join(folder, '')):
+            continue
+
+        if entry is None:
+            if not os.path.isdir(target):
+                os.makedirs(target)
+            continue
+
+        digest, size, mtime = entry
+        if os.path.lexists(target):
+            if os.path.islink(target) or os.path.isdir(target):
+                continue
+            stat = os.stat(target)
+            if ((stat.st_size == size and stat.st_mtime == mtime) or
+                    stat.st_mtime > mtime or
+                    _get_hash(target) == digest):
+                continue
+
+        object_path = _get_object_path(objects_folder, digest)
+        if not os.path.exists(object_path):
+            raise CorruptStorageError("Unable to find the object of {}: {}"
+                                      .format(name, object_path))
+
+        if not os.path.isdir(os.path.dirname(target)):
+            os.makedirs(os.path.dirname(target))
+        temp_path = target + '.tmp'
+        shutil.copyfile(object_path, temp_path)
+        os.chmod(temp_path, 0o600)
+        os.utime(temp_path, (mtime, mtime))
+        os.rename(temp_path, target)
+
+        copied.append(name)
+
+    return copied
+
+
+def collect_garbage(storage_path, mackup_folder, dry_run=False):
+    """
+    Delete the objects no tree of the storage refers to.
+
+    The trees of every Mackup folder of the storage using the objects count,
+    whatever its directory. Objects written or referenced again less than
+    GC_GRACE_PERIOD ago are kept, as the tree referring to them might not be
+    synced yet.
+
+    Args:
+        storage_path (str)
+        mackup_folder (str): Folder storing the trees of this computer
+        dry_run (bool): Only return what would be deleted
+
+    Returns:
+        list of (str, int): Path and size of each deleted object
+    """
+    objects_folder = get_objects_folder(storage_path)
+    if not os.path.isdir(objects_folder):
+        return []
+
+    referenced = set()
+    for folder in sorted(set(_get_folders(objects_folder)) |
+                         set([mackup_folder])):
+        if os.path.isdir(folder):
+            for tree_path in get_tree_paths(folder):
+                referenced.update(_get_hashes(tree_path))
+
+    deleted = []
+    max_mtime = time.time() - GC_GRACE_PERIOD
+    for prefix in sorted(os.listdir(objects_folder)):
+        if prefix.startswith('.'):
+            continue
+        prefix_folder = os.path.join(objects_folder, prefix)
+        for suffix in sorted(os.listdir(prefix_folder)):
+            object_path = os.path.join(prefix_folder, suffix)
+            stat = os.stat(object_path)
+            if prefix + suffix in referenced or stat.st_mtime > max_mtime:
+                continue
+            if not dry_run:
+                os.remove(object_path)
+            deleted.append((object_path, stat.st_size))
+
+    return deleted
+
+
+def _register_folder(objects_folder, mackup_folder):
+    """
+    Add a Mackup folder to the ones using an objects folder.
+
+    Args:
+        objects_folder (str)
+        mackup_folder (str): Folder storing trees
+    """
+    relpath = os.path.relpath(mackup_folder, os.path.dirname(objects_folder))
+    folders_dir = os.path.join(objects_folder, FOLDERS_DIR)
+    marker = os.path.join(folders_dir,
+                          hashlib.sha256(relpath.encode('utf-8')).hexdigest())
+    if os.path.exists(marker):
+        return
+
+    if not os.path.isdir(folders_dir):
+        os.makedirs(folders_dir)
+    _write_json(marker, dict(path=relpath))
+
+
+def _get_folders(objects_folder):
+    """
+    Get the Mackup folders using an objects folder.
+
+    Args:
+        objects_folder (str)
+
+    Returns:
+        list: Full paths of the folders
+    """
+    folders_dir = os.path.join(objects_folder, FOLDERS_DIR)
+    if not os.path.isdir(folders_dir):
+        return []
+
+    folders = []
+    for name in sorted(os.listdir(folders_dir)):
+        try:
+            with open(os.path.join(folders_dir, name)) as f_marker:
+                relpath = json.load(f_marker)['path']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            # e.g. a conflicted copy made by the sync client
+            continue
+        folders.append(os.path.normpath(os.path.join(
+            os.path.dirname(objects_folder), relpath)))
+
+    return folders
+
+
+def _get_hashes(tree_path):
+    """
+    Get the hashes a JSON file refers to, if it is a tree.
+
+    Args:
+        tree_path (str)
+
+    Returns:
+        set
+    """
+    try:
+        entries = read_tree(tree_path)
+    except CorruptStorageError:
+        # Not a tree
+        return set()
+
+    return set(entry[0] for entry in entries.values() if entry is not None)
+
+
+def _get_hash(path):
+    """
+    Compute the SHA-256 of a file.
+
+    Args:
+        path (str)
+
+    Returns:
+        str: Hexadecimal digest
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f_path:
+        for chunk in iter(lambda: f_path.read(64 * 1024), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def _get_object_path(objects_folder, digest):
+    """
+    Get the path of an object.
+
+    Objects are spread in 256 folders, named after the first 2 characters of
+    their hash, to keep the folders small.
+
+    Args:
+        objects_folder (str)
+        digest (str)
+
+    Returns:
+        str
+    """
+    return os.path.join(objects_folder, digest[:2], digest[2:])
+
+
+def _put_object(objects_folder, digest, path):
+    """
+    Store the content of a file as an object, unless it is already stored.
+
+    Args:
+        objects_folder (str)
+        digest (str): Hash of the file
+        path (str)
+
+    Returns:
+        bool: True if the object has been written
+    """
+    object_path = _get_object_path(objects_folder, digest)
+    if os.path.exists(object_path):
+        return False
+
+    if not os.path.isdir(os.path.dirname(object_path)):
+        os.makedirs(os.path.dirname(object_path))
+    temp_path = '{}.{}.tmp'.format(object_path, os.getpid())
+    shutil.copyfile(path, temp_path)
+    os.rename(temp_path, object_path)
+
+    return True
+
+
+def _write_json(filepath, data):
+    """
+    Replace a file with JSON data at once.
+
+    Args:
+        filepath (str)
+        data (dict)
+    """
+    temp_path = filepath + '.tmp'
+    with open(temp_path, 'w') as f_tmp:
+        json.dump(data, f_tmp, indent=1, sort_keys=True)
+    os.rename(temp_path, filepath)
@@ -0,0 +1,333 @@
+"""
+Packed storage.
+
+With the packed engine, the files of each application are stored in a single
+compressed zip file, a pack, instead of one file in the storage per file of
+the home. Syncing a few packs is cheaper for the storage than syncing many
+small files.
+
+The central directory of a zip file is an index of its members, with their
+size and checksum, so a single member can be read or extracted without
+reading the whole pack.
+
+The files are materialized in a local cache folder, where the links of the
+home point to.
+
+Zip files store the time of their members to 2 seconds, in local time. Each
+pack also holds a manifest, with the exact modification time of its files.
+"""
+import json
+import os
+import shutil
+import time
+import zipfile
+import zlib
+
+from . import utils
+from .errors import PackError
+
+
+# Extension of the packs
+PACK_EXTENSION = '.zip'
+
+# Member holding the modification time of the other members
+PACK_MANIFEST = '.mackup-pack.json'
+
+# Range of the times of the zip file members
+ZIP_MIN_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_MAX_DATE_TIME = (2107, 12, 31, 23, 59, 58)
+
+
+def get_pack_path(pack_folder, app_name):
+    """
+    Get the path of the pack of an application.
+
+    Args:
+        pack_folder (str): Folder storing the packs
+        app_name (str)
+
+    Returns:
+        str
+    """
+    return os.path.join(pack_folder, app_name + PACK_EXTENSION)
+
+
+def get_pack_paths(pack_folder):
+    """
+    Get the paths of the packs of a folder.
+
+    Args:
+        pack_folder (str)
+
+    Returns:
+        list: Sorted paths
+    """
+    return [os.path.join(pack_folder, filename)
+            for filename in sorted(os.listdir(pack_folder))
+            if filename.endswith(PACK_EXTENSION)]
+
+
+def read_index(pack_path):
+    """
+    Read the index of a pack, without reading its members.
+
+    Args:
+        pack_path (str)
+
+    Returns:
+        dict: zipfile.ZipInfo of each member, by name, empty if there is no
+              pack
+
+    Raises:
+        PackError: If the file is not a pack
+    """
+    if not os.path.exists(pack_path):
+        return {}
+
+    with _open(pack_path) as pack:
+        return dict((info.filename, info) for info in pack.infolist()
+                    if info.filename != PACK_MANIFEST)
+
+
+def save(pack_path, folder, filenames, excluded=None):
+    """
+    Pack files of a folder.
+
+    The pack is only written if its content changes, and then replaced at
+    once, so the storage never syncs half of a pack. Members of the previous
+    pack missing from the folder are kept, as Mackup never deletes backups.
+
+    Args:
+        pack_path (str)
+        folder (str): Folder holding the files, the cache
+        filenames (iterable): Files or folders to pack, relative to folder
+        excluded (function): Tells if a path relative to folder is excluded
+
+    Returns:
+        bool: True if the pack has been written
+    """
+    index = read_index(pack_path)
+    names = list(utils.walk_synced(folder, filenames, excluded))
+
+    if all(name in index and
+           _is_same(os.path.join(folder, name), index[name])
+           for name in names):
+        return False
+
+    mtimes = {}
+    temp_path = pack_path + '.tmp'
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as pack:
+            for name in names:
+                path = os.path.join(folder, name)
+                _write_member(pack, path, name)
+                mtimes[name] = os.path.getmtime(path)
+
+            kept = sorted(set(index) - set(names))
+            if kept:
+                with _open(pack_path) as old_pack:
+                    old_mtimes = _read_manifest(old_pack)
+                    for name in kept:
+                        pack.writestr(index[name], old_pack.read(name))
+                        if name in old_mtimes:
+                            mtimes[name] = old_mtimes[name]
+
+            pack.writestr(PACK_MANIFEST, json.dumps(mtimes, sort_keys=True))
+        os.rename(temp_path, pack_path)
+    except BaseException:
+        # Never leave half of a pack in the storage
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return True
+
+
+def load(pack_path, folder):
+    """
+    Extract the members of a pack that changed into a folder.
+
+    Members already in the folder are not read. Files of the folder newer
+    than their member have been changed locally, and are not replaced
+    either, the next backup packs them.
+
+    Args:
+        pack_path (str)
+        folder (str): The cache
+
+    Returns:
+        list: Names of the extracted members
+    """
+    extracted = []
+    with _open(pack_path) as pack:
+        mtimes = _read_manifest(pack)
+        for info in pack.infolist():
+            if info.filename == PACK_MANIFEST:
+                continue
+
+            mtime = mtimes.get(info.filename, _get_mtime(info))
+            target = os.path.normpath(os.path.join(folder, info.filename))
+            # Never write out of the folder
+            if not target.startswith(os.path.join(folder, '')):
+                continue
+
+            if info.filename.endswith('/'):
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                continue
+
+            if _is_current(target, info, mtime):
+                continue
+
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+
+            temp_path = target + '.tmp'
+            with pack.open(info) as f_src, open(temp_path, 'wb') as f_dst:
+                shutil.copyfileobj(f_src, f_dst)
+            mode = (info.external_attr >> 16) & 0o777
+            os.chmod(temp_path, mode or 0o600)
+            os.utime(temp_path, (mtime, mtime))
+            os.rename(temp_path, target)
+
+            extracted.append(info.filename)
+
+    return extracted
+
+
+def _open(pack_path):
+    """
+    Open a pack to read it.
+
+    Args:
+        pack_path (str)
+
+    Returns:
+        zipfile.ZipFile
+
+    Raises:
+        PackError: If the file is not a pack
+    """
+    try:
+        return zipfile.ZipFile(pack_path)
+    except zipfile.BadZipfile:
+        raise PackError("Unable to read the pack: {}".format(pack_path))
+
+
+def _write_member(pack, path, name):
+    """
+    Add a file or a folder to a pack.
+
+    Zip files only store times from 1980 to 2107, e.g. the files of nix or of
+    reproducible builds, dated 1970, are stored with the closest time. Their
+    exact time is kept by the manifest.
+
+    Args:
+        pack (zipfile.ZipFile): Pack being written
+        path (str): File or folder to add
+        name (str): Name of the member
+    """
+    stat = os.stat(path)
+    date_time = time.localtime(stat.st_mtime)[:6]
+    if ZIP_MIN_DATE_TIME <= date_time <= ZIP_MAX_DATE_TIME:
+        pack.write(path, name)
+        return
+
+    date_time = min(max(date_time, ZIP_MIN_DATE_TIME), ZIP_MAX_DATE_TIME)
+    if os.path.isdir(path):
+        info = zipfile.ZipInfo(name.rstrip('/') + '/', date_time)
+        info.external_attr = (stat.st_mode & 0xFFFF) << 16 | 0x10
+        pack.writestr(info, b'')
+    else:
+        info = zipfile.ZipInfo(name, date_time)
+        info.external_attr = (stat.st_mode & 0xFFFF) << 16
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with open(path, 'rb') as f_path:
+            pack.writestr(info, f_path.read())
+
+
+def _read_manifest(pack):
+    """
+    Read the modification time of the members of a pack.
+
+    Args:
+        pack (zipfile.ZipFile)
+
+    Returns:
+        dict: Timestamp of each member, by name, empty for the packs written
+              before the manifest
+    """
+    try:
+        return json.loads(pack.read(PACK_MANIFEST).decode('utf-8'))
+    except KeyError:
+        return {}
+
+
+def _is_same(path, info):
+    """
+    Check if a file has the content of a member.
+
+    Args:
+        path (str)
+        info (zipfile.ZipInfo)
+
+    Returns:
+        bool
+    """
+    if info.filename.endswith('/'):
+        return os.path.isdir(path)
+
+    return (os.path.getsize(path) == info.file_size and
+            _get_crc(path) == info.CRC)
+
+
+def _is_current(path, info, mtime):
+    """
+    Check if a file of the cache needs no extraction of its member.
+
+    Args:
+        path (str)
+        info (zipfile.ZipInfo)
+        mtime (float): Modification time of the member
+
+    Returns:
+        bool
+    """
+    if not os.path.lexists(path):
+        return False
+    if os.path.islink(path) or os.path.isdir(path):
+        return True
+
+    return (_is_same(path, info) or
+            os.path.getmtime(path) > mtime)
+
+
+def _get_crc(path):
+    """
+    Compute the CRC-32 of a file, as stored in zip files.
+
+    Args:
+        path (str)
+
+    Returns:
+        int
+    """
+    crc = 0
+    with open(path, 'rb') as f_path:
+        for chunk in iter(lambda: f_path.read(64 * 1024), b''):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc & 0xffffffff
+
+
+def _get_mtime(info):
+    """
+    Get the modification time of a member, as stored in the zip file.
+
+    Args:
+        info (zipfile.ZipInfo)
+
+    Returns:
+        float
+    """
+    return time.mktime(info.date_time + (0, 0, -1))
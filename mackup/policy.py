@@ -0,0 +1,170 @@
+"""
+The Conflict Policy.
+
+A conflict happens when a file exists both in the home and in the Mackup
+folder, and they are not linked together. Instead of asking about each
+conflict, the user can set policies, per application or per file pattern,
+to solve them without any prompt.
+"""
+import fnmatch
+import os
+
+from .constants import (POLICY_ASK,
+                        POLICY_ASK_ONCE,
+                        POLICY_IDENTICAL_SKIP,
+                        POLICY_KEEP_BACKUP,
+                        POLICY_KEEP_HOME,
+                        POLICY_NEWER_WINS)
+from . import utils
+
+
+# Decisions taken for a conflict
+DECISION_ASK = 'ask'
+DECISION_KEEP_BACKUP = 'keep-backup'
+DECISION_KEEP_HOME = 'keep-home'
+DECISION_SKIP = 'skip'
+
+
+class ConflictPolicy(object):
+
+    """Rules used to solve the conflicts of a run."""
+
+    def __init__(self, rules=None, default=POLICY_ASK, quick=False):
+        """
+        Create a ConflictPolicy instance.
+
+        Args:
+            rules (dict): Policy for each application name or file pattern,
+                          e.g. {'ssh': 'keep-home', '.config/*': 'newer-wins'}
+            default (str): Policy used when no rule matches
+            quick (bool): Never read the files, for storages where reading
+                          is slow or downloads the file. Identical files are
+                          then only told apart for identical-skip, see
+                          utils.is_identical()
+        """
+        self.rules = dict(rules or {})
+        self.default = default
+        self.quick = quick
+        self._decisions = dict()
+
+    def has_policy(self, policy):
+        """
+        Check if a policy is used by any rule, or by default.
+
+        Args:
+            policy (str)
+
+        Returns:
+            bool
+        """
+        return policy == self.default or policy in self.rules.values()
+
+    def get_policy(self, app_name, filename):
+        """
+        Return the policy to apply to a file.
+
+        File patterns have priority over application names.
+
+        Args:
+            app_name (str): Name of the application, e.g. 'ssh'
+            filename (str): Path of the file, relative to the home
+
+        Returns:
+            str
+        """
+        for pattern, policy in self.rules.items():
+            # Option names are lowercased by the config parser
+            if fnmatch.fnmatch(filename.lower(), pattern):
+                return policy
+
+        return self.rules.get(app_name, self.default)
+
+    def resolve(self, app_name, filename, home_filepath, mackup_filepath,
+                excluded=None):
+        """
+        Decide what to do with a conflict.
+
+        Files with the same content are linked to the backup without asking,
+        unless the identical-skip policy applies. Only when the contents can
+        be read, the policy decides otherwise.
+
+        Args:
+            app_name (str): Name of the application, e.g. 'ssh'
+            filename (str): Path of the file, relative to the home
+            home_filepath (str): Full path of the file in the home
+            mackup_filepath (str): Full path of the file in the Mackup folder
+            excluded (function): Tells if a path in the home folder is
+                                 excluded, see utils.get_excluded()
+
+        Returns:
+            One of the DECISION_* constants
+        """
+        if home_filepath in self._decisions:
+            return self._decisions[home_filepath]
+
+        policy = self.get_policy(app_name, filename)
+
+        if policy == POLICY_IDENTICAL_SKIP:
+            # Skipping loses nothing, the same size and modification time is
+            # enough, the contents are read otherwise unless it is slow
+            if (utils.is_identical(home_filepath, mackup_filepath, excluded,
+                                   quick=True) or
+                    not self.quick and utils.is_identical(
+                        home_filepath, mackup_filepath, excluded)):
+                decision = DECISION_SKIP
+            else:
+                decision = DECISION_ASK
+        elif not self.quick and utils.is_identical(home_filepath,
+                                                   mackup_filepath, excluded):
+            # Nothing can be lost, just link to the backup, which does not
+            # copy anything
+            decision = DECISION_KEEP_BACKUP
+        elif policy == POLICY_KEEP_HOME:
+            decision = DECISION_KEEP_HOME
+        elif policy == POLICY_KEEP_BACKUP:
+            decision = DECISION_KEEP_BACKUP
+        elif policy == POLICY_NEWER_WINS:
+            if (os.path.getmtime(home_filepath) >
+                    os.path.getmtime(mackup_filepath)):
+                decision = DECISION_KEEP_HOME
+            else:
+                decision = DECISION_KEEP_BACKUP
+        else:
+            decision = DECISION_ASK
+
+        return decision
+
+    def ask_once(self, conflicts, replace_decision):
+        """
+        Ask a single question for every conflict using the ask-once policy.
+
+        The answer is remembered and returned by resolve() for each of them.
+
+        Args:
+            conflicts (list): (app_name, filename, home_filepath,
+                              mackup_filepath, excluded) tuples, the
+                              arguments of resolve()
+            replace_decision (str): Decision to take if the user answers yes,
+                                    the conflicts are skipped otherwise
+        """
+        to_ask = [conflict for conflict in conflicts
+                  if self.get_policy(conflict[0], conflict[1]) ==
+                  POLICY_ASK_ONCE and self.resolve(*conflict) == DECISION_ASK]
+        if not to_ask:
+            return
+
+        question = "The following files are in conflict:\n"
+        for app_name, filename, _, _, _ in to_ask:
+            question += " - {} ({})\n".format(filename, app_name)
+        if replace_decision == DECISION_KEEP_HOME:
+            question += "Do you want to replace them in the backup ?"
+        else:
+            question += "Do you want to replace them with your backup ?"
+
+        if utils.confirm(question):
+            decision = replace_decision
+        else:
+            decision = DECISION_SKIP
+
+        for _, _, home_filepath, _, _ in to_ask:
+            self._decisions[home_filepath] = decision
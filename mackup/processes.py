@@ -0,0 +1,119 @@
+"""
+Running processes.
+
+An application overwriting its config files while Mackup moves them can
+corrupt them, so the applications declare their processes in the [processes]
+section of their config. The running processes are listed once per run,
+reading /proc where there is one, without spawning a process per
+application.
+"""
+import os
+
+
+# Length of the names in /proc/<pid>/comm, longer names are truncated
+COMM_LENGTH = 15
+
+
+class RunningProcesses(object):
+
+    """Names of the processes running when listed."""
+
+    def __init__(self, names=None):
+        """
+        Create a RunningProcesses instance.
+
+        Args:
+            names (iterable): Names of the running processes, listed with
+                              get_process_names() if not given
+        """
+        self.names = set(get_process_names() if names is None else names)
+
+    def is_running(self, process_name):
+        """
+        Check if a process is running.
+
+        Args:
+            process_name (str): Name of its executable, e.g. 'sublime_text'
+
+        Returns:
+            bool
+        """
+        return (process_name in self.names or
+                process_name[:COMM_LENGTH] in self.names)
+
+    def get_running(self, process_names):
+        """
+        Get the processes running among some.
+
+        Args:
+            process_names (iterable)
+
+        Returns:
+            list: Sorted names of the running processes
+        """
+        return sorted(process_name for process_name in process_names
+                      if self.is_running(process_name))
+
+
+def get_process_names():
+    """
+    List the names of the running processes.
+
+    /proc is read where there is one, e.g. on Linux, ps is run once otherwise,
+    e.g. on macOS.
+
+    Returns:
+        set: Names of the executables, with their truncated comm names
+    """
+    if os.path.isdir('/proc/self'):
+        return _read_proc('/proc')
+
+    return _run_ps()
+
+
+def _read_proc(proc):
+    """
+    List the names of the running processes from /proc.
+
+    Args:
+        proc (str): Path of /proc
+
+    Returns:
+        set
+    """
+    names = set()
+    for pid in os.listdir(proc):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(proc, pid, 'comm'), 'rb') as f_comm:
+                names.add(f_comm.read().decode('utf-8', 'replace').strip())
+            with open(os.path.join(proc, pid, 'cmdline'), 'rb') as f_cmd:
+                executable = f_cmd.read().split(b'\0')[0]
+        except (IOError, OSError):
+            # Gone meanwhile
+            continue
+        if executable:
+            names.add(os.path.basename(
+                executable.decode('utf-8', 'replace')))
+
+    return names
+
+
+def _run_ps():
+    """
+    List the names of the running processes with ps.
+
+    Returns:
+        set: Empty if ps can't be run
+    """
+    import subprocess
+
+    try:
+        output = subprocess.check_output(['ps', '-A', '-c', '-o', 'comm='])
+    except (OSError, subprocess.CalledProcessError):
+        return set()
+
+    return set(line.strip() for line in
+               output.decode('utf-8', 'replace').splitlines()
+               if line.strip())
@@ -0,0 +1,85 @@
+"""
+Run profiling.
+
+Wrap a run in cProfile, to find where the CPU time goes, or in tracemalloc,
+to find where the memory goes. Both write a sorted report to read, and the
+raw data to dig into with pstats or tracemalloc.
+"""
+from .constants import PROFILE_CPU, PROFILE_MEM
+
+
+# Number of lines of the sorted reports
+REPORT_LINES = 40
+
+
+class Profiler(object):
+
+    """CPU or memory profiler of a run."""
+
+    def __init__(self, mode):
+        """
+        Create a Profiler instance.
+
+        Args:
+            mode (str): PROFILE_CPU or PROFILE_MEM
+        """
+        assert mode in (PROFILE_CPU, PROFILE_MEM)
+
+        self.mode = mode
+        self._profile = None
+        self._snapshot = None
+        self._peak = None
+
+    def start(self):
+        """Start profiling."""
+        if self.mode == PROFILE_CPU:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            import tracemalloc
+            tracemalloc.start()
+
+    def stop(self):
+        """Stop profiling."""
+        if self.mode == PROFILE_CPU:
+            self._profile.disable()
+        else:
+            import tracemalloc
+            self._snapshot = tracemalloc.take_snapshot()
+            self._peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def write(self, prefix):
+        """
+        Write the report and the raw data of the profile.
+
+        Args:
+            prefix (str): Path of the files to write, without extension
+
+        Returns:
+            (str, str): Path of the report and of the raw data
+        """
+        report_path = prefix + '.txt'
+
+        if self.mode == PROFILE_CPU:
+            # Loadable with pstats, snakeviz, ...
+            import pstats
+            raw_path = prefix + '.prof'
+            self._profile.dump_stats(raw_path)
+            with open(report_path, 'w') as f_report:
+                stats = pstats.Stats(self._profile, stream=f_report)
+                stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+        else:
+            # Loadable with tracemalloc.Snapshot.load()
+            raw_path = prefix + '.snapshot'
+            self._snapshot.dump(raw_path)
+            statistics = self._snapshot.statistics('lineno')
+            with open(report_path, 'w') as f_report:
+                f_report.write("Peak: {} KiB\n".format(self._peak // 1024))
+                f_report.write("Allocated at the end: {} KiB\n\n".format(
+                    sum(stat.size for stat in statistics) // 1024))
+                for stat in statistics[:REPORT_LINES]:
+                    f_report.write("{}\n".format(stat))
+
+        return report_path, raw_path
@@ -0,0 +1,220 @@
+"""
+The Application Scheduler.
+
+Applications run after the ones they depend on, e.g. Oh My Zsh after Zsh, as
+declared in the [dependencies] section of their config. Among the
+applications ready to run, the ones with the highest priority go first, so a
+restore on a new machine gives a usable shell as early as possible.
+
+Applications not depending on each other can run at the same time, in
+threads. Applications syncing the same files are never run together.
+"""
+import os
+import sys
+
+import six
+
+from .errors import DependencyError
+
+
+# Number of applications run at the same time by default
+JOBS = 8
+
+
+class Scheduler(object):
+
+    """Order in which the applications of a run are processed."""
+
+    def __init__(self, dependencies, priorities=None, exclusions=None,
+                 reverse=False):
+        """
+        Create a Scheduler instance.
+
+        Args:
+            dependencies (dict): Names of the applications each application
+                                 depends on, by name, for every application
+                                 of the run. Dependencies out of the run are
+                                 ignored.
+            priorities (dict): Priority of each application, 0 by default
+            exclusions (dict): Names of the applications that must not run at
+                               the same time as each application, by name
+            reverse (bool): Run the applications before the ones they depend
+                            on, e.g. to uninstall them
+
+        Raises:
+            DependencyError: If the dependencies form a cycle
+        """
+        priorities = priorities or {}
+        self.exclusions = dict(exclusions or {})
+
+        # Applications each application waits for, and the ones waiting
+        self._waits_for = dict((name, set()) for name in dependencies)
+        self._waited_by = dict((name, set()) for name in dependencies)
+        for name, names in dependencies.items():
+            for dependency in names:
+                if dependency not in dependencies or dependency == name:
+                    continue
+                if reverse:
+                    self._waits_for[dependency].add(name)
+                    self._waited_by[name].add(dependency)
+                else:
+                    self._waits_for[name].add(dependency)
+                    self._waited_by[dependency].add(name)
+
+        sign = 1 if reverse else -1
+        self._keys = dict((name, (sign * priorities.get(name, 0), name))
+                          for name in dependencies)
+
+        self._order = self._sort()
+
+    def get_order(self):
+        """
+        Get the order in which the applications run one after the other.
+
+        Returns:
+            list: Names of the applications
+        """
+        return list(self._order)
+
+    def run(self, function, jobs=1):
+        """
+        Call a function with the name of each application.
+
+        Each call is made once the calls of the applications it depends on
+        returned. If a call raises an exception, no other call starts, and
+        the exception is raised once the running calls returned.
+
+        Args:
+            function (function): Called with the name of an application
+            jobs (int): Number of calls made at the same time
+        """
+        jobs = min(jobs, len(self._order))
+        if jobs <= 1:
+            for name in self._order:
+                function(name)
+            return
+
+        import threading
+
+        condition = threading.Condition()
+        waiting = dict((name, len(names))
+                       for name, names in self._waits_for.items())
+        ready = [name for name in self._order if not waiting[name]]
+        running = set()
+        errors = []
+
+        def next_name():
+            # The first ready application not excluded by a running one
+            for name in ready:
+                if not self.exclusions.get(name, set()) & running:
+                    ready.remove(name)
+                    return name
+            return None
+
+        def work():
+            while True:
+                with condition:
+                    while True:
+                        if errors:
+                            return
+                        name = next_name()
+                        if name is not None:
+                            running.add(name)
+                            break
+                        if not running:
+                            # Everything ran
+                            return
+                        condition.wait()
+
+                try:
+                    function(name)
+                except BaseException:
+                    with condition:
+                        errors.append(sys.exc_info())
+                        running.discard(name)
+                        condition.notify_all()
+                    return
+
+                with condition:
+                    running.discard(name)
+                    for waiting_name in self._waited_by[name]:
+                        waiting[waiting_name] -= 1
+                        if not waiting[waiting_name]:
+                            ready.append(waiting_name)
+                    ready.sort(key=self._keys.get)
+                    condition.notify_all()
+
+        workers = [threading.Thread(target=work, name='app-{}'.format(index))
+                   for index in range(jobs)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        if errors:
+            six.reraise(*errors[0])
+
+    def _sort(self):
+        """
+        Sort the applications, each after the ones it waits for.
+
+        Returns:
+            list
+
+        Raises:
+            DependencyError: If the dependencies form a cycle
+        """
+        import heapq
+
+        waiting = dict((name, len(names))
+                       for name, names in self._waits_for.items())
+        heap = [self._keys[name] for name in waiting if not waiting[name]]
+        heapq.heapify(heap)
+
+        order = []
+        while heap:
+            _, name = heapq.heappop(heap)
+            order.append(name)
+            for waiting_name in self._waited_by[name]:
+                waiting[waiting_name] -= 1
+                if not waiting[waiting_name]:
+                    heapq.heappush(heap, self._keys[waiting_name])
+
+        if len(order) != len(waiting):
+            raise DependencyError(
+                "The dependencies of these applications form a cycle: {}"
+                .format(', '.join(sorted(set(waiting) - set(order)))))
+
+        return order
+
+
+def get_exclusions(files):
+    """
+    Find the applications syncing the same files, or files one inside another.
+
+    Args:
+        files (dict): Files of each application, relative to the home, by
+                      name
+
+    Returns:
+        dict: Names of the applications sharing files with each application,
+              by name, only for the applications sharing some
+    """
+    owners = dict()
+    for name, filenames in files.items():
+        for filename in filenames:
+            owners.setdefault(os.path.normpath(filename), set()).add(name)
+
+    exclusions = dict()
+    for name, filenames in files.items():
+        for filename in filenames:
+            # The file itself, then each of its parent folders
+            path = os.path.normpath(filename)
+            while path:
+                for owner in owners.get(path, ()):
+                    if owner != name:
+                        exclusions.setdefault(name, set()).add(owner)
+                        exclusions.setdefault(owner, set()).add(name)
+                path = os.path.dirname(path)
+
+    return exclusions
@@ -0,0 +1,244 @@
+"""
+The Mackup Server.
+
+`mackup serve` keeps the config and the applications database in memory and
+runs requests received on a Unix socket, so agents calling Mackup often don't
+pay for the interpreter startup and the catalog parsing every time.
+
+Each request and each response is a single line of JSON:
+
+    {"command": "restore", "apps": ["git"], "options": {"dry_run": true}}
+    {"ok": true, "outcomes": [{"app_name": "git", "status": "restored", ...}]}
+
+The commands are ping, list, backup, restore and uninstall, the last three
+taking the same apps and options as Mackup.run(). Failures get
+{"ok": false, "error": "StorageNotFoundError", "message": "..."}.
+
+The config and the catalog are loaded again when their files change.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+
+import six
+from six.moves import socketserver
+
+from .constants import (APPS_DIR,
+                        CUSTOM_APPS_DIR,
+                        MACKUP_CONFIG_FILE,
+                        MODES)
+from .errors import MackupError
+from .mackup import Mackup
+
+
+class MackupServer(socketserver.UnixStreamServer):
+
+    """Run the requests received on a Unix socket, one at a time."""
+
+    def __init__(self, socket_path):
+        """
+        Create a MackupServer instance, listening on a Unix socket.
+
+        Args:
+            socket_path (str)
+        """
+        self.socket_path = socket_path
+        self._mackup = None
+        self._sources = None
+
+        # A socket left by a server that died can be replaced, not one in use
+        if os.path.exists(socket_path):
+            try:
+                request(socket_path, {'command': 'ping'})
+            except socket.error:
+                os.remove(socket_path)
+            else:
+                raise MackupError("A server is already listening on {}"
+                                  .format(socket_path))
+
+        # Only the user can connect
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(self, socket_path,
+                                                   RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        """Stop listening and remove the socket."""
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def get_mackup(self):
+        """
+        Return the Mackup instance, loaded again if its sources changed.
+
+        Returns:
+            Mackup
+        """
+        sources = get_sources()
+        if self._mackup is None or sources != self._sources:
+            self._mackup = Mackup()
+            self._sources = sources
+
+        return self._mackup
+
+    def run(self, req):
+        """
+        Run a request.
+
+        Args:
+            req (dict)
+
+        Returns:
+            dict: Response to send back
+        """
+        try:
+            check_request(req)
+            command = req['command']
+
+            if command == 'ping':
+                return {'ok': True}
+
+            if command == 'list':
+                return {'ok': True,
+                        'apps': sorted(self.get_mackup()
+                                       .app_db.get_app_names())}
+
+            if command in MODES:
+                result = self.get_mackup().run(command, req.get('apps'),
+                                               req.get('options'))
+                return {'ok': True,
+                        'dry_run': result.dry_run,
+                        'outcomes': [dict(outcome._asdict())
+                                     for outcome in result.outcomes]}
+
+            raise ValueError("Unknown command: {}".format(command))
+        except Exception as exc:
+            # Whatever happens, the client gets an answer
+            return {'ok': False,
+                    'error': exc.__class__.__name__,
+                    'message': str(exc)}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    """Handle the requests of a client, one per line."""
+
+    def handle(self):
+        """Answer each request of the connection."""
+        for line in self.rfile:
+            try:
+                req = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'ok': False,
+                            'error': 'ValueError',
+                            'message': 'Invalid JSON'}
+            else:
+                response = self.server.run(req)
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+def check_request(req):
+    """
+    Check the types of the fields of a request.
+
+    Args:
+        req: Decoded from JSON, e.g. {'command': 'restore', 'apps': ['git']}
+
+    Raises:
+        ValueError: If the request is malformed
+    """
+    if not isinstance(req, dict):
+        raise ValueError("A request must be an object")
+    if not isinstance(req.get('command'), six.string_types):
+        raise ValueError("The command must be a string")
+    apps = req.get('apps')
+    if apps is not None and not (
+            isinstance(apps, list) and
+            all(isinstance(app, six.string_types) for app in apps)):
+        raise ValueError("The apps must be a list of strings")
+    if not isinstance(req.get('options', {}), (dict, type(None))):
+        raise ValueError("The options must be an object")
+
+
+def get_sources():
+    """
+    Return the modification times of the config and of the catalog.
+
+    Returns:
+        list of (path, mtime), mtime being None for missing paths
+    """
+    home = os.environ['HOME']
+    apps_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            APPS_DIR)
+    custom_apps_dir = os.path.join(home, CUSTOM_APPS_DIR)
+
+    paths = [os.path.join(home, MACKUP_CONFIG_FILE), apps_dir, custom_apps_dir]
+    if os.path.isdir(custom_apps_dir):
+        paths.extend(os.path.join(custom_apps_dir, filename)
+                     for filename in sorted(os.listdir(custom_apps_dir)))
+
+    sources = []
+    for path in paths:
+        try:
+            sources.append((path, os.stat(path).st_mtime))
+        except OSError:
+            sources.append((path, None))
+
+    return sources
+
+
+def request(socket_path, req):
+    """
+    Send a request to a server and return its response.
+
+    Args:
+        socket_path (str)
+        req (dict): e.g. {'command': 'list'}
+
+    Returns:
+        dict
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(req).encode('utf-8') + b'\n')
+        response = b''
+        while not response.endswith(b'\n'):
+            data = client.recv(65536)
+            if not data:
+                break
+            response += data
+    finally:
+        client.close()
+
+    if not response:
+        raise socket.error("The server closed the connection")
+
+    return json.loads(response.decode('utf-8'))
+
+
+def serve(socket_path):
+    """
+    Run requests until interrupted.
+
+    Args:
+        socket_path (str)
+    """
+    server = MackupServer(socket_path)
+    print("Listening on {}".format(socket_path))
+
+    # Clean up when stopped by a service manager too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,114 @@
+"""
+Staged backups.
+
+Instead of writing into the Mackup folder file by file, a staged backup copies
+everything in a staging folder first, on the filesystem of the storage but out
+of the Mackup folder. Once every application is copied, the copies are
+renamed into the Mackup folder one after the other, then the files of the home
+are replaced with links. The sync client only sees finished files, in one
+burst, and a run interrupted while copying leaves the storage and the home as
+they were.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from . import utils
+from .constants import MACKUP_STAGING_DIR
+
+
+class Staging(object):
+
+    """Copies of a backup waiting to be committed into the Mackup folder."""
+
+    def __init__(self, folder):
+        """
+        Create a Staging instance.
+
+        Args:
+            folder (str): Staging folder, on the same filesystem as the
+                          Mackup folder. Deleted on commit or discard
+        """
+        self.folder = folder
+        # Home file, staged copy and exclusions of each backup, in the order
+        # staged
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, filename, home_filepath, mackup_filepath, excluded=None):
+        """
+        Stage a file of the home, to be backed up on commit.
+
+        Applications syncing the same file, e.g. vim and janus, stage it
+        once, the first one copying it.
+
+        Args:
+            filename (str): Path relative to the home, e.g. '.bashrc'
+            home_filepath (str): File or folder of the home
+            mackup_filepath (str): Its backup in the Mackup folder
+            excluded (function): Tells if a path in the home_filepath folder
+                                 is excluded, see utils.get_excluded()
+
+        Returns:
+            (str, bool): Path to copy the file of the home to, and if it still
+                         has to be copied there
+        """
+        with self._lock:
+            if mackup_filepath in self._entries:
+                return self._entries[mackup_filepath][1], False
+
+            staged_filepath = os.path.join(self.folder, filename)
+            self._entries[mackup_filepath] = (home_filepath, staged_filepath,
+                                              excluded)
+
+        return staged_filepath, True
+
+    def commit(self):
+        """
+        Move the staged copies into the Mackup folder, then link the home.
+
+        The backups replaced go to the trash, like with delete().
+        """
+        from .trash import move
+
+        for mackup_filepath, (_, staged_filepath, _) in self._entries.items():
+            if os.path.lexists(mackup_filepath):
+                utils.delete(mackup_filepath)
+            utils.get_executor().makedirs(os.path.dirname(mackup_filepath))
+            # A rename, unless the staging folder had to be elsewhere
+            move(staged_filepath, mackup_filepath)
+
+        # Only once the storage holds every backup
+        for mackup_filepath, entry in self._entries.items():
+            home_filepath, _, excluded = entry
+            utils.replace_with_link(mackup_filepath, home_filepath, excluded)
+
+        self.discard()
+
+    def discard(self):
+        """Delete the staging folder, and whatever it still holds."""
+        import shutil
+
+        self._entries = OrderedDict()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def get_staging_folder(storage_folder):
+    """
+    Create a staging folder for a storage folder.
+
+    The staging folder is put next to the storage folder, out of what the sync
+    client sees, when it is on the same device and writable. In the storage
+    folder otherwise, where the copies can still be renamed into place.
+
+    Args:
+        storage_folder (str): Folder synced, containing the Mackup folder
+
+    Returns:
+        str
+    """
+    import tempfile
+
+    folder = utils.get_unsynced_folder(storage_folder) or storage_folder
+
+    return tempfile.mkdtemp(prefix=MACKUP_STAGING_DIR + '-', dir=folder)
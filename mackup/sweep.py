@@ -0,0 +1,113 @@
+"""
+Sweep what runs left behind.
+
+Links of the home pointing to files gone from the Mackup folder, e.g. once
+removed on another computer, and entries of the Mackup folder no application
+syncs anymore, which keep being synced and slow down each scan of the
+storage. Each folder is listed once, without a stat per entry where scandir
+tells the types.
+"""
+import os
+import stat
+
+
+def find_broken_links(folders, target_folder):
+    """
+    Find the broken links pointing into a folder.
+
+    Args:
+        folders (iterable): Folders to look into, not recursively, e.g. the
+                            parent folders of the files of the applications
+        target_folder (str): Folder the links point into, e.g. the Mackup
+                             folder
+
+    Returns:
+        list: Sorted full paths of the links
+    """
+    prefix = os.path.join(target_folder, '')
+
+    broken_links = []
+    for folder in sorted(set(folders)):
+        for _, path, _, is_link in _scan(folder):
+            if not is_link:
+                continue
+            target = os.path.join(folder, os.readlink(path))
+            if (os.path.normpath(target).startswith(prefix) and
+                    not os.path.exists(path)):
+                broken_links.append(path)
+
+    return sorted(broken_links)
+
+
+def find_orphans(folder, filenames, recorded=None):
+    """
+    Find the entries of a folder that no file synced is, or is part of.
+
+    Only the folders holding files synced, or recorded, are walked through.
+
+    Args:
+        folder (str): e.g. the Mackup folder
+        filenames (iterable): Files synced, relative to folder
+        recorded (iterable): Only return these entries, relative to folder,
+                             e.g. what this computer backed up to a storage
+                             other computers sync too. Every entry if None
+
+    Returns:
+        list: Sorted full paths of the entries
+    """
+    owned = set(os.path.normpath(filename) for filename in filenames)
+    if recorded is not None:
+        recorded = set(os.path.normpath(filename) for filename in recorded)
+
+    parents = set()
+    for filename in owned | (recorded or set()):
+        parent = os.path.dirname(filename)
+        while parent and parent not in parents:
+            parents.add(parent)
+            parent = os.path.dirname(parent)
+
+    orphans = []
+    folders = ['']
+    while folders:
+        relative_folder = folders.pop()
+        for name, path, is_dir, _ in _scan(os.path.join(folder,
+                                                        relative_folder)):
+            filename = os.path.join(relative_folder, name)
+            if filename in owned:
+                continue
+            if filename in parents and is_dir:
+                folders.append(filename)
+            elif recorded is None or filename in recorded:
+                orphans.append(path)
+
+    return sorted(orphans)
+
+
+def _scan(folder):
+    """
+    List a folder, with the type of each entry.
+
+    Args:
+        folder (str)
+
+    Returns:
+        list of (name, path, is_dir, is_link): Empty if the folder can't be
+                                               listed, links to folders are
+                                               not folders
+    """
+    try:
+        if hasattr(os, 'scandir'):
+            return [(entry.name, entry.path,
+                     entry.is_dir(follow_symlinks=False), entry.is_symlink())
+                    for entry in os.scandir(folder)]
+
+        # Python 2
+        entries = []
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            mode = os.lstat(path).st_mode
+            entries.append((name, path, stat.S_ISDIR(mode),
+                            stat.S_ISLNK(mode)))
+        return entries
+    except OSError:
+        return []
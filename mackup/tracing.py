@@ -0,0 +1,172 @@
+"""
+Run tracing.
+
+When enabled, Mackup records a span for each phase of a run: config parsing,
+catalog loading, the work done for each application, each copy, chmod and
+delete, each process spawned and each prompt. They are written in the Chrome
+trace event format, to be loaded in chrome://tracing or https://ui.perfetto.dev
+where each thread gets its own track.
+"""
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Tracer of the current run, None when the run is not traced
+_tracer = None
+
+
+class Tracer(object):
+
+    """Spans of a run, in the Chrome trace event format."""
+
+    def __init__(self):
+        """Create a Tracer instance."""
+        self.start = time.time()
+        self.events = []
+        self.pid = os.getpid()
+        self._threads = set()
+        self._lock = threading.Lock()
+
+        self.events.append(dict(name='process_name', ph='M', pid=self.pid,
+                                tid=0, args=dict(name='mackup')))
+
+    def add_span(self, name, category, start, end, args=None):
+        """
+        Record a span of the current thread.
+
+        Args:
+            name (str): e.g. 'copy'
+            category (str): e.g. 'utils'
+            start (float): Start time, as returned by time.time()
+            end (float): End time, as returned by time.time()
+            args (dict): Details shown with the span, e.g. the path copied
+        """
+        thread = threading.current_thread()
+        event = dict(name=name,
+                     cat=category,
+                     ph='X',
+                     ts=int((start - self.start) * 1000000),
+                     dur=int((end - start) * 1000000),
+                     pid=self.pid,
+                     tid=thread.ident)
+        if args:
+            event['args'] = args
+
+        with self._lock:
+            # Name the track of each thread once
+            if thread.ident not in self._threads:
+                self._threads.add(thread.ident)
+                self.events.append(dict(name='thread_name', ph='M',
+                                        pid=self.pid, tid=thread.ident,
+                                        args=dict(name=thread.name)))
+            self.events.append(event)
+
+    def write(self, filepath):
+        """
+        Write the spans to a file, as JSON.
+
+        Args:
+            filepath (str)
+        """
+        import json
+
+        with self._lock:
+            trace = dict(traceEvents=list(self.events),
+                         displayTimeUnit='ms')
+        with open(filepath, 'w') as f_trace:
+            json.dump(trace, f_trace)
+
+
+def start():
+    """
+    Start tracing the run.
+
+    Returns:
+        Tracer
+    """
+    global _tracer
+    _tracer = Tracer()
+
+    return _tracer
+
+
+def stop():
+    """
+    Stop tracing the run.
+
+    Returns:
+        Tracer, or None if the run was not traced
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+
+    return tracer
+
+
+def is_enabled():
+    """
+    Check if the run is traced.
+
+    Returns:
+        bool
+    """
+    return _tracer is not None
+
+
+@contextmanager
+def span(name, category, args=None):
+    """
+    Record a span for the time spent in this context.
+
+    Does nothing when the run is not traced.
+
+    Args:
+        name (str): e.g. 'backup'
+        category (str): e.g. 'app'
+        args (dict): Details shown with the span
+    """
+    if _tracer is None:
+        yield
+        return
+
+    tracer = _tracer
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        tracer.add_span(name, category, start_time, time.time(), args)
+
+
+def traced(category, name=None):
+    """
+    Decorate a function to record a span for each of its calls.
+
+    When the first argument is a path, it is shown with the span.
+
+    Args:
+        category (str): e.g. 'utils'
+        name (str): Name of the spans, the name of the function by default
+
+    Returns:
+        function: The decorator
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+
+            span_args = None
+            if args and isinstance(args[0], str):
+                span_args = dict(path=args[0])
+            with span(span_name, category, span_args):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
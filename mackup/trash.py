@@ -0,0 +1,275 @@
+"""
+The Mackup Trash.
+
+Mackup never removes a file for good during a run. Everything it deletes is
+moved into a per-run trash folder, so the last run can be put back with
+`mackup undo`. Old runs are purged later, outside of the critical path.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+from .constants import MACKUP_TRASH_DIR, TRASH_RUNS_TO_KEEP
+from . import tracing
+
+
+# Name of the file listing what has been put in the trash during a run
+MANIFEST_FILENAME = 'manifest.json'
+
+
+class Trash(object):
+
+    """Trash folder of a single Mackup run."""
+
+    def __init__(self, root=None, run_id=None):
+        """
+        Create a Trash instance.
+
+        Nothing is created on the disk until something is put in the trash.
+
+        Args:
+            root (str): Folder containing the trash of every run, defaults to
+                        ~/MACKUP_TRASH_DIR
+            run_id (str): Name of this run, defaults to a sortable timestamp
+        """
+        if root is None:
+            root = os.path.join(os.environ['HOME'], MACKUP_TRASH_DIR)
+        if run_id is None:
+            run_id = '{}-{}'.format(time.strftime('%Y%m%d%H%M%S'),
+                                    os.getpid())
+
+        self.root = root
+        self.run_id = run_id
+        self.path = os.path.join(root, run_id)
+        self._count = 0
+        self._device = None
+        # Applications can run in threads, see scheduler.py
+        self._lock = threading.Lock()
+
+    def put(self, filepath):
+        """
+        Move a file, folder or link into the trash.
+
+        A rename is used when the trash is on the same device as the file,
+        a copy followed by a removal otherwise.
+
+        Args:
+            filepath (str): Absolute full path to a file. e.g. /path/to/file
+
+        Returns:
+            (str) Path of the item in the trash
+        """
+        trashed = self._reserve()
+        move(filepath, trashed, self._device)
+        self._record(filepath, trashed)
+
+        return trashed
+
+    def keep(self, filepath):
+        """
+        Put a copy of a file or link in the trash, leaving it in place.
+
+        Used right before replacing the file with a rename. Regular files are
+        hard linked when the trash is on the same device, so this is cheap
+        whatever the size of the file.
+
+        Args:
+            filepath (str): Absolute full path to a file. e.g. /path/to/file
+
+        Returns:
+            (str) Path of the copy in the trash
+        """
+        trashed = self._reserve()
+
+        if os.path.islink(filepath):
+            os.symlink(os.readlink(filepath), trashed)
+        elif os.lstat(filepath).st_dev == self._device:
+            os.link(filepath, trashed)
+        else:
+            shutil.copy2(filepath, trashed)
+
+        self._record(filepath, trashed)
+
+        return trashed
+
+    def _reserve(self):
+        """
+        Return a new path in the trash, creating the trash if needed.
+
+        Returns:
+            str
+        """
+        with self._lock:
+            if self._device is None:
+                # Another run of the same process, in the same second
+                base_id, suffix = self.run_id, 0
+                while os.path.lexists(self.path):
+                    suffix += 1
+                    self.run_id = '{}-{}'.format(base_id, suffix)
+                    self.path = os.path.join(self.root, self.run_id)
+                os.makedirs(self.path, 0o700)
+                self._device = os.stat(self.path).st_dev
+
+            trashed = os.path.join(self.path, str(self._count))
+            self._count += 1
+
+        return trashed
+
+    def _record(self, filepath, trashed):
+        """
+        Add an item to the manifest of the run.
+
+        Args:
+            filepath (str): Original path of the item
+            trashed (str): Path of the item in the trash
+        """
+        # Append, so that a crash still leaves a usable manifest behind
+        with self._lock:
+            with open(os.path.join(self.path, MANIFEST_FILENAME),
+                      'a') as f_man:
+                f_man.write(json.dumps({'path': filepath,
+                                        'trashed': trashed}) + '\n')
+
+
+def move(src, dst, dst_device=None):
+    """
+    Move src to dst, renaming when possible.
+
+    Args:
+        src (str): File, folder or link to move
+        dst (str): Path to move it to, must not exist
+        dst_device (int): st_dev of the dst folder, if already known
+    """
+    if dst_device is None:
+        dst_device = os.stat(os.path.dirname(dst)).st_dev
+
+    if os.lstat(src).st_dev == dst_device:
+        os.rename(src, dst)
+    elif os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        os.remove(src)
+    elif os.path.isdir(src):
+        shutil.copytree(src, dst, symlinks=True)
+        shutil.rmtree(src)
+    else:
+        shutil.copy2(src, dst)
+        os.remove(src)
+
+
+def get_runs(root):
+    """
+    Return the runs available in the trash.
+
+    Args:
+        root (str): Folder containing the trash of every run
+
+    Returns:
+        list of str, oldest run first
+    """
+    if not os.path.isdir(root):
+        return []
+
+    return sorted(name for name in os.listdir(root)
+                  if os.path.isfile(os.path.join(root, name,
+                                                 MANIFEST_FILENAME)))
+
+
+def read_manifest(run_path):
+    """
+    Return what has been put in the trash during a run.
+
+    Args:
+        run_path (str): Trash folder of the run
+
+    Returns:
+        list of dict with the 'path' and 'trashed' keys, in deletion order
+    """
+    entries = []
+    with open(os.path.join(run_path, MANIFEST_FILENAME)) as f_man:
+        for line in f_man:
+            if line.strip():
+                entries.append(json.loads(line))
+
+    return entries
+
+
+def undo(trash, dry_run=False, verbose=False):
+    """
+    Put back everything deleted during the last run.
+
+    Whatever now sits at the original place of a deleted item (usually the
+    link or the copy made by Mackup) is moved into the given trash, so an
+    undo can itself be undone.
+
+    Args:
+        trash (Trash): Trash of the current run
+        dry_run (bool)
+        verbose (bool)
+
+    Returns:
+        (str) Id of the run that has been undone, None if there was none
+    """
+    runs = [run for run in get_runs(trash.root) if run != trash.run_id]
+    if not runs:
+        return None
+
+    run_path = os.path.join(trash.root, runs[-1])
+
+    # Put things back in the reverse order they were deleted
+    for entry in reversed(read_manifest(run_path)):
+        if verbose:
+            print("Putting back\n  {}\n  to\n  {} ..."
+                  .format(entry['trashed'], entry['path']))
+        else:
+            print("Putting back {} ...".format(entry['path']))
+
+        if dry_run:
+            continue
+
+        if os.path.lexists(entry['path']):
+            trash.put(entry['path'])
+        else:
+            parent = os.path.dirname(entry['path'])
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+
+        move(entry['trashed'], entry['path'])
+
+    if not dry_run:
+        shutil.rmtree(run_path)
+
+    return runs[-1]
+
+
+@tracing.traced('trash')
+def purge(root, keep=TRASH_RUNS_TO_KEEP):
+    """
+    Remove the oldest runs from the trash.
+
+    Args:
+        root (str): Folder containing the trash of every run
+        keep (int): Number of recent runs to keep
+    """
+    runs = get_runs(root)
+    for run in runs[:max(len(runs) - keep, 0)]:
+        shutil.rmtree(os.path.join(root, run), ignore_errors=True)
+
+
+def purge_in_background(root, keep=TRASH_RUNS_TO_KEEP):
+    """
+    Purge the trash in a thread, so the run does not wait for it.
+
+    Args:
+        root (str): Folder containing the trash of every run
+        keep (int): Number of recent runs to keep
+
+    Returns:
+        threading.Thread, to join before exiting
+    """
+    thread = threading.Thread(target=purge, args=(root, keep))
+    thread.daemon = True
+    thread.start()
+
+    return thread
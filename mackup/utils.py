@@ -1,21 +1,38 @@
 """System static utilities being used by the modules."""
-import base64
+import fnmatch
 import os
 import platform
-import shutil
 import stat
-import subprocess
 import sys
-import sqlite3
+import threading
 from six.moves import input
 
 from . import constants
+from . import executor
+from . import metrics
+from . import tracing
+
+# fcntl, shutil, subprocess and the trash are imported where they
+# are used, as most commands don't need them
 
 
 # Flag that controls how user confirmation works.
 # If True, the user wants to say "yes" to everything.
 FORCE_YES = False
 
+# Trash of the current run, see get_trash()
+_trash = None
+
+# Executor of the current run, see get_executor()
+_executor = None
+
+# Guards the creation of the trash and of the executor, used by the threads
+# running applications
+_lock = threading.Lock()
+
+# ioctl cloning a file on Linux, see clone_file()
+FICLONE = 0x40049409
+
 
 def confirm(question):
     """
@@ -31,7 +48,8 @@ def confirm(question):
         return True
 
     while True:
-        answer = input(question + ' <Yes|No>').lower()
+        with metrics.timer('prompt_wait'), tracing.span('prompt', 'prompt'):
+            answer = input(question + ' <Yes|No>').lower()
 
         if answer == 'yes' or answer == 'y':
             confirmed = True
@@ -43,29 +61,89 @@ def confirm(question):
     return confirmed
 
 
+@tracing.traced('utils')
 def delete(filepath):
     """
     Delete the given file, directory or link.
 
-    It Should support undelete later on.
+    It is moved into the trash of the current run, so it can be put back with
+    `mackup undo`.
 
     Args:
         filepath (str): Absolute full path to a file. e.g. /path/to/file
+
+    Returns:
+        (str) Path of the file in the trash, None if there was no file
     """
-    # Some files have ACLs, let's remove them recursively
-    remove_acl(filepath)
+    # Links have no ACLs nor attributes of their own, and might be broken
+    if not os.path.islink(filepath):
+        # Some files have ACLs, let's remove them recursively
+        remove_acl(filepath)
+
+        # Some files have immutable attributes, let's remove them recursively
+        remove_immutable_attribute(filepath)
+
+    # Finally move the files and folders to the trash
+    if (os.path.isfile(filepath) or os.path.islink(filepath) or
+            os.path.isdir(filepath)):
+        trashed = get_trash().put(filepath)
+        get_executor().forget(filepath)
+        metrics.add_operation('delete')
+        return trashed
+
+    return None
+
+
+def new_run(home=None):
+    """
+    Start a new run, with its own trash and executor.
+
+    Args:
+        home (str): Home folder the run works on, the trash goes there,
+                    defaults to $HOME
+    """
+    global _trash, _executor
+    _trash = None
+    _executor = None
+
+    if home is not None:
+        from . import trash
+        _trash = trash.Trash(os.path.join(home, constants.MACKUP_TRASH_DIR))
+
+
+def get_trash():
+    """
+    Return the trash of the current run, creating it if needed.
+
+    Returns:
+        (trash.Trash)
+    """
+    global _trash
+    with _lock:
+        if _trash is None:
+            from . import trash
+            _trash = trash.Trash()
+
+    return _trash
+
 
-    # Some files have immutable attributes, let's remove them recursively
-    remove_immutable_attribute(filepath)
+def get_executor():
+    """
+    Return the executor of the current run, creating it if needed.
+
+    Returns:
+        (executor.Executor)
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = executor.Executor(unlock=remove_immutable_attribute)
 
-    # Finally remove the files and folders
-    if os.path.isfile(filepath) or os.path.islink(filepath):
-        os.remove(filepath)
-    elif os.path.isdir(filepath):
-        shutil.rmtree(filepath)
+    return _executor
 
 
-def copy(src, dst):
+@tracing.traced('utils')
+def copy(src, dst, excluded=None, clone=False, atomic=False):
     """
     Copy a file or a folder (recursively) from src to dst.
 
@@ -82,31 +160,144 @@ def copy(src, dst):
     Args:
         src (str): Source file or folder
         dst (str): Destination file or folder
+        excluded (function): Tells if a path in the src folder is excluded,
+                             see get_excluded()
+        clone (bool): Share the blocks of the files with src when the
+                      filesystem can, see clone_file()
+        atomic (bool): Copy under a temporary name, then rename it to dst,
+                       so dst never holds half of a copy
     """
     assert isinstance(src, str)
     assert os.path.exists(src)
     assert isinstance(dst, str)
 
     # Create the path to the dst file if it does not exists
-    abs_path = os.path.dirname(os.path.abspath(dst))
-    if not os.path.isdir(abs_path):
-        os.makedirs(abs_path)
+    get_executor().makedirs(os.path.dirname(os.path.abspath(dst)))
 
-    # We need to copy a single file
-    if os.path.isfile(src):
-        # Copy the src file to dst
-        shutil.copy(src, dst)
+    import shutil
 
-    # We need to copy a whole folder
-    elif os.path.isdir(src):
-        shutil.copytree(src, dst)
+    target = dst
+    if atomic:
+        dst = os.path.join(os.path.dirname(dst), '.{}.mackup-{}'
+                           .format(os.path.basename(dst), os.getpid()))
+        _remove_leftovers(dst)
+
+    try:
+        # We need to copy a single file
+        if os.path.isfile(src):
+            # Copy the src file to dst
+            if clone:
+                clone_file(src, dst)
+            else:
+                shutil.copy(src, dst)
+
+        # We need to copy a whole folder
+        elif os.path.isdir(src):
+            kwargs = dict()
+            if excluded is not None:
+                # Excluded folders are not even walked through
+                kwargs['ignore'] = lambda folder, names: set(
+                    name for name in names
+                    if excluded(os.path.join(folder, name)))
+            # Python 2 can't copy the files of a folder another way
+            if clone and sys.version_info[0] >= 3:
+                kwargs['copy_function'] = clone_file
+            shutil.copytree(src, dst, **kwargs)
+
+        # What the heck is this ?
+        else:
+            raise ValueError("Unsupported file: {}".format(src))
+
+        # Set the good mode to the file or folder recursively
+        if excluded is not None:
+            excluded = get_excluded_under(excluded, src, dst)
+        chmod(dst, excluded)
+
+        if atomic:
+            os.rename(dst, target)
+    except BaseException:
+        if atomic and os.path.lexists(dst):
+            if os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            else:
+                os.remove(dst)
+        raise
+
+    metrics.add_operation('copy')
+    if metrics.is_enabled():
+        metrics.add('bytes_copied', get_size(target))
+
+
+def clone_file(src, dst):
+    """
+    Copy a file, sharing its blocks with src when the filesystem can.
 
-    # What the heck is this ?
+    A clone, or reflink, is made at once whatever the size of the file, and
+    uses no space until one of the files is changed. Only Linux filesystems
+    supporting it, e.g. Btrfs or XFS, are used for now. Otherwise the file is
+    copied.
+
+    Like shutil.copy2(), the mode and the times of src are kept.
+
+    Args:
+        src (str)
+        dst (str)
+    """
+    import shutil
+
+    if _reflink(src, dst):
+        shutil.copystat(src, dst)
     else:
-        raise ValueError("Unsupported file: {}".format(src))
+        shutil.copy2(src, dst)
+
 
-    # Set the good mode to the file or folder recursively
-    chmod(dst)
+def _reflink(src, dst):
+    """
+    Try to clone a file, with the FICLONE ioctl of Linux.
+
+    Args:
+        src (str)
+        dst (str)
+
+    Returns:
+        bool: True if dst is a clone of src
+    """
+    if platform.system() != constants.PLATFORM_LINUX:
+        return False
+
+    import fcntl
+
+    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+        try:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        except (IOError, OSError):
+            # Not supported by the filesystem, or another device
+            return False
+
+    return True
+
+
+def get_size(path):
+    """
+    Return the size of a file, or of the files in a folder, recursively.
+
+    Links are not followed.
+
+    Args:
+        path (str): File or folder
+
+    Returns:
+        (int): Size in bytes
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            size += os.lstat(os.path.join(dirpath, filename)).st_size
+
+    return size
 
 
 def link(target, link_to):
@@ -130,209 +321,590 @@ def link(target, link_to):
     assert os.path.exists(target)
     assert isinstance(link_to, str)
 
-    # Create the path to the link if it does not exists
-    abs_path = os.path.dirname(os.path.abspath(link_to))
-    if not os.path.isdir(abs_path):
-        os.makedirs(abs_path)
+    # Make sure the file or folder recursively has the good mode, then create
+    # the link to target, creating the path to the link if it does not exists
+    link_later(target, link_to)
+    get_executor().run()
 
-    # Make sure the file or folder recursively has the good mode
-    chmod(target)
 
-    # Create the link to target
-    os.symlink(target, link_to)
+def link_later(target, link_to):
+    """
+    Queue the creation of a link to a target file or a folder.
+
+    Same as link(), but the link is only created on the next run of the
+    executor, along with the other operations in the same folders.
+
+    Args:
+        target (str): file or folder the link will point to
+        link_to (str): Link to create
+    """
+    assert isinstance(target, str)
+    assert isinstance(link_to, str)
+
+    get_executor().chmod(target)
+    get_executor().symlink(target, link_to)
+    metrics.add_operation('link')
 
 
-def chmod(target):
+def chown_tree(path, uid, gid):
     """
-    Recursively set the chmod for files to 0600 and 0700 for folders.
+    Change the owner of a file, link or folder, recursively.
 
-    It's ok unless we need something more specific.
+    Links are never followed.
 
     Args:
-        target (str): Root file or folder
+        path (str)
+        uid (int)
+        gid (int)
+    """
+    os.lchown(path, uid, gid)
+    if os.path.isdir(path) and not os.path.islink(path):
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                os.lchown(os.path.join(root, name), uid, gid)
+
+
+def replace_with_link(target, link_to, excluded=None):
+    """
+    Atomically replace a file, folder or link with a link to a target.
+
+    The link is created under a temporary name in the same folder and renamed
+    over link_to, so apps reading link_to never see it missing. The previous
+    content goes to the trash, like with delete().
+
+    e.g. replace_with_link('/path/to/file', '/path/to/existing_file')
+
+    Args:
+        target (str): file or folder the link will point to
+        link_to (str): File, folder or link to replace
+        excluded (function): Tells if a path in the link_to folder is
+                             excluded, see get_excluded(). A folder holding
+                             excluded entries is kept, and each of its other
+                             entries linked instead, see link_entries()
     """
     assert isinstance(target, str)
     assert os.path.exists(target)
+    assert isinstance(link_to, str)
+    assert os.path.lexists(link_to)
 
-    file_mode = stat.S_IRUSR | stat.S_IWUSR
-    folder_mode = stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR
+    # Make sure the file or folder recursively has the good mode
+    chmod(target)
 
-    # Remove the immutable attribute recursively if there is one
-    remove_immutable_attribute(target)
+    if (excluded is not None and os.path.isdir(target) and
+            has_excluded(link_to, excluded)):
+        link_entries(target, link_to, excluded)
+        return
 
-    if os.path.isfile(target):
-        os.chmod(target, file_mode)
+    tmp_link = os.path.join(os.path.dirname(link_to),
+                            '.{}.mackup-{}'.format(os.path.basename(link_to),
+                                                   os.getpid()))
+    _remove_leftovers(tmp_link)
+    os.symlink(target, tmp_link)
 
-    elif os.path.isdir(target):
-        # chmod the root item
-        os.chmod(target, folder_mode)
+    try:
+        if os.path.isdir(link_to) and not os.path.islink(link_to):
+            # A link can't be renamed over a folder, move it out of the way
+            # first, which is a rename too
+            get_trash().put(link_to)
+        else:
+            get_trash().keep(link_to)
+
+        # On POSIX, a rename atomically replaces the destination
+        os.rename(tmp_link, link_to)
+    except OSError:
+        # e.g. immutable files or ACLs, take the slow path
+        os.remove(tmp_link)
+        delete(link_to)
+        link(target, link_to)
+    else:
+        metrics.add_operation('replace')
 
-        # chmod recursively in the folder it it's one
-        for root, dirs, files in os.walk(target):
-            for cur_dir in dirs:
-                os.chmod(os.path.join(root, cur_dir), folder_mode)
-            for cur_file in files:
-                os.chmod(os.path.join(root, cur_file), file_mode)
 
-    else:
-        raise ValueError("Unsupported file type: {}".format(target))
+def has_excluded(folder, excluded):
+    """
+    Check if a real folder holds excluded entries, at any depth.
 
+    Args:
+        folder (str): Folder of the home, links are not followed
+        excluded (function): Tells if a path in the folder is excluded
 
-def error(message):
+    Returns:
+        bool
     """
-    Throw an error with the given message and immediately quit.
+    if os.path.islink(folder) or not os.path.isdir(folder):
+        return False
+
+    for root, dirs, files in os.walk(folder):
+        for name in dirs + files:
+            if excluded(os.path.join(root, name)):
+                return True
+
+    return False
+
+
+def link_entries(target, link_to, excluded):
+    """
+    Link each entry of a folder to its backup, but the excluded ones.
+
+    The excluded entries stay in the folder of the home, out of the storage,
+    and the folders holding some are walked through instead of linked. The
+    entries of the home missing from the backup, e.g. created since the last
+    backup, are copied to it first.
 
     Args:
-        message(str): The message to display.
+        target (str): Folder of the backup
+        link_to (str): Folder of the home
+        excluded (function): Tells if a path in the link_to folder is
+                             excluded
     """
-    fail = '\033[91m'
-    end = '\033[0m'
-    sys.exit(fail + "Error: {}".format(message) + end)
+    for name in sorted(set(os.listdir(target)) | set(os.listdir(link_to))):
+        target_path = os.path.join(target, name)
+        link_path = os.path.join(link_to, name)
+        if excluded(link_path):
+            continue
+
+        if not os.path.lexists(target_path):
+            # Only back up the files, not the links of the user
+            if os.path.islink(link_path):
+                continue
+            copy(link_path, target_path, excluded)
 
+        if not os.path.lexists(link_path):
+            link(target_path, link_path)
+        elif not is_linked(target_path, link_path, excluded):
+            replace_with_link(target_path, link_path, excluded)
 
-def get_dropbox_folder_location():
+
+def is_linked(target, link_to, excluded=None):
     """
-    Try to locate the Dropbox folder.
+    Check if a file or folder of the home is linked to its backup.
+
+    A folder holding excluded entries is linked when each of its other
+    entries is, see link_entries().
+
+    Args:
+        target (str): File or folder of the backup
+        link_to (str): File, folder or link of the home
+        excluded (function): Tells if a path in the link_to folder is
+                             excluded
 
     Returns:
-        (str) Full path to the current Dropbox folder
+        bool
     """
-    host_db_path = os.path.join(os.environ['HOME'], '.dropbox/host.db')
-    try:
-        with open(host_db_path, 'r') as f_hostdb:
-            data = f_hostdb.read().split()
-    except IOError:
-        error("Unable to find your Dropbox install =(")
-    dropbox_home = base64.b64decode(data[1]).decode()
+    if os.path.islink(link_to):
+        try:
+            return os.path.samefile(target, link_to)
+        except OSError:
+            return False
 
-    return dropbox_home
+    if (excluded is None or not os.path.isdir(link_to) or
+            not os.path.isdir(target) or os.path.islink(target)):
+        return False
 
+    for name in set(os.listdir(target)) | set(os.listdir(link_to)):
+        link_path = os.path.join(link_to, name)
+        if excluded(link_path):
+            continue
+        if not is_linked(os.path.join(target, name), link_path, excluded):
+            return False
 
-def get_google_drive_folder_location():
+    return True
+
+
+def has_links_to(folder, target):
     """
-    Try to locate the Google Drive folder.
+    Check if a real folder holds links into another folder, at any depth.
+
+    Args:
+        folder (str): Folder of the home, links are not followed
+        target (str): Folder of the backup
 
     Returns:
-        (str) Full path to the current Google Drive folder
+        bool
+    """
+    if os.path.islink(folder) or not os.path.isdir(folder):
+        return False
+
+    target = os.path.join(os.path.realpath(target), '')
+    for root, dirs, files in os.walk(folder):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if (os.path.islink(path) and
+                    os.path.realpath(path).startswith(target)):
+                return True
+
+    return False
+
+
+def keep_excluded(trashed, folder, excluded):
     """
-    gdrive_db_path = 'Library/Application Support/Google/Drive/sync_config.db'
-    yosemite_gdrive_db_path = ('Library/Application Support/Google/Drive/'
-                               'user_default/sync_config.db')
-    yosemite_gdrive_db = os.path.join(os.environ['HOME'],
-                                      yosemite_gdrive_db_path)
-    if os.path.isfile(yosemite_gdrive_db):
-        gdrive_db_path = yosemite_gdrive_db
+    Move the excluded entries of a trashed folder back into its replacement.
 
-    googledrive_home = None
+    Args:
+        trashed (str): Folder of the home, in the trash
+        folder (str): Its replacement in the home, without excluded entries
+        excluded (function): Tells if a path in folder is excluded
+    """
+    if os.path.isdir(trashed) and not os.path.islink(trashed):
+        _move_excluded(trashed, folder,
+                       get_excluded_under(excluded, folder, trashed))
 
-    gdrive_db = os.path.join(os.environ['HOME'], gdrive_db_path)
-    if os.path.isfile(gdrive_db):
-        con = sqlite3.connect(gdrive_db)
-        if con:
-            cur = con.cursor()
-            query = ("SELECT data_value "
-                     "FROM data "
-                     "WHERE entry_key = 'local_sync_root_path';")
-            cur.execute(query)
-            data = cur.fetchone()
-            googledrive_home = str(data[0])
-            con.close()
 
-    if not googledrive_home:
-        error("Unable to find your Google Drive install =(")
+def _remove_leftovers(tmp_path):
+    """
+    Remove what killed runs left under the temporary names of an entry.
 
-    return googledrive_home
+    The temporary names end with the pid of the run. Those of this run, of
+    runs no longer running, or older than constants.LEFTOVER_MAX_AGE, the pid
+    being possibly reused since, are removed.
 
+    Args:
+        tmp_path (str): Temporary name of this run, '.{name}.mackup-{pid}'
+    """
+    import shutil
+    import time
 
-def get_box_folder_location():
+    folder = os.path.dirname(tmp_path)
+    prefix = os.path.basename(tmp_path)[:-len(str(os.getpid()))]
+    try:
+        names = os.listdir(folder or os.curdir)
+    except OSError:
+        return
+
+    for name in names:
+        if not name.startswith(prefix) or not name[len(prefix):].isdigit():
+            continue
+        path = os.path.join(folder, name)
+        pid = int(name[len(prefix):])
+        try:
+            age = time.time() - os.lstat(path).st_mtime
+        except OSError:
+            continue
+        if (pid != os.getpid() and _is_pid_running(pid) and
+                age < constants.LEFTOVER_MAX_AGE):
+            continue
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _is_pid_running(pid):
     """
-    Try to locate the Box folder.
+    Tell if a process is running with a pid.
+
+    Args:
+        pid (int)
 
     Returns:
-        (str) Full path to the current Box folder
+        bool
     """
-    box_prefs_path = ('Library/Application Support/Box/Box Sync/'
-                      'sync_root_folder.txt')
-    box_home = None
+    import errno
+
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        # EPERM: running, as another user
+        return err.errno != errno.ESRCH
+    return True
 
-    box_prefs = os.path.join(os.environ['HOME'], box_prefs_path)
+
+def _move_excluded(src, dst, excluded):
+    """
+    Move the excluded entries of a folder to the same place in another one.
+
+    Entries already in dst are left where they are.
+
+    Args:
+        src (str): Folder
+        dst (str): Copy of src, without its excluded entries
+        excluded (function): Tells if a path in src is excluded
+    """
+    from .trash import move
+
+    for root, dirs, files in os.walk(src):
+        dst_root = os.path.join(dst, os.path.relpath(root, src))
+        for name in list(dirs) + files:
+            path = os.path.join(root, name)
+            if not excluded(path):
+                continue
+            if name in dirs:
+                dirs.remove(name)
+            if (os.path.isdir(dst_root) and
+                    not os.path.lexists(os.path.join(dst_root, name))):
+                move(path, os.path.join(dst_root, name))
+
+
+@tracing.traced('utils')
+def chmod(target, excluded=None):
+    """
+    Recursively set the chmod for files to 0600 and 0700 for folders.
+
+    It's ok unless we need something more specific.
+
+    Args:
+        target (str): Root file or folder
+        excluded (function): Tells if a path in the target folder is
+                             excluded, see get_excluded()
+    """
+    assert isinstance(target, str)
+    assert os.path.exists(target)
+
+    # The immutable attribute, if any, is removed when the chmod fails
+    get_executor().chmod(target, excluded)
+    get_executor().run()
+
+
+def is_identical(path_a, path_b, excluded=None, quick=False):
+    """
+    Check if two files, folders or links have the same content.
+
+    The cheap checks come first: types and sizes. Contents are then read
+    chunk by chunk, and folders are compared recursively, both stopping at
+    the first difference.
+
+    Args:
+        path_a (str)
+        path_b (str)
+        excluded (function): Tells if a path in the path_a folder is
+                             excluded, see get_excluded(). Excluded entries
+                             are ignored on both sides.
+        quick (bool): Never read the contents, files with the same size and
+                      modification time are told identical, like rsync does.
+                      Only a hint, as files with different contents can
+                      match, never enough to replace a file. Reading a file
+                      of a lazily hydrated storage downloads it.
+
+    Returns:
+        (bool): True if they have the same content
+    """
     try:
-        with open(box_prefs, 'r') as sync_path:
-            data = sync_path.read()
-            box_home = data
-    except IOError:
-        error("Unable to find your Box prefs =(")
+        stat_a = os.lstat(path_a)
+        stat_b = os.lstat(path_b)
+    except OSError:
+        return False
+
+    if stat.S_IFMT(stat_a.st_mode) != stat.S_IFMT(stat_b.st_mode):
+        return False
 
-    return box_home
+    # Same file, e.g. hard links
+    if (stat_a.st_dev, stat_a.st_ino) == (stat_b.st_dev, stat_b.st_ino):
+        return True
 
+    if stat.S_ISLNK(stat_a.st_mode):
+        return os.readlink(path_a) == os.readlink(path_b)
+
+    if stat.S_ISREG(stat_a.st_mode):
+        if stat_a.st_size != stat_b.st_size:
+            return False
+        if quick:
+            return stat_a.st_mtime == stat_b.st_mtime
+        return _is_same_content(path_a, path_b)
+
+    if stat.S_ISDIR(stat_a.st_mode):
+        names = sorted(os.listdir(path_a))
+        names_b = sorted(os.listdir(path_b))
+        if excluded is not None:
+            names = [name for name in names
+                     if not excluded(os.path.join(path_a, name))]
+            names_b = [name for name in names_b
+                       if not excluded(os.path.join(path_a, name))]
+        if names != names_b:
+            return False
+        for name in names:
+            if not is_identical(os.path.join(path_a, name),
+                                os.path.join(path_b, name),
+                                excluded, quick):
+                return False
+        return True
 
-def get_copy_folder_location():
+    return False
+
+
+def _is_same_content(path_a, path_b, chunk_size=64 * 1024):
     """
-    Try to locate the Copy folder.
+    Compare the content of two files, chunk by chunk.
+
+    Args:
+        path_a (str)
+        path_b (str)
+        chunk_size (int)
 
     Returns:
-        (str) Full path to the current Copy folder
+        (bool): True if the files have the same content
+    """
+    with open(path_a, 'rb') as file_a, open(path_b, 'rb') as file_b:
+        while True:
+            chunk_a = file_a.read(chunk_size)
+            if chunk_a != file_b.read(chunk_size):
+                return False
+            if not chunk_a:
+                return True
+
+
+def is_excluded(filename, patterns):
     """
-    copy_settings_path = 'Library/Application Support/Copy Agent/config.db'
-    copy_home = None
+    Check if a file matches one of the exclusion patterns of its application.
 
-    copy_settings = os.path.join(os.environ['HOME'], copy_settings_path)
+    Patterns without a / match the name of the file, e.g. '*.pyc', the others
+    match its path relative to the home, e.g. '.vim/pack/*/cache', where a *
+    does not match a /. They are not case sensitive, as the config parser
+    lowercases them.
 
-    if os.path.isfile(copy_settings):
-        database = sqlite3.connect(copy_settings)
-        if database:
-            cur = database.cursor()
-            query = ("SELECT value "
-                     "FROM config2 "
-                     "WHERE option = 'csmRootPath';")
-            cur.execute(query)
-            data = cur.fetchone()
-            copy_home = str(data[0])
-            cur.close()
+    Args:
+        filename (str): Path of the file, relative to the home
+        patterns (iterable): Glob patterns
 
-    if not copy_home:
-        error("Unable to find your Copy install =(")
+    Returns:
+        (bool)
+    """
+    parts = filename.lower().split('/')
+    for pattern in patterns:
+        pattern_parts = pattern.lower().split('/')
+        if len(pattern_parts) == 1:
+            if fnmatch.fnmatch(parts[-1], pattern_parts[0]):
+                return True
+        elif len(pattern_parts) == len(parts) and all(
+                fnmatch.fnmatch(part, pattern_part)
+                for part, pattern_part in zip(parts, pattern_parts)):
+            return True
 
-    return copy_home
+    return False
 
 
-def get_icloud_folder_location():
+def get_excluded(patterns, root, filename):
     """
-    Try to locate the iCloud Drive folder.
+    Build the function telling if a path in a synced folder is excluded.
+
+    Args:
+        patterns (iterable): Glob patterns, see is_excluded()
+        root (str): Full path of the synced folder, in the home or in the
+                    Mackup folder
+        filename (str): Path of the synced folder, relative to the home
 
     Returns:
-        (str) Full path to the iCloud Drive folder.
+        function: Takes the full path of a file in root and returns a bool,
+                  or None if nothing is excluded
     """
-    yosemite_icloud_path = '~/Library/Mobile Documents/com~apple~CloudDocs/'
+    if not patterns:
+        return None
 
-    icloud_home = os.path.expanduser(yosemite_icloud_path)
+    def excluded(path):
+        return is_excluded(os.path.join(filename, os.path.relpath(path, root)),
+                           patterns)
 
-    if not os.path.isdir(icloud_home):
-        error('Unable to find your iCloud Drive =(')
+    return excluded
 
-    return str(icloud_home)
 
+def walk_synced(folder, filenames, excluded=None):
+    """
+    List the files and folders under files synced, for a pack or a tree.
 
-def is_process_running(process_name):
+    Links are skipped, neither can hold them.
+
+    Args:
+        folder (str)
+        filenames (iterable)
+        excluded (function): Tells if a path relative to folder is excluded,
+                             excluded folders are not walked through
+
+    Yields:
+        str: Path of each entry relative to folder, ending with a / for
+             folders
+    """
+    for filename in sorted(filenames):
+        path = os.path.join(folder, filename)
+        if os.path.islink(path):
+            continue
+        if os.path.isfile(path):
+            yield filename
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                name = os.path.relpath(root, folder)
+                if excluded is not None:
+                    dirs[:] = [dir_name for dir_name in dirs
+                               if not excluded(os.path.join(name, dir_name))]
+                    files = [file_name for file_name in files
+                             if not excluded(os.path.join(name, file_name))]
+                dirs.sort()
+                yield name + '/'
+                for file_name in sorted(files):
+                    if not os.path.islink(os.path.join(root, file_name)):
+                        yield os.path.join(name, file_name)
+
+
+def get_excluded_under(excluded, root, other_root):
     """
-    Check if a process with the given name is running.
+    Move a function built by get_excluded() to another root, e.g. its copy.
 
     Args:
-        (str): Process name, e.g. "Sublime Text"
+        excluded (function): Built for root
+        root (str)
+        other_root (str)
 
     Returns:
-        (bool): True if the process is running
+        function: Takes the full path of a file in other_root
     """
-    is_running = False
+    def excluded_under(path):
+        return excluded(os.path.join(root, os.path.relpath(path, other_root)))
 
-    # On systems with pgrep, check if the given process is running
-    if os.path.isfile('/usr/bin/pgrep'):
-        dev_null = open(os.devnull, 'wb')
-        returncode = subprocess.call(['/usr/bin/pgrep', process_name],
-                                     stdout=dev_null)
-        is_running = bool(returncode == 0)
+    return excluded_under
+
+
+def get_unsynced_folder(storage_folder):
+    """
+    Get a folder on the device of the storage, but not synced.
+
+    e.g. to write files the sync client must not upload.
+
+    Args:
+        storage_folder (str): Folder synced, containing the Mackup folder
+
+    Returns:
+        str: The parent of the storage folder, or None if it is on another
+             device or not writable
+    """
+    storage_folder = os.path.normpath(storage_folder)
+    parent = os.path.dirname(storage_folder)
+
+    if (parent != storage_folder and os.access(parent, os.W_OK) and
+            os.stat(parent).st_dev == os.stat(storage_folder).st_dev):
+        return parent
+
+    return None
+
+
+def error(message):
+    """
+    Throw an error with the given message and immediately quit.
+
+    Args:
+        message(str): The message to display.
+    """
+    fail = '\033[91m'
+    end = '\033[0m'
+    sys.exit(fail + "Error: {}".format(message) + end)
+
+
+def call(args, **kwargs):
+    """
+    Run a command and wait for it to complete, like subprocess.call().
+
+    Args:
+        args (list): The command and its arguments
+
+    Returns:
+        (int): Return code of the command
+    """
+    import subprocess
 
-    return is_running
+    with tracing.span(os.path.basename(args[0]), 'subprocess',
+                      dict(args=args)):
+        return subprocess.call(args, **kwargs)
 
 
 def remove_acl(path):
@@ -349,10 +921,10 @@ def remove_acl(path):
     # Some files have ACLs, let's remove them recursively
     if (platform.system() == constants.PLATFORM_DARWIN and
             os.path.isfile('/bin/chmod')):
-        subprocess.call(['/bin/chmod', '-R', '-N', path])
+        call(['/bin/chmod', '-R', '-N', path])
     elif ((platform.system() == constants.PLATFORM_LINUX) and
             os.path.isfile('/bin/setfacl')):
-        subprocess.call(['/bin/setfacl', '-R', '-b', path])
+        call(['/bin/setfacl', '-R', '-b', path])
 
 
 def remove_immutable_attribute(path):
@@ -370,13 +942,13 @@ def remove_immutable_attribute(path):
     # Some files have ACLs, let's remove them recursively
     if ((platform.system() == constants.PLATFORM_DARWIN) and
             os.path.isfile('/usr/bin/chflags')):
-        subprocess.call(['/usr/bin/chflags', '-R', 'nouchg', path])
+        call(['/usr/bin/chflags', '-R', 'nouchg', path])
     elif (platform.system() == constants.PLATFORM_LINUX and
             os.path.isfile('/usr/bin/chattr')):
-        subprocess.call(['/usr/bin/chattr', '-R', '-i', path])
+        call(['/usr/bin/chattr', '-R', '-i', path])
 
 
-def can_file_be_synced_on_current_platform(path):
+def can_file_be_synced_on_current_platform(path, home=None):
     """
     Check if the given path can be synced locally.
 
@@ -390,19 +962,21 @@ def can_file_be_synced_on_current_platform(path):
                with the home folder.
                'abc' becomes '~/abc'
                '/def' stays '/def'
+        home (str): Home folder, defaults to $HOME
 
     Returns:
         (bool): True if given file can be synced
     """
     can_be_synced = True
+    home = home or os.environ['HOME']
 
     # If the given path is relative, prepend home
-    fullpath = os.path.join(os.environ['HOME'], path)
+    fullpath = os.path.join(home, path)
 
     # Compute the ~/Library path on OS X
     # End it with a slash because we are looking for this specific folder and
     # not any file/folder named LibrarySomething
-    library_path = os.path.join(os.environ['HOME'], 'Library/')
+    library_path = os.path.join(home, 'Library/')
 
     if platform.system() == constants.PLATFORM_LINUX:
         if fullpath.startswith(library_path):
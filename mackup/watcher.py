@@ -0,0 +1,322 @@
+"""
+The Mackup Watcher.
+
+`mackup watch` keeps an eye on the folders holding the files of the synced
+applications, with inotify. When an application replaces the link to its
+backup with a real file, e.g. by writing a new file and renaming it over the
+link, that file alone is backed up again, instead of running a full backup
+from cron.
+
+Events are debounced: the backup runs once things stay quiet for a moment, so
+a burst of writes is handled as a single batch.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import time
+
+import six
+
+from .application import ApplicationProfile
+from .constants import OUTCOME_CONFLICT
+from .errors import UnusableEnvironmentError
+from . import utils
+
+
+# inotify events, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+# Events meaning that an entry of a folder has been replaced or created, and
+# the first half of renames, to tell which ones Mackup did
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event, followed by a name of len bytes
+EVENT_HEADER = struct.Struct('iIII')
+
+# Seconds without events before running a backup
+DEBOUNCE_DELAY = 1.0
+
+# Seconds after which a backup runs, even if events keep coming
+MAX_DELAY = 10.0
+
+
+class Inotify(object):
+
+    """Minimal inotify binding, through the C library."""
+
+    def __init__(self):
+        """Create an inotify instance."""
+        libc_name = ctypes.util.find_library('c')
+        try:
+            self._libc = ctypes.CDLL(libc_name, use_errno=True)
+            self._libc.inotify_init
+        except (OSError, AttributeError):
+            raise UnusableEnvironmentError("Watching files needs inotify,"
+                                           " which is only on Linux")
+
+        self.fd = self._libc.inotify_init()
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """
+        Watch a folder, or update its watch.
+
+        Args:
+            path (str)
+            mask (int): Events to report
+
+        Returns:
+            int: Watch descriptor, the same for the same folder
+        """
+        if isinstance(path, six.text_type):
+            path = path.encode('utf-8')
+
+        wd = self._libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        return wd
+
+    def read(self, timeout=None):
+        """
+        Wait for events and return them.
+
+        Args:
+            timeout (float): Seconds to wait for an event, None to wait
+                             forever
+
+        Returns:
+            list of (wd, mask, cookie, name), empty if the timeout expired.
+            The cookie is the same for both halves of a rename
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, name_len = EVENT_HEADER.unpack_from(data,
+                                                                  offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            events.append((wd, mask, cookie,
+                           name.decode('utf-8', 'replace')))
+
+        return events
+
+    def close(self):
+        """Stop watching."""
+        os.close(self.fd)
+
+
+class Watcher(object):
+
+    """Back up the files of some applications as they get replaced."""
+
+    def __init__(self, mackup, app_names, dry_run=False, verbose=False,
+                 debounce_delay=DEBOUNCE_DELAY, max_delay=MAX_DELAY):
+        """
+        Create a Watcher instance.
+
+        Args:
+            mackup (Mackup)
+            app_names (iterable): Applications whose files are watched
+            dry_run (bool)
+            verbose (bool)
+            debounce_delay (float): Seconds without events before a backup
+            max_delay (float): Seconds after which a backup runs anyway
+        """
+        self.mackup = mackup
+        self.dry_run = dry_run
+        self.verbose = verbose
+        self.debounce_delay = debounce_delay
+        self.max_delay = max_delay
+
+        # (app name, filename) of each watched path of the home
+        self.paths = dict()
+        home = mackup.home
+        for app_name in app_names:
+            for filename in mackup.app_db.get_files(app_name):
+                self.paths[os.path.join(home, filename)] = (app_name,
+                                                            filename)
+
+        self._inotify = Inotify()
+        self._folders = dict()
+        self._pending = set()
+        self._first_event = None
+        self._last_event = None
+        # Renames of the links swapped in by the backups of this process,
+        # see utils.replace_with_link()
+        self._temp_suffix = '.mackup-{}'.format(os.getpid())
+        self._own_renames = set()
+
+        self.add_watches()
+
+    def add_watches(self):
+        """
+        Watch the folder of each path.
+
+        Missing folders can't be watched, their closest existing parent is,
+        to watch them once they get created. Folders linked to the Mackup
+        folder are not watched, what changes there is already backed up.
+
+        Returns:
+            list: Paths in the folders watched for the first time, which
+                  might have been created before being watched
+        """
+        new_paths = []
+        mackup_folder = os.path.realpath(self.mackup.mackup_folder)
+        for path in self.paths:
+            folder = os.path.dirname(path)
+            while not os.path.isdir(folder):
+                folder = os.path.dirname(folder)
+
+            real_folder = os.path.realpath(folder)
+            if (real_folder == mackup_folder or
+                    real_folder.startswith(mackup_folder + os.sep)):
+                continue
+
+            wd = self._inotify.add_watch(folder)
+            if self._folders.get(wd) != folder:
+                self._folders[wd] = folder
+                new_paths.append(path)
+
+        return new_paths
+
+    def poll(self, timeout=None):
+        """
+        Wait for events, then back up the pending paths if it's time to.
+
+        Args:
+            timeout (float): Seconds to wait at most, None to wait until a
+                             backup is due
+
+        Returns:
+            list of application.Outcome: Outcomes of the backup, if it ran
+        """
+        now = time.time()
+        if self._pending:
+            due = min(self._last_event + self.debounce_delay,
+                      self._first_event + self.max_delay)
+            if timeout is None or due - now < timeout:
+                timeout = max(due - now, 0)
+
+        for wd, mask, cookie, name in self._inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                # Some events are lost, check everything
+                self._add_pending(self.paths)
+                continue
+
+            # The backups replace the files with links, which is no news
+            if mask & IN_MOVED_FROM:
+                if name.endswith(self._temp_suffix):
+                    self._own_renames.add(cookie)
+                continue
+            if mask & IN_MOVED_TO and cookie in self._own_renames:
+                self._own_renames.discard(cookie)
+                continue
+
+            folder = self._folders.get(wd)
+            if folder is None:
+                continue
+            path = os.path.join(folder, name)
+
+            if mask & IN_ISDIR:
+                # A missing folder might have been created, with files in it
+                self._add_pending([new_path for new_path
+                                   in self.add_watches()
+                                   if os.path.lexists(new_path)])
+            if path in self.paths:
+                self._add_pending([path])
+
+        now = time.time()
+        if self._pending and (
+                now >= self._last_event + self.debounce_delay or
+                now >= self._first_event + self.max_delay):
+            return self.backup()
+
+        return []
+
+    def _add_pending(self, paths):
+        """
+        Add paths to back up, with the next backup.
+
+        Args:
+            paths (iterable)
+        """
+        if not paths:
+            return
+
+        now = time.time()
+        if not self._pending:
+            self._first_event = now
+        self._last_event = now
+        self._pending.update(paths)
+
+    def backup(self):
+        """
+        Back up the pending paths, each run of its own.
+
+        Returns:
+            list of application.Outcome
+        """
+        files = dict()
+        for path in self._pending:
+            app_name, filename = self.paths[path]
+            files.setdefault(app_name, set()).add(filename)
+        self._pending = set()
+
+        # Each batch can be undone on its own
+        utils.new_run()
+
+        outcomes = []
+        for app_name in sorted(files):
+            app = ApplicationProfile(self.mackup,
+                                     files[app_name],
+                                     self.dry_run,
+                                     self.verbose,
+                                     app_name,
+                                     # Files are replaced by running apps
+                                     check_running=False)
+            app.backup()
+            outcomes.extend(app.outcomes)
+
+        if not self.dry_run:
+            from . import trash
+            self.mackup.save_store(files)
+            # Only the last runs are kept, like for the other commands
+            trash.purge(utils.get_trash().root)
+
+        for outcome in outcomes:
+            if outcome.status == OUTCOME_CONFLICT:
+                print("Leaving the conflict on {} as it is"
+                      .format(outcome.home_filepath))
+
+        return outcomes
+
+    def run(self):
+        """Back up the paths as they get replaced, until interrupted."""
+        # Stop cleanly when stopped by a service manager too
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while True:
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._inotify.close()
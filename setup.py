@@ -1,5 +1,5 @@
 """Setup file to automate the install of Mackup in the Python environment."""
-from setuptools import setup
+from setuptools import find_packages, setup
 from mackup.constants import VERSION
 
 
@@ -12,7 +12,7 @@ setup(
     description='Keep your application settings in sync (OS X/Linux)',
     keywords='configuration config dotfiles sync backup dropbox gdrive box',
     license='GPLv3',
-    packages=['mackup'],
+    packages=find_packages(exclude=['tests', 'tests.*', 'benchmarks']),
     install_requires=['docopt', 'six'],
     entry_points={
         'console_scripts': [
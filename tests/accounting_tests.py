@@ -0,0 +1,74 @@
+import os
+import subprocess
+import unittest
+
+from mackup import utils
+from mackup.accounting import SPAWN, SyscallCounter
+from mackup.application import ApplicationProfile
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestSyscallCounter(unittest.TestCase):
+
+    def setUp(self):
+        helpers.set_home(self)
+        with open(os.path.join(os.environ['HOME'], '.mackup.cfg'),
+                  'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n')
+
+        self.mackup = Mackup()
+        os.makedirs(self.mackup.mackup_folder)
+
+        self.files = set(['.apprc', '.app'])
+        for filename in self.files:
+            filepath = os.path.join(self.mackup.mackup_folder, filename)
+            open(filepath, 'w').close()
+
+    def restore(self):
+        app = ApplicationProfile(self.mackup, self.files, False, False, 'app')
+        with SyscallCounter() as counter:
+            app.restore()
+
+        return counter
+
+    def test_count(self):
+        with SyscallCounter() as counter:
+            os.stat(os.environ['HOME'])
+            os.path.islink(os.environ['HOME'])
+            subprocess.call(['true'])
+
+        assert counter.total('stat') == 1
+        assert counter.total('lstat') == 1
+        assert counter.total(SPAWN) == 1
+
+        # Nothing is counted anymore
+        os.stat(os.environ['HOME'])
+        assert counter.total('stat') == 1
+
+    def test_restore(self):
+        counter = self.restore()
+
+        assert counter.total('symlink', app='app') == len(self.files)
+        assert counter.total(SPAWN) == 0
+        assert counter.by_app()['app']['symlink'] == len(self.files)
+
+    def test_restore_already_linked(self):
+        self.restore()
+        counter = self.restore()
+
+        assert counter.total('stat') <= 2 * len(self.files)
+        assert counter.total('lstat') <= len(self.files)
+        assert counter.total('symlink') == 0
+        assert counter.total(SPAWN) == 0
+
+    def test_by_function(self):
+        filepath = os.path.join(os.environ['HOME'], '.apprc')
+        open(filepath, 'w').close()
+
+        with SyscallCounter() as counter:
+            utils.delete(filepath)
+
+        assert counter.by_function()['delete']['rename'] == 1
+        assert counter.total('rename', function='delete') == 1
@@ -9,12 +9,14 @@ from mackup.constants import (ENGINE_DROPBOX,
                               ENGINE_FS)
 from mackup.config import Config, ConfigError
 
+import helpers
+
 
 class TestConfig(unittest.TestCase):
 
     def setUp(self):
         realpath = os.path.dirname(os.path.realpath(__file__))
-        os.environ['HOME'] = os.path.join(realpath, 'fixtures')
+        helpers.set_home(self, os.path.join(realpath, 'fixtures'))
 
     def test_config_no_config(self):
         cfg = Config()
@@ -35,6 +37,7 @@ class TestConfig(unittest.TestCase):
 
         assert cfg.apps_to_ignore == set()
         assert cfg.apps_to_sync == set()
+        assert cfg.conflict_policies == {}
 
     def test_config_empty(self):
         cfg = Config('mackup-empty.cfg')
@@ -261,5 +264,24 @@ class TestConfig(unittest.TestCase):
                                         'x11',
                                         'vim'])
 
+    def test_config_conflict_policy(self):
+        cfg = Config('mackup-conflict_policy.cfg')
+
+        assert cfg.conflict_policies == {'default': 'keep-backup',
+                                         'ssh': 'keep-home',
+                                         '.config/*.json': 'newer-wins'}
+
+    def test_config_conflict_policy_unknown(self):
+        with self.assertRaises(ConfigError):
+            Config('mackup-conflict_policy-unknown.cfg')
+
+    def test_config_excluded_files(self):
+        cfg = Config('mackup-excluded_files.cfg')
+
+        assert cfg.excluded_files == set(['*.pyc',
+                                          'node_modules',
+                                          '.vim/pack/*/cache'])
+        assert Config('mackup-empty.cfg').excluded_files == set()
+
     def test_config_old_config(self):
-        self.assertRaises(SystemExit, Config, 'mackup-old-config.cfg')
+        self.assertRaises(ConfigError, Config, 'mackup-old-config.cfg')
@@ -0,0 +1,151 @@
+import base64
+import os
+import sqlite3
+import sys
+import unittest
+
+from mackup import engines
+from mackup.application import ApplicationProfile
+from mackup.config import Config, ConfigError
+from mackup.constants import ENGINE_DROPBOX, ENGINE_FS, ENGINE_ICLOUD
+from mackup.errors import StorageNotFoundError
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestEngines(unittest.TestCase):
+
+    def setUp(self):
+        helpers.set_home(self)
+
+    def tearDown(self):
+        engines._modules.pop('custom', None)
+        engines._paths.clear()
+
+    def test_get_engine(self):
+        assert ENGINE_DROPBOX in engines.get_names()
+        assert engines.get_names() == sorted(engines.get_names())
+
+        for name in engines.get_names():
+            engine = engines.get_engine(name)
+            assert callable(engine.get_path)
+            assert isinstance(engine.CAPABILITIES, frozenset)
+
+    def test_engines_are_imported_lazily(self):
+        for name in list(sys.modules):
+            if name.startswith('mackup.engines.'):
+                del sys.modules[name]
+
+        engines.get_engine(ENGINE_FS)
+
+        assert 'mackup.engines.file_system' in sys.modules
+        assert 'mackup.engines.dropbox' not in sys.modules
+
+    def test_register(self):
+        engines.register('custom', 'mackup.engines.file_system')
+
+        assert 'custom' in engines.get_names()
+        assert (engines.get_engine('custom') is
+                engines.get_engine(ENGINE_FS))
+
+    def test_failed_backup_location(self):
+        """
+        Tests for the error that should occur if the backup folder cannot be
+        found for Dropbox, Google, Box, Copy and iCloud
+        """
+        for name in ['box', 'copy', 'dropbox', 'google_drive', 'icloud']:
+            self.assertRaises(StorageNotFoundError,
+                              engines.get_engine(name).get_path, None)
+
+    def test_cached_path(self):
+        host_db = os.path.join(os.environ['HOME'], '.dropbox', 'host.db')
+        os.makedirs(os.path.dirname(host_db))
+
+        def write_host_db(path, mtime):
+            with open(host_db, 'w') as f_hostdb:
+                f_hostdb.write('hash\n{}\n'.format(
+                    base64.b64encode(path.encode()).decode()))
+            os.utime(host_db, (mtime, mtime))
+
+        dropbox = engines.get_engine(ENGINE_DROPBOX)
+        write_host_db('/first', 1000)
+        assert dropbox.get_path(None) == '/first'
+
+        # Not read again until it changes
+        write_host_db('/second', 1000)
+        assert dropbox.get_path(None) == '/first'
+        write_host_db('/second', 2000)
+        assert dropbox.get_path(None) == '/second'
+
+    def test_connect_read_only(self):
+        gdrive_db = os.path.join(os.environ['HOME'], 'Library',
+                                 'Application Support', 'Google', 'Drive',
+                                 'sync_config.db')
+        os.makedirs(os.path.dirname(gdrive_db))
+        client = sqlite3.connect(gdrive_db)
+        client.execute('CREATE TABLE data (entry_key, data_value)')
+        client.execute("INSERT INTO data VALUES ('local_sync_root_path', "
+                       "'/drive')")
+        client.commit()
+
+        # The sync client holding a lock does not block Mackup
+        client.execute('BEGIN EXCLUSIVE')
+        try:
+            assert (engines.get_engine('google_drive').get_path(None) ==
+                    '/drive')
+        finally:
+            client.rollback()
+            client.close()
+
+    def test_missing_path(self):
+        with open(os.path.join(os.environ['HOME'], '.mackup.cfg'),
+                  'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\n')
+
+        self.assertRaises(ConfigError, Config)
+
+    def test_capabilities(self):
+        home = os.environ['HOME']
+        icloud = os.path.join(home, 'Library', 'Mobile Documents',
+                              'com~apple~CloudDocs')
+        os.makedirs(icloud)
+        with open(os.path.join(home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = icloud\n')
+
+        mackup = Mackup()
+
+        assert mackup.capabilities == engines.get_engine(
+            ENGINE_ICLOUD).CAPABILITIES
+        # Reading the files of iCloud might download them
+        assert mackup.conflict_policy.quick
+
+        with open(os.path.join(home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = store\n')
+
+        mackup = Mackup()
+
+        assert engines.CAP_REFLINK in mackup.capabilities
+        assert engines.CAP_SAME_DEVICE not in mackup.capabilities
+        assert not mackup.conflict_policy.quick
+
+        # The identical files are found by their content with the default
+        # engine, and the clients can keep their folder on any device
+        for name in ['box', 'copy', ENGINE_DROPBOX, 'google_drive']:
+            capabilities = engines.get_engine(name).CAPABILITIES
+            assert engines.CAP_SAME_DEVICE not in capabilities
+            assert engines.CAP_LAZILY_HYDRATED not in capabilities
+
+        # Backups are copied on the same device here
+        with open(os.path.join(home, '.bashrc'), 'w') as f_bashrc:
+            f_bashrc.write('bash')
+        app = ApplicationProfile(mackup, set(['.bashrc']), False, False,
+                                 'bash', quiet=True)
+        home_filepath, mackup_filepath = app.getFilepaths('.bashrc')
+        assert app._is_same_device(home_filepath, mackup_filepath)
+
+        app.copy('.bashrc', home_filepath, mackup_filepath)
+
+        assert os.listdir(mackup.mackup_folder) == ['.bashrc']
+        with open(mackup_filepath) as f_backup:
+            assert f_backup.read() == 'bash'
@@ -0,0 +1,104 @@
+import os
+import unittest
+
+from mackup import estimate
+from mackup import utils
+from mackup.application import ApplicationProfile
+from mackup.errors import InsufficientSpaceError
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestEstimate(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n'
+                        '[excluded_files]\n*.swp\n')
+        os.makedirs(os.path.join(self.home, 'storage'))
+        os.makedirs(os.path.join(self.home, '.app', 'sub'))
+        for filename, size in [('.apprc', 10),
+                               ('.app/settings', 100),
+                               ('.app/sub/more', 1000),
+                               ('.app/settings.swp', 10000)]:
+            with open(os.path.join(self.home, filename), 'w') as f_app:
+                f_app.write('x' * size)
+
+        self.mckp = Mackup()
+        self.app = ApplicationProfile(self.mckp,
+                                      set(['.apprc', '.app', '.missing']),
+                                      False, False, 'app')
+
+        # Mackup refuses to run as root, which the tests might be
+        helpers.run_as_user(self)
+        self.get_free_space = estimate.get_free_space
+
+    def tearDown(self):
+        estimate.get_free_space = self.get_free_space
+
+    def test_estimate_backup(self):
+        run_estimate = self.mckp.get_estimate('backup', [self.app])
+
+        assert run_estimate.apps == [estimate.AppEstimate(
+            'app', 3, 1110, run_estimate.allocated)]
+        assert run_estimate.allocated >= 1110
+        assert run_estimate.duration > 0
+        assert run_estimate.has_enough_space()
+        assert 'Total' in run_estimate.to_table()
+
+        # Nothing to copy once backed up
+        self.app.backup()
+        run_estimate = self.mckp.get_estimate('backup', [self.app])
+        assert run_estimate.apps == []
+        assert run_estimate.duration is None
+
+    def test_estimate_backup_out_of_storage(self):
+        folders = []
+        measure_throughput = estimate.measure_throughput
+        get_unsynced_folder = utils.get_unsynced_folder
+
+        def recording_measure_throughput(folder):
+            folders.append(folder)
+            return measure_throughput(folder)
+
+        estimate.measure_throughput = recording_measure_throughput
+        try:
+            run_estimate = self.mckp.get_estimate('backup', [self.app])
+            assert run_estimate.duration > 0
+            # Next to the storage folder, the sync client never sees it
+            assert folders == [self.home]
+
+            # Not measured at all without such a folder
+            utils.get_unsynced_folder = lambda folder: None
+            run_estimate = self.mckp.get_estimate('backup', [self.app])
+            assert run_estimate.duration is None
+            assert folders == [self.home]
+        finally:
+            estimate.measure_throughput = measure_throughput
+            utils.get_unsynced_folder = get_unsynced_folder
+
+    def test_estimate_uninstall(self):
+        self.app.backup()
+
+        run_estimate = self.mckp.get_estimate('uninstall', [self.app],
+                                              measure=False)
+        assert run_estimate.target == self.home
+        assert run_estimate.files == 3
+
+    def test_check_free_space(self):
+        estimate.get_free_space = lambda folder: (4096, 0)
+
+        self.assertRaises(InsufficientSpaceError,
+                          self.mckp.check_free_space, 'backup', [self.app])
+        self.mckp.check_free_space('restore', [self.app])
+
+        # Nothing has been touched
+        self.assertRaises(InsufficientSpaceError, self.mckp.run, 'backup')
+        assert not os.path.islink(os.path.join(self.home, '.mackup.cfg'))
+
+    def test_format_size(self):
+        assert estimate.format_size(10) == '10 B'
+        assert estimate.format_size(1536) == '1.5 KiB'
+        assert estimate.format_size(3 * 1024 ** 3) == '3.0 GiB'
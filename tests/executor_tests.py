@@ -0,0 +1,67 @@
+import os
+import stat
+import tempfile
+import unittest
+
+from mackup import executor
+
+
+class TestExecutor(unittest.TestCase):
+
+    dir_fd_supported = executor.DIR_FD_SUPPORTED
+
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.dst = tempfile.mkdtemp()
+        for name in ['a', 'b']:
+            open(os.path.join(self.src, name), 'w').close()
+            os.chmod(os.path.join(self.src, name), stat.S_IRUSR)
+
+    def tearDown(self):
+        executor.DIR_FD_SUPPORTED = self.dir_fd_supported
+
+    def run_batch(self):
+        batch = executor.Executor()
+        for name in ['a', 'b']:
+            target = os.path.join(self.src, name)
+            batch.chmod(target)
+            batch.symlink(target, os.path.join(self.dst, 'sub', name))
+            batch.symlink(target, os.path.join(self.dst, name))
+
+        # Nothing happens before the run
+        assert not os.path.exists(os.path.join(self.dst, 'sub'))
+        batch.run()
+
+        for name in ['a', 'b']:
+            target = os.path.join(self.src, name)
+            assert oct(os.stat(target).st_mode)[-3:] == '600'
+            assert os.readlink(os.path.join(self.dst, name)) == target
+            assert os.readlink(os.path.join(self.dst, 'sub', name)) == target
+
+    def test_run(self):
+        self.run_batch()
+
+    def test_run_without_dir_fd(self):
+        executor.DIR_FD_SUPPORTED = False
+        self.run_batch()
+
+    def test_makedirs_forget(self):
+        batch = executor.Executor()
+        folder = os.path.join(self.dst, 'some', 'folder')
+        batch.makedirs(folder)
+        assert os.path.isdir(folder)
+
+        # Known folders are not checked again
+        os.rmdir(folder)
+        batch.makedirs(folder)
+        assert not os.path.exists(folder)
+
+        batch.forget(os.path.join(self.dst, 'some'))
+        batch.makedirs(folder)
+        assert os.path.isdir(folder)
+
+    def test_unlink(self):
+        batch = executor.Executor()
+        batch.unlink(os.path.join(self.src, 'a'))
+        batch.run()
+        assert os.listdir(self.src) == ['b']
@@ -0,0 +1,72 @@
+"""Helpers shared by the tests."""
+import os
+import shutil
+import tempfile
+
+from mackup import utils
+
+
+def set_home(test, home=None):
+    """
+    Point HOME to another folder until the end of a test.
+
+    The trash and the executor of utils, which depend on the home, are reset
+    at the start and at the end of the test.
+
+    Args:
+        test (unittest.TestCase)
+        home (str): Folder to use, a new temporary folder removed at the end
+                    of the test by default
+
+    Returns:
+        str: The home
+    """
+    if home is None:
+        home = tempfile.mkdtemp()
+        test.addCleanup(shutil.rmtree, home, True)
+
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = home
+    reset_utils()
+
+    def restore():
+        if old_home is None:
+            os.environ.pop('HOME', None)
+        else:
+            os.environ['HOME'] = old_home
+        reset_utils()
+
+    # Cleanups run last in, first out, the folder is removed afterwards
+    test.addCleanup(restore)
+
+    return home
+
+
+def reset_utils():
+    """Forget the trash and the executor of utils, made for another home."""
+    utils._trash = None
+    utils._executor = None
+
+
+def run_as_user(test, uid=1000):
+    """
+    Make os.geteuid() return a user id until the end of a test.
+
+    Mackup refuses to run as root, which the tests might be.
+
+    Args:
+        test (unittest.TestCase)
+        uid (int)
+
+    Returns:
+        function: The original os.geteuid
+    """
+    geteuid = os.geteuid
+
+    def restore():
+        os.geteuid = geteuid
+
+    os.geteuid = lambda: uid
+    test.addCleanup(restore)
+
+    return geteuid
@@ -0,0 +1,319 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mackup.constants import (OUTCOME_APP_RUNNING,
+                              OUTCOME_BACKED_UP,
+                              OUTCOME_CONFLICT,
+                              OUTCOME_MISSING,
+                              OUTCOME_RESTORED,
+                              OUTCOME_SKIPPED,
+                              OUTCOME_UP_TO_DATE)
+from mackup.errors import (MackupError,
+                           StorageNotFoundError,
+                           UnknownApplicationError,
+                           UnusableEnvironmentError)
+from mackup.application import ApplicationProfile
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestMackupRun(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n')
+        os.makedirs(os.path.join(self.home, 'storage'))
+        with open(os.path.join(self.home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[user]\n')
+
+        # Mackup refuses to run as root, which the tests might be
+        self.geteuid = helpers.run_as_user(self)
+
+    def test_backup(self):
+        result = Mackup().run('backup', ['git'])
+
+        gitconfig = os.path.join(self.home, '.gitconfig')
+        assert os.path.islink(gitconfig)
+        assert result.mode == 'backup'
+        assert [outcome.filename for outcome
+                in result.get_outcomes(OUTCOME_BACKED_UP)] == ['.gitconfig']
+        assert result.get_outcomes(OUTCOME_MISSING, 'git')
+
+        # Nothing left to do on the next run
+        result = Mackup().run('backup', ['git'])
+        assert not result.get_outcomes(OUTCOME_BACKED_UP)
+        assert result.get_outcomes(OUTCOME_UP_TO_DATE)
+
+    def write_excluding_app(self):
+        os.makedirs(os.path.join(self.home, '.mackup'))
+        with open(os.path.join(self.home, '.mackup', 'app.cfg'),
+                  'w') as f_cfg:
+            f_cfg.write('[application]\nname = App\n'
+                        '[configuration_files]\n.app\n'
+                        '[excluded_files]\ncache\n')
+        with open(os.path.join(self.home, '.mackup.cfg'), 'a') as f_cfg:
+            f_cfg.write('[excluded_files]\n*.swp\n')
+        os.makedirs(os.path.join(self.home, '.app', 'cache'))
+        for filename in ['settings', 'settings.swp', 'cache/data']:
+            with open(os.path.join(self.home, '.app', filename),
+                      'w') as f_app:
+                f_app.write(filename)
+
+    def test_backup_excluded_files(self):
+        self.write_excluding_app()
+
+        Mackup().run('backup', ['app'])
+
+        # Kept in the home, out of the storage
+        backup = os.path.join(self.home, 'storage', 'Mackup', '.app')
+        app = os.path.join(self.home, '.app')
+        assert os.listdir(backup) == ['settings']
+        assert not os.path.islink(app)
+        assert os.path.islink(os.path.join(app, 'settings'))
+        assert not os.path.islink(os.path.join(app, 'settings.swp'))
+        with open(os.path.join(app, 'cache', 'data')) as f_app:
+            assert f_app.read() == 'cache/data'
+
+        result = Mackup().run('backup', ['app'])
+        assert result.get_outcomes(OUTCOME_UP_TO_DATE)
+
+        # Created since, backed up without any conflict
+        with open(os.path.join(app, 'new'), 'w') as f_app:
+            f_app.write('new')
+        result = Mackup().run('backup', ['app'])
+        assert result.get_outcomes(OUTCOME_BACKED_UP)
+        assert not result.get_outcomes(OUTCOME_CONFLICT)
+        assert sorted(os.listdir(backup)) == ['new', 'settings']
+        assert os.path.islink(os.path.join(app, 'new'))
+
+        Mackup().run('uninstall', ['app'])
+        assert not os.path.islink(os.path.join(app, 'settings'))
+        assert sorted(os.listdir(app)) == ['cache', 'new', 'settings',
+                                           'settings.swp']
+
+    def test_restore_excluded_files(self):
+        self.write_excluding_app()
+        # The backup of another computer, holding excluded files too
+        backup = os.path.join(self.home, 'storage', 'Mackup', '.app')
+        os.makedirs(os.path.join(backup, 'cache'))
+        for filename in ['settings', 'settings.swp', 'cache/data']:
+            with open(os.path.join(backup, filename), 'w') as f_app:
+                f_app.write('backup ' + filename)
+
+        for options in [{'conflicts': 'keep-backup'}, {}]:
+            result = Mackup().run('restore', ['app'], options)
+
+            app = os.path.join(self.home, '.app')
+            assert (result.get_outcomes(OUTCOME_RESTORED) or
+                    result.get_outcomes(OUTCOME_UP_TO_DATE))
+            assert not os.path.islink(app)
+            with open(os.path.join(app, 'settings')) as f_app:
+                assert f_app.read() == 'backup settings'
+            for filename in ['settings.swp', 'cache/data']:
+                assert not os.path.islink(os.path.join(app, filename))
+                with open(os.path.join(app, filename)) as f_app:
+                    assert f_app.read() == filename
+
+    def test_backup_app_running(self):
+        with open('/proc/self/comm') as f_comm:
+            comm = f_comm.read().strip()
+        os.makedirs(os.path.join(self.home, '.mackup'))
+        with open(os.path.join(self.home, '.mackup', 'app.cfg'),
+                  'w') as f_cfg:
+            f_cfg.write('[application]\nname = App\n'
+                        '[configuration_files]\n.apprc\n'
+                        '[processes]\n{}\n'.format(comm))
+        with open(os.path.join(self.home, '.apprc'), 'w') as f_app:
+            f_app.write('app')
+
+        result = Mackup().run('backup', ['app', 'git'])
+
+        assert [outcome.filename for outcome
+                in result.get_outcomes(OUTCOME_APP_RUNNING)] == ['.apprc']
+        assert not os.path.islink(os.path.join(self.home, '.apprc'))
+        assert os.path.islink(os.path.join(self.home, '.gitconfig'))
+
+    def test_backup_many_apps(self):
+        files = ['.bashrc', '.tigrc', '.zshrc', '.ssh/config']
+        os.makedirs(os.path.join(self.home, '.ssh'))
+        for filename in files:
+            with open(os.path.join(self.home, filename), 'w') as f_app:
+                f_app.write(filename)
+
+        result = Mackup().run('backup', ['bash', 'git', 'ssh', 'tig', 'zsh',
+                                         'mackup'])
+
+        # Run together, but recorded in the order of the scheduler
+        assert [outcome.app_name for outcome in result.get_outcomes(
+            OUTCOME_BACKED_UP)] == ['mackup', 'bash', 'git', 'ssh', 'zsh',
+                                    'tig']
+        for filename in files + ['.gitconfig', '.mackup.cfg']:
+            assert os.path.islink(os.path.join(self.home, filename))
+
+    def test_get_scheduler(self):
+        mckp = Mackup()
+
+        app_scheduler = mckp.get_scheduler(['tig', 'vim', 'git', 'mackup'],
+                                           'restore')
+        assert app_scheduler.get_order() == ['mackup', 'git', 'tig', 'vim']
+
+        app_scheduler = mckp.get_scheduler(['tig', 'vim', 'git', 'mackup'],
+                                           'uninstall')
+        assert app_scheduler.get_order() == ['tig', 'vim', 'git', 'mackup']
+
+    def test_sweep(self):
+        mckp = Mackup()
+        mckp.run('backup', ['git'])
+        assert mckp.get_recorded() == set(['.gitconfig'])
+
+        # Backed up by this computer, and by another one
+        mackup_folder = os.path.join(self.home, 'storage', 'Mackup')
+        for filename in ['.no-app', '.other-app']:
+            with open(os.path.join(mackup_folder, filename), 'w'):
+                pass
+        with open(os.path.join(self.home, '.mackup-record'), 'a') as f_record:
+            f_record.write('.no-app\n')
+        os.symlink(os.path.join(mackup_folder, '.bashrc'),
+                   os.path.join(self.home, '.bashrc'))
+
+        expected = ([os.path.join(self.home, '.bashrc')],
+                    [os.path.join(mackup_folder, '.no-app')])
+        assert mckp.sweep(dry_run=True) == expected
+        assert os.path.exists(os.path.join(mackup_folder, '.no-app'))
+
+        assert mckp.sweep() == expected
+        assert sorted(os.listdir(mackup_folder)) == ['.gitconfig',
+                                                     '.other-app']
+        assert not os.path.lexists(os.path.join(self.home, '.bashrc'))
+        assert mckp.sweep() == ([], [])
+
+    def test_dry_run(self):
+        result = Mackup().run('backup', ['git'], {'dry_run': True})
+
+        assert result.dry_run
+        assert result.get_outcomes(OUTCOME_BACKED_UP)
+        assert not os.path.islink(os.path.join(self.home, '.gitconfig'))
+
+    def test_restore_conflicts(self):
+        mckp = Mackup()
+        mckp.run('backup', ['git'])
+        os.remove(os.path.join(self.home, '.gitconfig'))
+        with open(os.path.join(self.home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[core]\n')
+
+        # Never prompts, the conflict is left as it is
+        result = mckp.run('restore', ['git'])
+        assert result.get_outcomes(OUTCOME_CONFLICT)
+        assert not os.path.islink(os.path.join(self.home, '.gitconfig'))
+        assert mckp.interactive
+
+        result = mckp.run('restore', ['git'], {'conflicts': 'keep-home'})
+        assert result.get_outcomes(OUTCOME_SKIPPED)
+
+        result = mckp.run('restore', ['git'], {'conflicts': 'keep-backup'})
+        assert result.get_outcomes(OUTCOME_RESTORED)
+        assert os.path.islink(os.path.join(self.home, '.gitconfig'))
+        assert mckp.conflict_policy.default == 'ask'
+
+    def test_errors(self):
+        mckp = Mackup()
+
+        with self.assertRaises(StorageNotFoundError):
+            mckp.run('restore', ['git'])
+        with self.assertRaises(UnknownApplicationError):
+            mckp.run('backup', ['not-an-app'])
+        with self.assertRaises(MackupError):
+            mckp.run('backup', ['git'], {'conflicts': 'not-a-policy'})
+        with self.assertRaises(ValueError):
+            mckp.run('not-a-mode')
+
+        os.geteuid = lambda: 0
+        with self.assertRaises(UnusableEnvironmentError):
+            mckp.run('backup', ['git'])
+
+    def test_run_roots(self):
+        Mackup().run('backup', ['git'])
+        homes = [tempfile.mkdtemp() for _ in range(3)]
+        missing_home = os.path.join(self.home, 'missing')
+
+        # Root can work on the home of others
+        os.geteuid = lambda: 0
+        for processes in [1, 2]:
+            results = Mackup().run_roots('restore', homes + [missing_home],
+                                         ['git'], processes=processes)
+
+            assert list(results) == homes + [missing_home]
+            for home in homes:
+                assert results[home].get_outcomes(OUTCOME_RESTORED) or (
+                    results[home].get_outcomes(OUTCOME_UP_TO_DATE))
+                assert (os.readlink(os.path.join(home, '.gitconfig')) ==
+                        os.path.join(self.home, 'storage', 'Mackup',
+                                     '.gitconfig'))
+            assert isinstance(results[missing_home],
+                              UnusableEnvironmentError)
+            assert not os.path.exists(missing_home)
+
+    def test_run_roots_errors(self):
+        Mackup().run('backup', ['git'])
+        homes = [tempfile.mkdtemp() for _ in range(2)]
+        os.geteuid = lambda: 0
+
+        # Every home would be backed up to the same files
+        self.assertRaises(ValueError, Mackup().run_roots, 'backup', homes)
+
+        restore = ApplicationProfile.restore
+
+        def failing_restore(app):
+            if app.home == homes[0]:
+                raise OSError('restore failed')
+            restore(app)
+
+        ApplicationProfile.restore = failing_restore
+        try:
+            results = Mackup().run_roots('restore', homes, ['git'],
+                                         processes=1)
+        finally:
+            ApplicationProfile.restore = restore
+
+        assert isinstance(results[homes[0]], OSError)
+        assert results[homes[1]].get_outcomes(OUTCOME_RESTORED)
+
+    def test_run_other_home(self):
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home, True)
+        with open(os.path.join(home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[user]\n')
+        os.geteuid = lambda: 0
+
+        mckp = Mackup()
+        mckp.run('backup', ['git'], {'home': home})
+
+        # What this home backed up is recorded in it
+        assert os.path.exists(os.path.join(home, '.mackup-record'))
+        assert not os.path.exists(os.path.join(self.home, '.mackup-record'))
+        assert mckp.home == self.home
+
+    def test_run_roots_owner(self):
+        if self.geteuid() != 0:
+            self.skipTest('Only root can give files to another user')
+
+        Mackup().run('backup', ['git', 'mackup'])
+        home = tempfile.mkdtemp()
+        os.chown(home, 1234, 1234)
+        os.geteuid = self.geteuid
+
+        # Replaced by the backup, through the trash
+        with open(os.path.join(home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[core]\n')
+
+        Mackup().run_roots('restore', [home], ['git', 'mackup'],
+                           {'conflicts': 'keep-backup'})
+
+        for path in [os.path.join(home, '.gitconfig'),
+                     os.path.join(home, '.mackup.cfg'),
+                     os.path.join(home, '.mackup-trash')]:
+            assert os.lstat(path).st_uid == 1234
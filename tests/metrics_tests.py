@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import unittest
+
+from mackup import metrics
+from mackup import utils
+
+import helpers
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        helpers.set_home(self)
+        self.run = metrics.start('backup')
+
+    def tearDown(self):
+        metrics.stop()
+
+    def test_disabled(self):
+        metrics.stop()
+
+        with metrics.app('git'):
+            metrics.add('paths')
+            metrics.add_operation('copy')
+
+        assert not metrics.is_enabled()
+        assert self.run.apps == {}
+
+    def test_per_app(self):
+        with metrics.app('git'):
+            metrics.add('paths', 2)
+            metrics.add_operation('copy')
+            metrics.add_operation('copy')
+        with metrics.app('vim'):
+            metrics.add_operation('link')
+        metrics.add('prompt_wait', 1.5)
+
+        run = metrics.stop()
+
+        assert run.apps['git']['paths'] == 2
+        assert run.apps['git']['operations'] == {'copy': 2}
+        assert run.apps['vim']['operations'] == {'link': 1}
+        assert run.apps['vim']['duration'] >= 0
+        assert run.to_dict()['unattributed']['prompt_wait'] == 1.5
+        assert None not in run.to_dict()['apps']
+
+    def test_copy_counts_bytes(self):
+        src = tempfile.mkdtemp()
+        os.makedirs(os.path.join(src, 'sub'))
+        for path, size in [('a', 10), ('sub/b', 5)]:
+            with open(os.path.join(src, path), 'w') as f_src:
+                f_src.write('x' * size)
+        dst = os.path.join(tempfile.mkdtemp(), 'dst')
+
+        with metrics.app('git'):
+            utils.copy(src, dst)
+
+        assert self.run.apps['git']['bytes_copied'] == 15
+        assert self.run.apps['git']['operations'] == {'copy': 1}
+
+    def test_write_json(self):
+        with metrics.app('git'):
+            metrics.add('conflicts')
+        run = metrics.stop()
+        filepath = os.path.join(tempfile.mkdtemp(), 'metrics.json')
+
+        run.write(filepath)
+
+        content = json.load(open(filepath))
+        assert content['command'] == 'backup'
+        assert content['apps']['git']['conflicts'] == 1
+        assert os.listdir(os.path.dirname(filepath)) == ['metrics.json']
+
+    def test_write_prometheus(self):
+        with metrics.app('git'):
+            metrics.add('paths', 3)
+            metrics.add_operation('replace')
+        run = metrics.stop()
+        filepath = os.path.join(tempfile.mkdtemp(), 'mackup.prom')
+
+        run.write(filepath)
+
+        lines = open(filepath).read().splitlines()
+        assert ('mackup_app_paths_examined{app="git",command="backup"} 3'
+                in lines)
+        assert ('mackup_app_operations{app="git",command="backup",'
+                'operation="replace"} 1' in lines)
+        assert '# TYPE mackup_run_duration_seconds gauge' in lines
+
+    def test_write_prometheus_escapes_labels(self):
+        with metrics.app('my "app"\\\n'):
+            metrics.add('paths', 1)
+        run = metrics.stop()
+        filepath = os.path.join(tempfile.mkdtemp(), 'mackup.prom')
+
+        run.write(filepath)
+
+        lines = open(filepath).read().splitlines()
+        assert ('mackup_app_paths_examined{app="my \\"app\\"\\\\\\n",'
+                'command="backup"} 1' in lines)
+
+        metrics.start('a "command"')
+        run = metrics.stop()
+        run.write(filepath)
+
+        lines = open(filepath).read().splitlines()
+        for name in ['mackup_run_duration_seconds',
+                     'mackup_run_timestamp_seconds']:
+            assert any(line.startswith(name + '{command="a \\"command\\""} ')
+                       for line in lines)
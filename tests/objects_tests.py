@@ -0,0 +1,181 @@
+import os
+import tempfile
+import unittest
+
+from mackup import objects
+from mackup import utils
+from mackup.errors import CorruptStorageError
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestObjects(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.storage = tempfile.mkdtemp()
+        self.objects_folder = objects.get_objects_folder(self.storage)
+        os.makedirs(os.path.join(self.storage, 'Mackup'))
+        self.tree_path = objects.get_tree_path(
+            os.path.join(self.storage, 'Mackup'), 'app')
+
+        os.makedirs(os.path.join(self.folder, '.app', 'themes'))
+        self.write(self.folder, '.apprc', 'rc')
+        self.write(self.folder, '.app/themes/dark', 'theme')
+        self.write(self.folder, '.app/themes/copy', 'theme')
+
+    def write(self, folder, filename, content):
+        with open(os.path.join(folder, filename), 'w') as f_tmp:
+            f_tmp.write(content)
+
+    def read(self, folder, filename):
+        with open(os.path.join(folder, filename)) as f_tmp:
+            return f_tmp.read()
+
+    def count_objects(self):
+        return sum(len(files) for root, _, files
+                   in os.walk(self.objects_folder)
+                   if objects.FOLDERS_DIR not in root)
+
+    def age_objects(self):
+        for root, _, files in os.walk(self.objects_folder):
+            for filename in files:
+                os.utime(os.path.join(root, filename), (0, 0))
+
+    def save(self, tree_path=None):
+        return objects.save(tree_path or self.tree_path, self.objects_folder,
+                            self.folder, ['.apprc', '.app'])
+
+    def test_save_and_load(self):
+        # The same theme is stored once
+        assert self.save() == 2
+        assert self.count_objects() == 2
+        assert sorted(objects.read_tree(self.tree_path)) == [
+            '.app/', '.app/themes/', '.app/themes/copy', '.app/themes/dark',
+            '.apprc']
+
+        copied = objects.load(self.tree_path, self.objects_folder, self.cache)
+        assert copied == ['.app/themes/copy', '.app/themes/dark', '.apprc']
+        assert self.read(self.cache, '.app/themes/copy') == 'theme'
+
+        # Nothing to copy the second time
+        assert objects.load(self.tree_path, self.objects_folder,
+                            self.cache) == []
+
+    def test_save_only_missing_objects(self):
+        self.save()
+        assert self.save() == 0
+
+        # Another Mackup directory sharing the same objects
+        other_tree_path = os.path.join(self.storage, 'app.json')
+        assert self.save(other_tree_path) == 0
+
+        self.write(self.folder, '.apprc', 'changed')
+        assert self.save() == 1
+
+    def test_load_keeps_local_changes(self):
+        self.save()
+        objects.load(self.tree_path, self.objects_folder, self.cache)
+
+        self.write(self.cache, '.apprc', 'local')
+        os.utime(os.path.join(self.cache, '.apprc'), (2e9, 2e9))
+        assert objects.load(self.tree_path, self.objects_folder,
+                            self.cache) == []
+        assert self.read(self.cache, '.apprc') == 'local'
+
+        os.utime(os.path.join(self.cache, '.apprc'), (0, 0))
+        assert objects.load(self.tree_path, self.objects_folder,
+                            self.cache) == ['.apprc']
+        assert self.read(self.cache, '.apprc') == 'rc'
+
+    def test_load_missing_object(self):
+        self.save()
+        utils.delete(self.objects_folder)
+
+        self.assertRaises(CorruptStorageError, objects.load, self.tree_path,
+                          self.objects_folder, self.cache)
+
+    def test_collect_garbage(self):
+        mackup_folder = os.path.dirname(self.tree_path)
+        self.save()
+        self.write(self.folder, '.apprc', 'changed')
+        self.save()
+        assert self.count_objects() == 3
+
+        # Too recent to be collected
+        assert objects.collect_garbage(self.storage, mackup_folder) == []
+
+        self.age_objects()
+        assert len(objects.collect_garbage(self.storage, mackup_folder,
+                                           dry_run=True)) == 1
+        assert self.count_objects() == 3
+
+        deleted = objects.collect_garbage(self.storage, mackup_folder)
+        assert [size for _, size in deleted] == [2]
+        assert self.count_objects() == 2
+
+    def test_collect_garbage_other_folders(self):
+        mackup_folder = os.path.dirname(self.tree_path)
+        # Another Mackup directory sharing the same objects
+        other_folder = os.path.join(self.storage, 'Other', 'Mackup')
+        os.makedirs(other_folder)
+        self.save(objects.get_tree_path(other_folder, 'app'))
+        self.write(self.storage, 'notes.json', '[1, 2]')
+        self.age_objects()
+
+        assert objects.collect_garbage(self.storage, mackup_folder) == []
+
+    def test_collect_garbage_referenced_again(self):
+        mackup_folder = os.path.dirname(self.tree_path)
+        self.save()
+        self.write(self.folder, '.apprc', 'changed')
+        self.save()
+        self.age_objects()
+
+        # An old object referenced again, e.g. by a tree not synced yet
+        self.write(self.folder, '.apprc', 'rc')
+        assert self.save() == 0
+        self.write(self.folder, '.apprc', 'changed')
+        self.save()
+
+        assert objects.collect_garbage(self.storage, mackup_folder) == []
+
+    def test_not_a_tree(self):
+        self.write(self.storage, 'other.json', '{"key": "value"}')
+
+        self.assertRaises(CorruptStorageError, objects.read_tree,
+                          os.path.join(self.storage, 'other.json'))
+
+
+class TestDeduplicatedEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = deduplicated\npath = storage\n')
+        os.makedirs(os.path.join(self.home, 'storage'))
+        with open(os.path.join(self.home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[user]\n')
+
+        # Mackup refuses to run as root, which the tests might be
+        helpers.run_as_user(self)
+
+    def test_backup_and_restore(self):
+        Mackup().run('backup', ['git'])
+
+        gitconfig = os.path.join(self.home, '.gitconfig')
+        cache = os.path.join(self.home, '.mackup-cache')
+        tree_path = os.path.join(self.home, 'storage', 'Mackup', 'git.json')
+        assert os.readlink(gitconfig) == os.path.join(cache, '.gitconfig')
+        assert list(objects.read_tree(tree_path)) == ['.gitconfig']
+
+        # Another computer, with only the storage
+        os.remove(gitconfig)
+        utils.delete(cache)
+        Mackup().run('restore', ['git'])
+
+        assert os.readlink(gitconfig) == os.path.join(cache, '.gitconfig')
+        assert open(gitconfig).read() == '[user]\n'
+        assert Mackup().collect_garbage() == []
@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from mackup import packs
+from mackup import utils
+from mackup.errors import PackError
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestPacks(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        self.pack_path = os.path.join(tempfile.mkdtemp(), 'app.zip')
+
+        os.makedirs(os.path.join(self.folder, '.app', 'sub'))
+        self.write(self.folder, '.apprc', 'rc')
+        self.write(self.folder, '.app/sub/settings', 'settings')
+
+    def write(self, folder, filename, content):
+        with open(os.path.join(folder, filename), 'w') as f_tmp:
+            f_tmp.write(content)
+
+    def read(self, folder, filename):
+        with open(os.path.join(folder, filename)) as f_tmp:
+            return f_tmp.read()
+
+    def test_save_and_load(self):
+        assert packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+        assert sorted(packs.read_index(self.pack_path)) == [
+            '.app/', '.app/sub/', '.app/sub/settings', '.apprc']
+
+        extracted = packs.load(self.pack_path, self.cache)
+        assert sorted(extracted) == ['.app/sub/settings', '.apprc']
+        assert self.read(self.cache, '.app/sub/settings') == 'settings'
+
+        # Nothing to extract the second time
+        assert packs.load(self.pack_path, self.cache) == []
+
+    def test_save_only_changes(self):
+        packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+        assert not packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+
+        self.write(self.folder, '.apprc', 'changed')
+        assert packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+
+    def test_save_keeps_missing_members(self):
+        packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+        os.remove(os.path.join(self.folder, '.apprc'))
+        self.write(self.folder, '.app/new', 'new')
+
+        assert packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+        assert '.apprc' in packs.read_index(self.pack_path)
+        assert '.app/new' in packs.read_index(self.pack_path)
+
+    def test_load_keeps_local_changes(self):
+        packs.save(self.pack_path, self.folder, ['.apprc'])
+        packs.load(self.pack_path, self.cache)
+
+        # Changed after the pack was written
+        self.write(self.cache, '.apprc', 'local')
+        assert packs.load(self.pack_path, self.cache) == []
+        assert self.read(self.cache, '.apprc') == 'local'
+
+        # Changed before, e.g. an older copy
+        os.utime(os.path.join(self.cache, '.apprc'), (0, 0))
+        assert packs.load(self.pack_path, self.cache) == ['.apprc']
+        assert self.read(self.cache, '.apprc') == 'rc'
+
+    def test_load_exact_times(self):
+        apprc = os.path.join(self.folder, '.apprc')
+        os.utime(apprc, (1500000001.5, 1500000001.5))
+        packs.save(self.pack_path, self.folder, ['.apprc'])
+        packs.load(self.pack_path, self.cache)
+        assert os.path.getmtime(os.path.join(self.cache, '.apprc')) == (
+            os.path.getmtime(apprc))
+
+        # Changed locally before the file packed, within the 2 seconds of the
+        # zip times
+        self.write(self.cache, '.apprc', 'older')
+        os.utime(os.path.join(self.cache, '.apprc'), (1500000001, 1500000001))
+        assert packs.load(self.pack_path, self.cache) == ['.apprc']
+        assert self.read(self.cache, '.apprc') == 'rc'
+
+    def test_save_before_1980(self):
+        # e.g. the files of nix, dated 1970
+        for path in ['.apprc', '.app/sub/settings', '.app/sub', '.app']:
+            os.utime(os.path.join(self.folder, path), (86400, 86400))
+
+        assert packs.save(self.pack_path, self.folder, ['.apprc', '.app'])
+        assert os.listdir(os.path.dirname(self.pack_path)) == ['app.zip']
+        assert sorted(packs.read_index(self.pack_path)) == [
+            '.app/', '.app/sub/', '.app/sub/settings', '.apprc']
+
+        assert sorted(packs.load(self.pack_path, self.cache)) == [
+            '.app/sub/settings', '.apprc']
+        assert self.read(self.cache, '.app/sub/settings') == 'settings'
+        assert os.path.getmtime(os.path.join(self.cache, '.apprc')) == 86400
+
+        # Unchanged
+        assert not packs.save(self.pack_path, self.folder,
+                              ['.apprc', '.app'])
+
+    def test_save_failed(self):
+        write_member = packs._write_member
+
+        def failing_write_member(pack, path, name):
+            if name == '.apprc':
+                raise OSError('write failed')
+            write_member(pack, path, name)
+
+        packs._write_member = failing_write_member
+        try:
+            self.assertRaises(OSError, packs.save, self.pack_path,
+                              self.folder, ['.app', '.apprc'])
+        finally:
+            packs._write_member = write_member
+        assert os.listdir(os.path.dirname(self.pack_path)) == []
+
+    def test_load_without_manifest(self):
+        with zipfile.ZipFile(self.pack_path, 'w') as pack:
+            pack.write(os.path.join(self.folder, '.apprc'), '.apprc')
+
+        assert packs.load(self.pack_path, self.cache) == ['.apprc']
+        assert packs.load(self.pack_path, self.cache) == []
+
+    def test_load_stays_in_folder(self):
+        with zipfile.ZipFile(self.pack_path, 'w') as pack:
+            pack.writestr('../outside', 'content')
+
+        assert packs.load(self.pack_path, self.cache) == []
+        assert not os.path.exists(os.path.join(self.cache, '..', 'outside'))
+
+    def test_not_a_pack(self):
+        self.write(os.path.dirname(self.pack_path), 'app.zip', 'not a zip')
+
+        self.assertRaises(PackError, packs.read_index, self.pack_path)
+
+
+class TestPackedEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = packed\npath = storage\n')
+        os.makedirs(os.path.join(self.home, 'storage'))
+        with open(os.path.join(self.home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[user]\n')
+
+        # Mackup refuses to run as root, which the tests might be
+        helpers.run_as_user(self)
+
+    def test_backup_and_restore(self):
+        Mackup().run('backup', ['git'])
+
+        gitconfig = os.path.join(self.home, '.gitconfig')
+        cache = os.path.join(self.home, '.mackup-cache')
+        pack_path = os.path.join(self.home, 'storage', 'Mackup', 'git.zip')
+        assert os.readlink(gitconfig) == os.path.join(cache, '.gitconfig')
+        assert list(packs.read_index(pack_path)) == ['.gitconfig']
+
+        # Another computer, with only the storage
+        os.remove(gitconfig)
+        utils.delete(cache)
+        Mackup().run('restore', ['git'])
+
+        assert os.readlink(gitconfig) == os.path.join(cache, '.gitconfig')
+        assert open(gitconfig).read() == '[user]\n'
+
+    def test_restore_other_home(self):
+        mckp = Mackup()
+        mckp.run('backup', ['git'])
+        home = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, home, True)
+
+        # Root filling the home of another user
+        helpers.run_as_user(self, 0)
+        mckp.run('restore', ['git'], {'home': home})
+
+        cache = os.path.join(home, '.mackup-cache')
+        assert (os.readlink(os.path.join(home, '.gitconfig')) ==
+                os.path.join(cache, '.gitconfig'))
+        assert open(os.path.join(cache, '.gitconfig')).read() == '[user]\n'
+        assert mckp.mackup_folder == os.path.join(self.home, '.mackup-cache')
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from mackup import policy
+from mackup import utils
+
+
+class TestConflictPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.backup = tempfile.mkdtemp()
+
+    def make_conflict(self, filename, home_content, backup_content):
+        home_filepath = os.path.join(self.home, filename)
+        mackup_filepath = os.path.join(self.backup, filename)
+        with open(home_filepath, 'w') as f_home:
+            f_home.write(home_content)
+        with open(mackup_filepath, 'w') as f_backup:
+            f_backup.write(backup_content)
+
+        return ('app', filename, home_filepath, mackup_filepath, None)
+
+    def test_get_policy(self):
+        rules = policy.ConflictPolicy({'ssh': 'keep-home',
+                                       '*.json': 'newer-wins'},
+                                      'keep-backup')
+
+        assert rules.get_policy('ssh', '.ssh') == 'keep-home'
+        assert rules.get_policy('ssh', 'Settings.JSON') == 'newer-wins'
+        assert rules.get_policy('git', '.gitconfig') == 'keep-backup'
+
+    def test_resolve(self):
+        conflict = self.make_conflict('file', 'home', 'backup')
+
+        def resolve(rule):
+            return policy.ConflictPolicy({}, rule).resolve(*conflict)
+
+        assert resolve('keep-home') == policy.DECISION_KEEP_HOME
+        assert resolve('keep-backup') == policy.DECISION_KEEP_BACKUP
+        assert resolve('ask') == policy.DECISION_ASK
+        assert resolve('identical-skip') == policy.DECISION_ASK
+
+        os.utime(conflict[3], (0, 0))
+        assert resolve('newer-wins') == policy.DECISION_KEEP_HOME
+        os.utime(conflict[2], (0, 0))
+        os.utime(conflict[3], None)
+        assert resolve('newer-wins') == policy.DECISION_KEEP_BACKUP
+
+    def test_resolve_identical_skip(self):
+        conflict = self.make_conflict('file', 'same', 'same')
+        rules = policy.ConflictPolicy({}, 'identical-skip')
+
+        assert rules.resolve(*conflict) == policy.DECISION_SKIP
+
+    def test_resolve_identical(self):
+        conflict = self.make_conflict('file', 'same', 'same')
+
+        for rule in ['ask', 'ask-once', 'keep-home', 'newer-wins']:
+            assert (policy.ConflictPolicy({}, rule).resolve(*conflict) ==
+                    policy.DECISION_KEEP_BACKUP)
+
+    def test_resolve_same_size_and_time(self):
+        conflict = self.make_conflict('file', 'home', 'HOME')
+        os.utime(conflict[2], (0, 0))
+        os.utime(conflict[3], (0, 0))
+
+        # Never replaced without reading them
+        for quick in [False, True]:
+            rules = policy.ConflictPolicy({}, 'ask', quick)
+            assert rules.resolve(*conflict) == policy.DECISION_ASK
+
+        # Skipping them loses nothing
+        rules = policy.ConflictPolicy({}, 'identical-skip', quick=True)
+        assert rules.resolve(*conflict) == policy.DECISION_SKIP
+
+    def test_ask_once_excluded(self):
+        questions = []
+
+        def custom_input(question):
+            questions.append(question)
+            return 'yes'
+        utils.input = custom_input
+
+        # Identical but for the excluded cache, resolved without asking
+        for folder in [self.home, self.backup]:
+            os.makedirs(os.path.join(folder, 'app', 'cache'))
+            with open(os.path.join(folder, 'app', 'settings'), 'w') as f_app:
+                f_app.write('settings')
+        with open(os.path.join(self.home, 'app', 'cache', 'data'),
+                  'w') as f_cache:
+            f_cache.write('data')
+        home_filepath = os.path.join(self.home, 'app')
+        conflict = ('app', 'app', home_filepath,
+                    os.path.join(self.backup, 'app'),
+                    utils.get_excluded(['cache'], home_filepath, 'app'))
+        rules = policy.ConflictPolicy({}, 'ask-once')
+        rules.ask_once([conflict], policy.DECISION_KEEP_HOME)
+
+        assert questions == []
+        assert rules.resolve(*conflict) == policy.DECISION_KEEP_BACKUP
+
+    def test_ask_once(self):
+        questions = []
+
+        def custom_input(question):
+            questions.append(question)
+            return 'yes'
+        utils.input = custom_input
+
+        conflicts = [self.make_conflict('a', 'home', 'backup'),
+                     self.make_conflict('b', 'home', 'backup'),
+                     self.make_conflict('c', 'home', 'backup')]
+        rules = policy.ConflictPolicy({'c': 'keep-home'}, 'ask-once')
+        rules.ask_once(conflicts, policy.DECISION_KEEP_BACKUP)
+
+        assert len(questions) == 1
+        assert [rules.resolve(*conflict) for conflict in conflicts] == [
+            policy.DECISION_KEEP_BACKUP,
+            policy.DECISION_KEEP_BACKUP,
+            policy.DECISION_KEEP_HOME]
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from mackup import processes
+
+
+class TestProcesses(unittest.TestCase):
+
+    def test_read_proc(self):
+        proc = tempfile.mkdtemp()
+        for pid, comm, cmdline in [('1', 'init', b'/sbin/init\0splash'),
+                                   ('42', 'sublime_text',
+                                    b'/opt/sublime_text/sublime_text\0-w'),
+                                   ('43', 'kworker/0:1', b'')]:
+            os.makedirs(os.path.join(proc, pid))
+            with open(os.path.join(proc, pid, 'comm'), 'w') as f_comm:
+                f_comm.write(comm + '\n')
+            with open(os.path.join(proc, pid, 'cmdline'), 'wb') as f_cmd:
+                f_cmd.write(cmdline)
+        # Not a process, and a process gone meanwhile
+        os.makedirs(os.path.join(proc, 'self'))
+        os.makedirs(os.path.join(proc, '44'))
+
+        assert processes._read_proc(proc) == set(['init', 'sublime_text',
+                                                  'kworker/0:1'])
+
+    def test_running_processes(self):
+        running = processes.RunningProcesses(['code', 'very_long_proce'])
+
+        assert running.is_running('code')
+        # The names of /proc/<pid>/comm are truncated
+        assert running.is_running('very_long_process_name')
+        assert not running.is_running('sublime_text')
+        assert running.get_running(['sublime_text', 'code']) == ['code']
+
+    def test_get_process_names(self):
+        if not os.path.isdir('/proc/self'):
+            return
+
+        with open('/proc/self/comm') as f_comm:
+            comm = f_comm.read().strip()
+
+        assert comm in processes.get_process_names()
@@ -0,0 +1,82 @@
+import os
+import pstats
+import sys
+import tempfile
+import unittest
+
+from mackup import main
+from mackup import utils
+from mackup.constants import PROFILE_CPU, PROFILE_MEM
+from mackup.profiling import Profiler
+
+import helpers
+
+
+def work():
+    return [str(index) for index in range(10000)]
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.prefix = os.path.join(tempfile.mkdtemp(), 'profile')
+
+    def test_cpu(self):
+        profiler = Profiler(PROFILE_CPU)
+        profiler.start()
+        work()
+        profiler.stop()
+
+        report_path, raw_path = profiler.write(self.prefix)
+
+        assert raw_path == self.prefix + '.prof'
+        assert 'work' in open(report_path).read()
+        functions = [function for _, _, function
+                     in pstats.Stats(raw_path).stats]
+        assert 'work' in functions
+
+    def test_cpu_forced_run(self):
+        home = helpers.set_home(self)
+        helpers.run_as_user(self)
+        with open(os.path.join(home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n'
+                        '[applications_to_sync]\ngit\nbash\n')
+        os.makedirs(os.path.join(home, 'storage'))
+        for filename in ['.gitconfig', '.bashrc']:
+            with open(os.path.join(home, filename), 'w') as f_app:
+                f_app.write(filename)
+
+        # The applications would run in threads cProfile doesn't see
+        self.addCleanup(setattr, utils, 'FORCE_YES', utils.FORCE_YES)
+        argv = sys.argv
+        cwd = os.getcwd()
+        sys.argv = ['mackup', '--force', '--profile=cpu', 'backup']
+        os.chdir(home)
+        try:
+            main.main()
+        finally:
+            sys.argv = argv
+            os.chdir(cwd)
+
+        assert os.path.islink(os.path.join(home, '.gitconfig'))
+        stats = pstats.Stats(os.path.join(home, 'mackup-cpu.prof')).stats
+        backups = [stat for (_, _, function), stat in stats.items()
+                   if function == 'backup']
+        # Called once for each application
+        assert sum(stat[0] for stat in backups) >= 2
+
+    @unittest.skipIf(sys.version_info < (3, 4), "tracemalloc needs 3.4")
+    def test_mem(self):
+        import tracemalloc
+
+        profiler = Profiler(PROFILE_MEM)
+        profiler.start()
+        data = work()
+        profiler.stop()
+
+        report_path, raw_path = profiler.write(self.prefix)
+
+        assert len(data) == 10000
+        assert not tracemalloc.is_tracing()
+        assert open(report_path).read().startswith('Peak: ')
+        assert tracemalloc.Snapshot.load(raw_path).statistics('lineno')
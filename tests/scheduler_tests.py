@@ -0,0 +1,112 @@
+import threading
+import unittest
+
+from mackup import scheduler
+from mackup.errors import DependencyError
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_get_order(self):
+        dependencies = {'mackup': set(),
+                        'bash': set(['mackup']),
+                        'bash-it': set(['bash', 'unknown']),
+                        'vim': set(['mackup'])}
+        priorities = {'bash': 10}
+
+        app_scheduler = scheduler.Scheduler(dependencies, priorities)
+        assert app_scheduler.get_order() == ['mackup', 'bash', 'bash-it',
+                                             'vim']
+
+        # Without a priority, the names decide
+        app_scheduler = scheduler.Scheduler(dependencies)
+        assert app_scheduler.get_order() == ['mackup', 'bash', 'bash-it',
+                                             'vim']
+        app_scheduler = scheduler.Scheduler(dependencies, {'vim': 1})
+        assert app_scheduler.get_order() == ['mackup', 'vim', 'bash',
+                                             'bash-it']
+
+        # Each app before the ones it depends on
+        app_scheduler = scheduler.Scheduler(dependencies, priorities,
+                                            reverse=True)
+        assert app_scheduler.get_order() == ['bash-it', 'vim', 'bash',
+                                             'mackup']
+
+    def test_cycle(self):
+        self.assertRaises(DependencyError, scheduler.Scheduler,
+                          {'a': set(['b']), 'b': set(['a']), 'c': set()})
+
+    def test_run(self):
+        dependencies = {'mackup': set(),
+                        'bash': set(['mackup']),
+                        'bash-it': set(['bash']),
+                        'vim': set(['mackup'])}
+        app_scheduler = scheduler.Scheduler(dependencies)
+
+        done = []
+        lock = threading.Lock()
+        vim_started = threading.Event()
+
+        def run(app_name):
+            with lock:
+                assert dependencies[app_name] <= set(done)
+            # Independent apps run at the same time
+            if app_name == 'vim':
+                vim_started.set()
+            elif app_name == 'bash':
+                assert vim_started.wait(5)
+            with lock:
+                done.append(app_name)
+
+        app_scheduler.run(run, jobs=4)
+        assert sorted(done) == sorted(dependencies)
+
+        # One after the other, in order
+        del done[:]
+        app_scheduler.run(done.append)
+        assert done == app_scheduler.get_order()
+
+    def test_run_exclusions(self):
+        dependencies = dict((app_name, set()) for app_name in 'abcd')
+        app_scheduler = scheduler.Scheduler(
+            dependencies, exclusions={'a': set(['b']), 'b': set(['a'])})
+
+        running = set()
+        lock = threading.Lock()
+
+        def run(app_name):
+            with lock:
+                assert not (app_name in 'ab' and running & set('ab'))
+                running.add(app_name)
+            threading.Event().wait(0.05)
+            with lock:
+                running.discard(app_name)
+
+        app_scheduler.run(run, jobs=4)
+
+    def test_run_error(self):
+        dependencies = {'a': set(), 'b': set(['a']), 'c': set()}
+        app_scheduler = scheduler.Scheduler(dependencies)
+        done = []
+
+        def run(app_name):
+            if app_name == 'a':
+                raise OSError('a failed')
+            done.append(app_name)
+
+        self.assertRaises(OSError, app_scheduler.run, run, 2)
+        # Never run after what it depends on failed
+        assert 'b' not in done
+
+    def test_get_exclusions(self):
+        files = {'ssh': set(['.ssh/config']),
+                 'ssh-keys': set(['.ssh']),
+                 'git': set(['.gitconfig', '.config/git/config']),
+                 'hub': set(['.config/hub']),
+                 'tig': set(['.gitconfig'])}
+
+        assert scheduler.get_exclusions(files) == {
+            'ssh': set(['ssh-keys']),
+            'ssh-keys': set(['ssh']),
+            'git': set(['tig']),
+            'tig': set(['git'])}
@@ -0,0 +1,114 @@
+import os
+import socket
+import threading
+import time
+import unittest
+
+from mackup import server
+from mackup.errors import MackupError
+
+import helpers
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        self.write_config('git')
+        os.makedirs(os.path.join(self.home, 'storage'))
+
+        self.socket_path = os.path.join(self.home, '.mackup.sock')
+        self.server = server.MackupServer(self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        # Mackup refuses to run as root, which the tests might be
+        helpers.run_as_user(self)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def write_config(self, app_name):
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n\n'
+                        '[applications_to_sync]\n{}\n'.format(app_name))
+
+    def request(self, **req):
+        return server.request(self.socket_path, req)
+
+    def test_ping(self):
+        assert self.request(command='ping') == {'ok': True}
+        assert oct(os.stat(self.socket_path).st_mode & 0o777) == oct(0o700)
+
+    def test_list(self):
+        response = self.request(command='list')
+
+        assert response['ok']
+        assert 'git' in response['apps']
+
+    def test_backup(self):
+        with open(os.path.join(self.home, '.gitconfig'), 'w') as f_git:
+            f_git.write('[user]\n')
+
+        response = self.request(command='backup')
+
+        assert response['ok']
+        assert [outcome['filename'] for outcome in response['outcomes']
+                if outcome['status'] == 'backed-up'] == ['.gitconfig']
+        assert os.path.islink(os.path.join(self.home, '.gitconfig'))
+
+    def test_errors(self):
+        assert self.request(command='restore')['error'] == (
+            'StorageNotFoundError')
+        assert self.request(command='nope')['error'] == 'ValueError'
+
+    def test_malformed_requests(self):
+        for req in [{'command': 'restore', 'apps': 5},
+                    {'command': 'restore', 'apps': [5]},
+                    {'command': 'backup', 'options': []},
+                    {'command': 5},
+                    {}]:
+            response = server.request(self.socket_path, req)
+            assert not response['ok']
+            assert response['error'] == 'ValueError'
+        response = server.request(self.socket_path, ['ping'])
+        assert response['error'] == 'ValueError'
+
+        # Errors Mackup did not expect are answered too
+        run = self.server.get_mackup().run
+        self.server.get_mackup().run = lambda *args: {}['missing']
+        try:
+            assert self.request(command='backup')['error'] == 'KeyError'
+        finally:
+            self.server.get_mackup().run = run
+        assert self.request(command='ping')['ok']
+
+    def test_reload_on_change(self):
+        mckp = self.server.get_mackup()
+        assert self.server.get_mackup() is mckp
+
+        # Make sure the mtime changes, even on coarse filesystems
+        time.sleep(0.01)
+        self.write_config('vim')
+        config_path = os.path.join(self.home, '.mackup.cfg')
+        mtime = os.stat(config_path).st_mtime + 1
+        os.utime(config_path, (mtime, mtime))
+
+        assert self.server.get_mackup() is not mckp
+
+    def test_socket_in_use(self):
+        with self.assertRaises(MackupError):
+            server.MackupServer(self.socket_path)
+
+    def test_stale_socket(self):
+        stale_path = os.path.join(self.home, 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(stale_path)
+        stale.close()
+
+        stale_server = server.MackupServer(stale_path)
+        stale_server.server_close()
+
+        assert not os.path.exists(stale_path)
@@ -0,0 +1,148 @@
+import os
+import unittest
+
+from mackup import staging
+from mackup import utils
+from mackup.application import ApplicationProfile
+from mackup.config import Config, ConfigError
+from mackup.constants import MACKUP_STAGING_DIR, OUTCOME_BACKED_UP
+from mackup.mackup import Mackup
+
+import helpers
+
+
+class TestStaging(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        self.storage = os.path.join(self.home, 'storage')
+        self.mackup_folder = os.path.join(self.storage, 'Mackup')
+        os.makedirs(self.storage)
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n'
+                        'staging = true\n')
+        for filename in ['.gitconfig', '.bashrc']:
+            with open(os.path.join(self.home, filename), 'w') as f_app:
+                f_app.write(filename)
+
+        # Mackup refuses to run as root, which the tests might be
+        helpers.run_as_user(self)
+
+    def get_staging_folders(self):
+        return [name for name in os.listdir(self.home) + os.listdir(
+            self.storage) if name.startswith(MACKUP_STAGING_DIR)]
+
+    def test_get_staging_folder(self):
+        # Out of the storage, which the sync client would upload
+        folder = staging.get_staging_folder(self.storage)
+        assert os.path.dirname(folder) == self.home
+        assert os.path.basename(folder).startswith(MACKUP_STAGING_DIR)
+
+        os.chmod(self.home, 0o500)
+        try:
+            if not os.access(self.home, os.W_OK):
+                folder = staging.get_staging_folder(self.storage)
+                assert os.path.dirname(folder) == self.storage
+        finally:
+            os.chmod(self.home, 0o700)
+
+    def test_commit(self):
+        mckp = Mackup()
+        mckp.start_staging()
+        assert mckp.staging is not None
+
+        os.makedirs(self.mackup_folder)
+        with open(os.path.join(self.mackup_folder, '.gitconfig'),
+                  'w') as f_backup:
+            f_backup.write('old')
+
+        for app_name, filename in [('git', '.gitconfig'),
+                                   ('bash', '.bashrc')]:
+            app = ApplicationProfile(mckp, set([filename]), False, False,
+                                     app_name, quiet=True)
+            app._stage(filename, *app.getFilepaths(filename))
+
+        # Nothing written to the storage or the home before the commit
+        with open(os.path.join(self.mackup_folder, '.gitconfig')) as f_git:
+            assert f_git.read() == 'old'
+        assert not os.path.exists(os.path.join(self.mackup_folder,
+                                               '.bashrc'))
+        assert not os.path.islink(os.path.join(self.home, '.bashrc'))
+
+        mckp.commit_staging()
+
+        assert mckp.staging is None
+        for filename in ['.gitconfig', '.bashrc']:
+            home_filepath = os.path.join(self.home, filename)
+            assert os.path.islink(home_filepath)
+            with open(home_filepath) as f_app:
+                assert f_app.read() == filename
+        assert not self.get_staging_folders()
+
+        # The old backup can be restored with undo
+        trashed = [os.path.join(root, name)
+                   for root, _, names in os.walk(utils.get_trash().root)
+                   for name in names]
+        assert any(open(path).read() == 'old' for path in trashed
+                   if os.path.isfile(path))
+
+    def test_run(self):
+        result = Mackup().run('backup', ['git', 'bash'])
+
+        assert len(result.get_outcomes(OUTCOME_BACKED_UP)) == 2
+        assert sorted(os.listdir(self.mackup_folder)) == ['.bashrc',
+                                                          '.gitconfig']
+        assert os.path.islink(os.path.join(self.home, '.gitconfig'))
+        assert not self.get_staging_folders()
+
+    def test_run_shared_files(self):
+        # vim and janus both sync .vimrc.after, macosx and scripts a folder
+        with open(os.path.join(self.home, '.vimrc.after'), 'w') as f_vim:
+            f_vim.write('vim')
+        os.makedirs(os.path.join(self.home, 'Library', 'Scripts'))
+        with open(os.path.join(self.home, 'Library', 'Scripts', 'script'),
+                  'w') as f_script:
+            f_script.write('script')
+
+        Mackup().run('backup', ['vim', 'janus', 'macosx', 'scripts'])
+
+        for filename in ['.vimrc.after', 'Library/Scripts']:
+            assert os.path.islink(os.path.join(self.home, filename))
+        with open(os.path.join(self.mackup_folder, '.vimrc.after')) as f_vim:
+            assert f_vim.read() == 'vim'
+        assert os.listdir(os.path.join(self.mackup_folder, 'Library',
+                                       'Scripts')) == ['script']
+        assert not self.get_staging_folders()
+
+    def test_run_failed(self):
+        backup = ApplicationProfile.backup
+
+        def failing_backup(app):
+            if app.app_name == 'bash':
+                raise OSError('bash failed')
+            backup(app)
+
+        ApplicationProfile.backup = failing_backup
+        try:
+            self.assertRaises(OSError, Mackup().run, 'backup',
+                              ['git', 'bash'], {'jobs': 1})
+        finally:
+            ApplicationProfile.backup = backup
+
+        # Neither the storage nor the home changed
+        assert not os.path.exists(os.path.join(self.mackup_folder,
+                                               '.gitconfig'))
+        assert not os.path.islink(os.path.join(self.home, '.gitconfig'))
+        assert not self.get_staging_folders()
+
+    def test_config(self):
+        assert Config().staging
+
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n')
+        assert not Config().staging
+
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n'
+                        'staging = maybe\n')
+        self.assertRaises(ConfigError, Config)
@@ -0,0 +1,77 @@
+"""
+Startup time of the mackup command line.
+
+Run this file directly to get a report of the slowest imports:
+
+    python tests/startup_tests.py
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Time budget to import the command line entry point, in microseconds
+IMPORT_TIME_BUDGET_US = 40000
+
+# Modules that must not be imported until a command needs them
+LAZY_MODULES = ['base64',
+                'shutil',
+                'sqlite3',
+                'subprocess',
+                'tempfile',
+                'mackup.appsdb',
+                'mackup.application',
+                'mackup.mackup',
+                'mackup.trash']
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def get_import_times(module='mackup.main'):
+    """
+    Import a module in a new interpreter, with -X importtime.
+
+    Args:
+        module (str)
+
+    Returns:
+        dict: cumulated import time in microseconds, per module name
+    """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime',
+                                '-c', 'import {}'.format(module)],
+                               cwd=ROOT_DIR,
+                               stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+
+    import_times = {}
+    for line in stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        import_times[name.strip()] = int(cumulative_us)
+
+    return import_times
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime needs Python 3.7")
+class TestStartup(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        import_times = get_import_times()
+
+        assert 'mackup.main' in import_times
+        for module in LAZY_MODULES:
+            assert module not in import_times, module
+
+    def test_import_time_budget(self):
+        # Keep the best of a few runs, to not fail on a busy machine
+        best_us = min(get_import_times()['mackup.main'] for _ in range(3))
+
+        assert best_us < IMPORT_TIME_BUDGET_US, best_us
+
+
+if __name__ == '__main__':
+    for name, cumulative_us in sorted(get_import_times().items(),
+                                      key=lambda item: -item[1])[:20]:
+        print('{:>8} us  {}'.format(cumulative_us, name))
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from mackup import sweep
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.mackup_folder = os.path.join(self.home, 'storage', 'Mackup')
+        os.makedirs(self.mackup_folder)
+
+    def test_find_broken_links(self):
+        with open(os.path.join(self.mackup_folder, '.gitconfig'), 'w'):
+            pass
+        os.makedirs(os.path.join(self.home, '.config'))
+        links = {'.gitconfig': os.path.join(self.mackup_folder, '.gitconfig'),
+                 '.bashrc': os.path.join(self.mackup_folder, '.bashrc'),
+                 '.config/app': os.path.join('..', 'storage', 'Mackup',
+                                             '.config', 'app'),
+                 '.vimrc': os.path.join(self.home, 'elsewhere')}
+        for filename, target in links.items():
+            os.symlink(target, os.path.join(self.home, filename))
+
+        # Only the broken links to the Mackup folder
+        assert sweep.find_broken_links(
+            [self.home, os.path.join(self.home, '.config'),
+             os.path.join(self.home, 'missing')],
+            self.mackup_folder) == [os.path.join(self.home, '.bashrc'),
+                                    os.path.join(self.home, '.config/app')]
+
+    def test_find_orphans(self):
+        for filename in ['.gitconfig', '.old-app', '.config/git/config',
+                         '.config/other', '.vim/pack/plugin']:
+            path = os.path.join(self.mackup_folder, filename)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w'):
+                pass
+        os.makedirs(os.path.join(self.mackup_folder, '.config', 'empty'))
+
+        orphans = sweep.find_orphans(self.mackup_folder,
+                                     ['.gitconfig', '.config/git/config',
+                                      '.vim', '.ssh/config'])
+
+        assert orphans == [os.path.join(self.mackup_folder, filename)
+                           for filename in ['.config/empty', '.config/other',
+                                            '.old-app']]
+
+        # Only what was recorded, never a parent of a file synced
+        orphans = sweep.find_orphans(self.mackup_folder,
+                                     ['.gitconfig', '.config/git/config'],
+                                     ['.old-app', '.config', '.vim/pack',
+                                      '.config/missing'])
+
+        assert orphans == [os.path.join(self.mackup_folder, filename)
+                           for filename in ['.old-app', '.vim/pack']]
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from mackup import tracing
+
+
+class TestTracing(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.stop()
+
+    def test_disabled(self):
+        @tracing.traced('test')
+        def work(path):
+            return path
+
+        assert work('/path') == '/path'
+        assert not tracing.is_enabled()
+
+    def test_spans(self):
+        @tracing.traced('test')
+        def work(path):
+            with tracing.span('inner', 'test', dict(step=1)):
+                return path
+
+        tracer = tracing.start()
+        assert work('/path') == '/path'
+        tracing.stop()
+
+        spans = [event for event in tracer.events if event['ph'] == 'X']
+        assert [span['name'] for span in spans] == ['inner', 'work']
+        assert spans[0]['args'] == {'step': 1}
+        assert spans[1]['args'] == {'path': '/path'}
+        assert spans[1]['cat'] == 'test'
+        assert spans[0]['ts'] >= spans[1]['ts']
+        assert spans[0]['dur'] <= spans[1]['dur']
+
+    def test_thread_tracks(self):
+        tracer = tracing.start()
+
+        def work():
+            with tracing.span('work', 'test'):
+                pass
+
+        work()
+        thread = threading.Thread(target=work, name='worker')
+        thread.start()
+        thread.join()
+
+        spans = [event for event in tracer.events if event['ph'] == 'X']
+        names = dict((event['tid'], event['args']['name'])
+                     for event in tracer.events
+                     if event['name'] == 'thread_name')
+        assert len(spans) == 2
+        assert spans[0]['tid'] != spans[1]['tid']
+        assert names[spans[1]['tid']] == 'worker'
+
+    def test_write(self):
+        tracer = tracing.start()
+        with tracing.span('work', 'test'):
+            pass
+        filepath = os.path.join(tempfile.mkdtemp(), 'trace.json')
+
+        tracer.write(filepath)
+
+        trace = json.load(open(filepath))
+        assert [event['name'] for event in trace['traceEvents']
+                if event['ph'] == 'X'] == ['work']
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from mackup import trash
+
+
+class TestTrash(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.work = tempfile.mkdtemp()
+
+    def test_put_file(self):
+        filepath = os.path.join(self.work, 'file')
+        with open(filepath, 'w') as f_tmp:
+            f_tmp.write('content')
+
+        run_trash = trash.Trash(self.root, 'run')
+        trashed = run_trash.put(filepath)
+
+        assert not os.path.exists(filepath)
+        assert open(trashed).read() == 'content'
+        assert trash.get_runs(self.root) == ['run']
+        assert trash.read_manifest(run_trash.path) == [
+            {'path': filepath, 'trashed': trashed}]
+
+    def test_move_across_devices(self):
+        folder = os.path.join(self.work, 'folder')
+        os.makedirs(os.path.join(folder, 'sub'))
+        os.symlink('sub', os.path.join(folder, 'link'))
+        dst = os.path.join(self.root, 'folder')
+
+        # A device that can't match forces the copy-then-remove path
+        trash.move(folder, dst, dst_device=-1)
+
+        assert not os.path.exists(folder)
+        assert os.path.isdir(os.path.join(dst, 'sub'))
+        assert os.readlink(os.path.join(dst, 'link')) == 'sub'
+
+    def test_undo(self):
+        filepath = os.path.join(self.work, 'file')
+        with open(filepath, 'w') as f_tmp:
+            f_tmp.write('original')
+
+        # A run replacing the file with a link
+        trash.Trash(self.root, 'run1').put(filepath)
+        os.symlink(self.root, filepath)
+
+        current = trash.Trash(self.root, 'run2')
+        assert trash.undo(current) == 'run1'
+
+        assert not os.path.islink(filepath)
+        assert open(filepath).read() == 'original'
+        assert trash.get_runs(self.root) == ['run2']
+
+        # The undo can be undone
+        assert trash.undo(trash.Trash(self.root, 'run3')) == 'run2'
+        assert os.path.islink(filepath)
+
+    def test_undo_nothing(self):
+        assert trash.undo(trash.Trash(self.root, 'run')) is None
+
+    def test_purge(self):
+        for run in ['run1', 'run2', 'run3']:
+            filepath = os.path.join(self.work, run)
+            open(filepath, 'w').close()
+            trash.Trash(self.root, run).put(filepath)
+
+        trash.purge_in_background(self.root, keep=2).join()
+
+        assert trash.get_runs(self.root) == ['run2', 'run3']
@@ -7,6 +7,8 @@ import stat
 
 from mackup import utils
 
+import helpers
+
 
 def convert_to_octal(file_name):
     """
@@ -17,6 +19,10 @@ def convert_to_octal(file_name):
 
 class TestMackup(unittest.TestCase):
 
+    def setUp(self):
+        # Keep the trash of the deleted files out of the real home
+        helpers.set_home(self)
+
     def test_confirm_yes(self):
         # Override the input used in utils
         def custom_input(_):
@@ -237,6 +243,183 @@ class TestMackup(unittest.TestCase):
         # Let's clean up
         utils.delete(dstpath)
 
+    def test_replace_with_link(self):
+        # Create a tmp file to link to
+        tfile = tempfile.NamedTemporaryFile(delete=False)
+        srcfile = tfile.name
+        tfile.close()
+
+        # Create a file and a folder to replace
+        dstpath = tempfile.mkdtemp()
+        dstfile = os.path.join(dstpath, "file")
+        with open(dstfile, 'w') as f_dst:
+            f_dst.write('old content')
+        dstfolder = os.path.join(dstpath, "folder")
+        os.mkdir(dstfolder)
+
+        # Left by a killed run that had the same pid
+        os.symlink('elsewhere', os.path.join(
+            dstpath, '.file.mackup-{}'.format(os.getpid())))
+
+        utils.replace_with_link(srcfile, dstfile)
+        utils.replace_with_link(srcfile, dstfolder)
+        assert os.readlink(dstfile) == srcfile
+        assert os.readlink(dstfolder) == srcfile
+
+        # No temporary link left behind
+        assert sorted(os.listdir(dstpath)) == ['file', 'folder']
+
+        # The old content is in the trash
+        trashed = [open(os.path.join(utils.get_trash().path, '0')).read()]
+        assert trashed == ['old content']
+        assert os.path.isdir(os.path.join(utils.get_trash().path, '1'))
+
+        # Let's clean up
+        utils.delete(srcfile)
+        utils.delete(dstpath)
+
+    def test_replace_with_link_leftovers(self):
+        import subprocess
+        import sys
+        import time
+
+        tfile = tempfile.NamedTemporaryFile(delete=False)
+        srcfile = tfile.name
+        tfile.close()
+        self.addCleanup(os.remove, srcfile)
+        dstpath = tempfile.mkdtemp()
+        self.addCleanup(utils.delete, dstpath)
+        dstfile = os.path.join(dstpath, "file")
+        with open(dstfile, 'w') as f_dst:
+            f_dst.write('old content')
+
+        # A pid no longer running
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        dead = os.path.join(dstpath, '.file.mackup-{}'.format(process.pid))
+        os.makedirs(os.path.join(dead, 'sub'))
+        # A run still running, and one older than the age limit
+        running = os.path.join(dstpath, '.file.mackup-{}'
+                               .format(os.getppid()))
+        os.symlink('elsewhere', running)
+        old = os.path.join(dstpath, '.file.mackup-1')
+        with open(old, 'w') as f_old:
+            f_old.write('old')
+        past = time.time() - utils.constants.LEFTOVER_MAX_AGE - 60
+        os.utime(old, (past, past))
+        # Not a temporary name of mackup
+        other = os.path.join(dstpath, '.file.mackup-notes')
+        with open(other, 'w') as f_other:
+            f_other.write('notes')
+
+        utils.replace_with_link(srcfile, dstfile)
+
+        assert os.readlink(dstfile) == srcfile
+        assert sorted(os.listdir(dstpath)) == sorted(
+            ['file', os.path.basename(running), os.path.basename(other)])
+
+    def test_is_identical(self):
+        # Create two identical trees
+        paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        for path in paths:
+            os.makedirs(os.path.join(path, 'sub'))
+            with open(os.path.join(path, 'sub', 'file'), 'w') as f_tmp:
+                f_tmp.write('content')
+            os.symlink('sub', os.path.join(path, 'link'))
+        assert utils.is_identical(*paths)
+
+        # Same size and modification time, different content
+        filepaths = [os.path.join(path, 'sub', 'file') for path in paths]
+        with open(filepaths[0], 'w') as f_tmp:
+            f_tmp.write('CONTENT')
+        os.utime(filepaths[0], (0, 0))
+        os.utime(filepaths[1], (0, 0))
+        assert not utils.is_identical(*paths)
+        # Without reading the contents, they can't be told apart
+        assert utils.is_identical(*paths, quick=True)
+
+        # Different content
+        os.utime(filepaths[1], None)
+        assert not utils.is_identical(*paths)
+        assert not utils.is_identical(*filepaths)
+
+        # Same content, not the same modification time
+        with open(filepaths[0], 'w') as f_tmp:
+            f_tmp.write('content')
+        assert utils.is_identical(*filepaths)
+        # Without reading the contents, they are told different
+        assert not utils.is_identical(*filepaths, quick=True)
+        assert not utils.is_identical(*paths, quick=True)
+
+        # Different links
+        os.remove(os.path.join(paths[1], 'link'))
+        os.symlink('other', os.path.join(paths[1], 'link'))
+        assert not utils.is_identical(os.path.join(paths[0], 'link'),
+                                      os.path.join(paths[1], 'link'))
+
+        # Different types
+        assert not utils.is_identical(paths[0], filepaths[0])
+
+        # Let's clean up
+        utils.delete(paths[0])
+        utils.delete(paths[1])
+
+    def test_is_excluded(self):
+        patterns = ['*.pyc', '.vim/pack/*/cache']
+
+        assert utils.is_excluded('.vim/plugin/x.pyc', patterns)
+        assert utils.is_excluded('.vim/plugin/X.PYC', patterns)
+        assert utils.is_excluded('.vim/pack/foo/cache', patterns)
+        assert not utils.is_excluded('.vim/pack/foo/bar/cache', patterns)
+        assert not utils.is_excluded('.vim/plugin/x.py', patterns)
+
+    def test_copy_dir_excluded(self):
+        src = os.path.join(tempfile.mkdtemp(), '.app')
+        os.makedirs(os.path.join(src, 'cache', 'sub'))
+        with open(os.path.join(src, 'settings'), 'w') as f_tmp:
+            f_tmp.write('content')
+        with open(os.path.join(src, 'settings.swp'), 'w') as f_tmp:
+            f_tmp.write('swap')
+        dst = os.path.join(tempfile.mkdtemp(), '.app')
+
+        excluded = utils.get_excluded(['*.swp', '.app/cache'], src, '.app')
+        utils.copy(src, dst, excluded)
+
+        assert sorted(os.listdir(dst)) == ['settings']
+        assert convert_to_octal(os.path.join(dst, 'settings')) == '600'
+
+        # The excluded files don't make a difference
+        assert utils.is_identical(src, dst, excluded)
+        assert not utils.is_identical(src, dst)
+
+    def test_copy_clone_atomic(self):
+        src = os.path.join(tempfile.mkdtemp(), '.app')
+        os.makedirs(os.path.join(src, 'sub'))
+        with open(os.path.join(src, 'sub', 'settings'), 'w') as f_tmp:
+            f_tmp.write('content')
+        dst_folder = tempfile.mkdtemp()
+        dst = os.path.join(dst_folder, '.app')
+        # Left by a killed run that had the same pid
+        os.makedirs(os.path.join(dst_folder, '..app.mackup-{}'
+                                 .format(os.getpid()), 'sub'))
+
+        # Copied anyway where the filesystem can't clone
+        utils.copy(src, dst, clone=True, atomic=True)
+        utils.copy(os.path.join(src, 'sub', 'settings'),
+                   os.path.join(dst_folder, 'settings'),
+                   clone=True, atomic=True)
+
+        # No temporary copy is left
+        assert sorted(os.listdir(dst_folder)) == ['.app', 'settings']
+        assert utils.is_identical(src, dst)
+        assert utils.is_identical(os.path.join(src, 'sub', 'settings'),
+                                  os.path.join(dst_folder, 'settings'))
+        assert convert_to_octal(os.path.join(dst_folder, 'settings')) == '600'
+
+        # Nor when the copy fails, here as dst is not empty
+        self.assertRaises(OSError, utils.copy, src, dst, atomic=True)
+        assert sorted(os.listdir(dst_folder)) == ['.app', 'settings']
+
     def test_chmod_file(self):
         # Create a tmp file
         tfile = tempfile.NamedTemporaryFile(delete=False)
@@ -277,42 +460,6 @@ class TestMackup(unittest.TestCase):
         test_string = "Hello World"
         self.assertRaises(SystemExit, utils.error, test_string)
 
-    def test_failed_backup_location(self):
-        """
-        Tests for the error that should occur if the backup folder cannot be
-        found for Dropbox, Google, Box and Copy
-        """
-        # Hack to make our home folder some temporary folder
-        temp_home = tempfile.mkdtemp()
-        utils.os.environ['HOME'] = temp_home
-
-        # Check for the missing Dropbox folder
-        assert not os.path.exists(os.path.join(temp_home, ".dropbox/host.db"))
-        self.assertRaises(SystemExit, utils.get_dropbox_folder_location)
-
-        # Check for the missing Google Drive folder
-        assert not os.path.exists(os.path.join(
-            temp_home,
-            "Library/Application Support/Google/Drive/sync_config.db"))
-        self.assertRaises(SystemExit, utils.get_google_drive_folder_location)
-
-        # Check for the missing Box folder
-        assert not os.path.exists(os.path.join(
-            temp_home,
-            "Library/Application Support/Box/Box Sync/sync_root_folder.txt"))
-        self.assertRaises(SystemExit, utils.get_box_folder_location)
-
-        # Check for the missing Copy Folder
-        assert not os.path.exists(os.path.join(
-            temp_home,
-            "Library/Application Support/Copy Agent/config.db"))
-        self.assertRaises(SystemExit, utils.get_copy_folder_location)
-
-    def test_is_process_running(self):
-        # A pgrep that has one letter and a wildcard will always return id 1
-        assert utils.is_process_running("a*")
-        assert not utils.is_process_running("some imaginary process")
-
     def test_can_file_be_synced_on_current_platform(self):
         # Any file path will do, even if it doesn't exist
         path = "some/file"
@@ -328,3 +475,8 @@ class TestMackup(unittest.TestCase):
         # Try to use the library path on Linux, which shouldn't work
         path = os.path.join(os.environ["HOME"], "Library/")
         assert not utils.can_file_be_synced_on_current_platform(path)
+
+        # In the home of another user
+        assert utils.can_file_be_synced_on_current_platform(path, "/home/a")
+        assert not utils.can_file_be_synced_on_current_platform(
+            "Library/Preferences", "/home/a")
@@ -0,0 +1,111 @@
+import os
+import platform
+import unittest
+
+from mackup import utils
+from mackup.constants import OUTCOME_BACKED_UP, POLICY_NEWER_WINS
+from mackup.mackup import Mackup
+
+import helpers
+
+
+@unittest.skipIf(platform.system() != 'Linux', "inotify is only on Linux")
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.home = helpers.set_home(self)
+        with open(os.path.join(self.home, '.mackup.cfg'), 'w') as f_cfg:
+            f_cfg.write('[storage]\nengine = file_system\npath = storage\n')
+        os.makedirs(os.path.join(self.home, 'storage', 'Mackup'))
+
+        from mackup.watcher import Watcher
+
+        self.mackup = Mackup()
+        self.mackup.interactive = False
+        self.mackup.conflict_policy.default = POLICY_NEWER_WINS
+        self.watcher = Watcher(self.mackup, ['git'], debounce_delay=0.05)
+
+    def write(self, filename, content):
+        filepath = os.path.join(self.home, filename)
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+        with open(filepath + '.tmp', 'w') as f_tmp:
+            f_tmp.write(content)
+        os.rename(filepath + '.tmp', filepath)
+
+        return filepath
+
+    def wait_for_backup(self):
+        for _ in range(20):
+            outcomes = self.watcher.poll(0.1)
+            if outcomes:
+                return outcomes
+        return []
+
+    def test_replaced_link(self):
+        gitconfig = self.write('.gitconfig', '[user]\n')
+        outcomes = self.wait_for_backup()
+
+        assert [(outcome.filename, outcome.status)
+                for outcome in outcomes] == [('.gitconfig',
+                                              OUTCOME_BACKED_UP)]
+        assert os.path.islink(gitconfig)
+        # Replacing it with the link is not backed up again
+        assert self.watcher.poll(0.3) == []
+        assert self.watcher._pending == set()
+
+        # The app replaces the link with a new file, a conflict with the
+        # backup that the newer file wins
+        self.write('.gitconfig', '[core]\n')
+        outcomes = self.wait_for_backup()
+
+        assert [outcome.status for outcome in outcomes] == [
+            OUTCOME_BACKED_UP]
+        assert os.path.islink(gitconfig)
+        assert open(gitconfig).read() == '[core]\n'
+
+    def test_missing_folder(self):
+        # .config/git does not exist yet, .config or the home is watched
+        self.write('.config/git/config', '[user]\n')
+        outcomes = self.wait_for_backup()
+
+        assert [outcome.filename for outcome in outcomes] == [
+            '.config/git/config']
+
+    def test_other_files(self):
+        self.write('.bashrc', 'alias ll="ls -l"\n')
+
+        assert self.watcher.poll(0.3) == []
+        assert self.watcher._pending == set()
+
+    def test_other_home(self):
+        import tempfile
+        from mackup.watcher import Watcher
+
+        home = tempfile.mkdtemp()
+        self.addCleanup(utils.delete, home)
+        self.mackup.set_home(home)
+        watcher = Watcher(self.mackup, ['git'])
+        self.addCleanup(watcher._inotify.close)
+
+        assert watcher.paths
+        assert all(path.startswith(home + os.sep) for path in watcher.paths)
+
+    def test_purge(self):
+        from mackup.constants import TRASH_RUNS_TO_KEEP
+        from mackup import trash
+
+        # Runs of a watch started long ago
+        trash_root = utils.get_trash().root
+        for index in range(TRASH_RUNS_TO_KEEP + 2):
+            run_path = os.path.join(trash_root,
+                                    '2000010100000{}'.format(index))
+            os.makedirs(run_path)
+            open(os.path.join(run_path, trash.MANIFEST_FILENAME), 'w').close()
+
+        self.write('.gitconfig', '[user]\n')
+        assert self.wait_for_backup()
+
+        runs = trash.get_runs(trash_root)
+        assert len(runs) == TRASH_RUNS_TO_KEEP
+        assert runs[-1] == utils.get_trash().run_id